@@ -1,7 +1,30 @@
 import os
-import json
+import argparse
 import geopandas as gpd
-from shapely.geometry import Point
+from stop_assignment import (StopIndex, NearestStopAggregator, DecayStopAggregator, DECAY_KERNELS,
+                             DEFAULT_WALK_RADIUS, read_hexbin_file)
+from demand_store import DEFAULT_STORE_DIR, create_demand_store
+from poi_demand import slice_minutes, slice_label, hexbin_filename
+
+parser = argparse.ArgumentParser(description="Przypisz demand z hexbinów POI do przystanków.")
+parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR,
+                    help="katalog macierzy demand przystanek × przedział czasu")
+parser.add_argument("--hexbin-dir", default="poi_demand_time",
+                    help="katalog z plikami hexbin_<przedział>.json")
+parser.add_argument("--step-minutes", type=int, default=60,
+                    help="długość przedziału czasu w minutach (jak w rate_demand.py)")
+parser.add_argument("--model", choices=["nearest", "decay"], default="nearest",
+                    help="nearest: cały demand hexbinu do najbliższego przystanku; "
+                         "decay: rozkład na przystanki w promieniu dojścia z wagą malejącą z odległością")
+parser.add_argument("--radius", type=float, default=DEFAULT_WALK_RADIUS,
+                    help="promień dojścia w metrach (model decay)")
+parser.add_argument("--kernel", choices=sorted(DECAY_KERNELS), default="linear",
+                    help="funkcja spadku wagi z odległością (model decay)")
+parser.add_argument("--bandwidth", type=float, default=None,
+                    help="szerokość jądra gaussian/exponential w metrach (domyślnie połowa promienia)")
+parser.add_argument("--geojson", action="store_true",
+                    help="dodatkowo zapisz pliki stops_demand_<przedział>.geojson")
+args = parser.parse_args()
 
 # Ścieżka do pliku GeoJSON z przystankami
 geojson_file = "Przystanki_Komunikacji_Miejskiej_w_Krakowie_6ab29dbb62854448803c0125c291aca3.geojson"
@@ -14,45 +37,44 @@ stops_gdf['geometry'] = stops_gdf['geometry'].apply(
     lambda geom: geom if geom.geom_type == 'Point' else geom.centroid
 )
 
-# Dodaj kolumnę do sumaryzacji demand
-stops_gdf['demand'] = 0.0
+# Indeks przestrzenny (KD-drzewo) przystanków w EPSG:3857, budowany raz
+stop_index = StopIndex.from_gdf(stops_gdf)
+
+# Katalog z plikami hexbin
+hexbin_dir = args.hexbin_dir
 
-# Ustal docelowy CRS (np. Web Mercator)
-proj_crs = "EPSG:3857"
+# Przedziały czasu - przy kroku 60 minut to pliki hexbin_hour_XX.json
+minutes = slice_minutes(args.step_minutes)
 
-# Przelicz przystanki do CRS docelowego
-stops_gdf_proj = stops_gdf.to_crs(proj_crs)
+# Macierz demand (OBJECTID × przedział) jest mapowana z dysku i wypełniana przedział po przedziale,
+# więc nawet 288 przedziałów doby nigdy nie jest w pamięci naraz
+stop_demand = create_demand_store(stops_gdf['OBJECTID'].to_numpy(), len(minutes), args.store_dir, minutes)
+if args.model == "decay":
+    # Macierz wag przystanek × hexbin liczona raz dla siatki - każdy przedział to jedno mnożenie macierz-wektor
+    aggregate = DecayStopAggregator(stop_index, args.radius, args.kernel, args.bandwidth)
+else:
+    aggregate = NearestStopAggregator(stop_index)
 
-# Katalog z plikami hexbin oraz katalog na wyjściowe pliki z demand
-hexbin_dir = "poi_demand_time"
-output_dir = "stop_demand_time"
-os.makedirs(output_dir, exist_ok=True)
+geojson_dir = "stop_demand_time"
+if args.geojson:
+    os.makedirs(geojson_dir, exist_ok=True)
 
-# Iteruj przez pliki hexbin_hour_00.json do hexbin_hour_23.json
-for hour in range(24):
-    filename = os.path.join(hexbin_dir, f"hexbin_hour_{hour:02d}.json")
+for column, minute in enumerate(minutes):
+    label = slice_label(minute, args.step_minutes)
+    filename = hexbin_filename(hexbin_dir, minute, args.step_minutes)
     if not os.path.exists(filename):
-        print(f"Plik {filename} nie istnieje, pomijam godzinę {hour:02d}.")
+        print(f"Plik {filename} nie istnieje, pomijam przedział {label}.")
         continue
-    with open(filename, 'r', encoding='utf-8') as f:
-        hex_data = json.load(f)
-    # Dla każdego hexbina znajdź najbliższy przystanek i dodaj demand
-    for cell in hex_data:
-        lon = cell.get("longitude")
-        lat = cell.get("latitude")
-        demand = cell.get("demand", 0)
-        if lon is None or lat is None:
-            continue
-        # Utwórz punkt w CRS oryginalnym i przelicz do CRS docelowego
-        cell_point = Point(lon, lat)
-        cell_point_proj = gpd.GeoSeries([cell_point], crs=stops_gdf.crs).to_crs(proj_crs).iloc[0]
-        distances = stops_gdf_proj.geometry.distance(cell_point_proj)
-        if distances.empty:
-            continue
-        nearest_index = distances.idxmin()
-        # Dodaj demand do najbliższego przystanku
-        stops_gdf.at[nearest_index, 'demand'] += demand
-    # Zapisz GeoJSON z aktualnym stanem demand do osobnego pliku
-    output_filename = os.path.join(output_dir, f"stops_demand_hour_{hour:02d}.geojson")
-    stops_gdf.to_file(output_filename, driver="GeoJSON")
-    print(f"Zapisano plik: {output_filename}")
\ No newline at end of file
+
+    # Przypisz demand hexbinów do przystanków (mapowanie liczone raz dla tej samej siatki)
+    stop_demand[:, column] = aggregate(*read_hexbin_file(filename))
+
+    # Opcjonalny eksport GeoJSON - każdy plik zawiera demand tylko z danego przedziału
+    if args.geojson:
+        stops_gdf['demand'] = stop_demand[:, column]
+        output_filename = os.path.join(geojson_dir, f"stops_demand_{label}.geojson")
+        stops_gdf.to_file(output_filename, driver="GeoJSON")
+        print(f"Zapisano plik: {output_filename}")
+
+stop_demand.flush()
+print(f"Zapisano macierz demand {stop_demand.shape[0]} × {stop_demand.shape[1]} w katalogu: {args.store_dir}")
@@ -1,101 +1,121 @@
 import networkx as nx
-import json
 import random
+import argparse
+from graph_store import TramGraphArrays, as_graph_nodes, graph_arrays_dir, load_graph
+from graph_contraction import contract_graph, expand_route
+from distance_matrix import load_distance_matrix
 
-# Load the tram graph from the GraphML file
-output_graphml_file = "krakow_tram_graph.graphml"
-print(f"Loading graph from {output_graphml_file}...")
-G = nx.read_graphml(output_graphml_file)
-print("Graph loaded successfully.")
+GRAPHML_PATH = "krakow_tram_graph.graphml"
 
 # Function to find nodes that are tram termini (pętla)
 def find_terminus_nodes(graph):
     terminus_nodes = []
     for node_id, data in graph.nodes(data=True):
-        if 'stops' in data:
-            try:
-                # 'stops' attribute was stored as a JSON string
-                stops_data = json.loads(data['stops'])
-                for stop in stops_data:
-                    if stop.get('type') == 'pętla':
-                        terminus_nodes.append(node_id)
-                        break # Found a 'pętla' stop at this node, no need to check other stops on this node
-            except json.JSONDecodeError:
-                print(f"Warning: Could not decode JSON for node {node_id}'s 'stops' attribute: {data['stops']}")
-    return list(set(terminus_nodes)) # Use set to get unique nodes
-
-# Find all terminus nodes
-terminus_nodes = find_terminus_nodes(G)
-print(f"Found {len(terminus_nodes)} terminus nodes (pętla).")
-
-if not terminus_nodes:
-    print("No terminus nodes (pętla) found in the graph. Cannot generate routes based on them.")
-else:
-    # Generate a few example tram routes between random terminus nodes
-    num_routes_to_generate = 5
-    print(f"\nGenerating {num_routes_to_generate} example tram routes:")
-
-    for i in range(num_routes_to_generate):
-        if len(terminus_nodes) < 2:
-            print("Not enough terminus nodes to generate multiple routes.")
-            break
-
-        # Pick two distinct random terminus nodes
-        start_node, end_node = random.sample(terminus_nodes, 2)
-
-        # Get stop names for the start and end nodes if available
-        start_stop_name = "Unknown"
-        end_stop_name = "Unknown"
-        if 'stops' in G.nodes[start_node]:
-            try:
-                start_stops_data = json.loads(G.nodes[start_node]['stops'])
-                for stop in start_stops_data:
-                    if stop.get('type') == 'pętla':
-                        start_stop_name = stop.get('name', 'Unknown Pętla')
-                        break
-            except json.JSONDecodeError:
-                pass
-        if 'stops' in G.nodes[end_node]:
+        for stop in data.get('stops') or []:
+            if stop.get('type') == 'pętla':
+                terminus_nodes.append(node_id)
+                break # Found a 'pętla' stop at this node, no need to check other stops on this node
+    return sorted(set(terminus_nodes)) # Unique nodes in a fixed order, so a seed picks the same ones
+
+
+def make_route_finder(G, graphml_path=GRAPHML_PATH):
+    """
+    find_route(start, end) -> (length, route on G), raising nx.NetworkXNoPath.
+    Stop-to-stop routes come from the precomputed distance matrix (rebuilt if the graph
+    changed); without the binary graph arrays the contracted graph is searched instead.
+    """
+    if TramGraphArrays.exists(graph_arrays_dir(graphml_path)):
+        distances = load_distance_matrix(graphml_path)
+        print(f"Distance matrix ready for {len(distances.stop_nodes)} stop nodes.")
+
+        def find_route(start, end):
+            if not distances.has_path(start, end):
+                raise nx.NetworkXNoPath()
+            return distances.distance(start, end), as_graph_nodes(G, distances.route(start, end))
+        return find_route
+
+    # Shortest paths are searched on the contracted graph, which keeps every stop and switch node
+    R = contract_graph(G)
+    print(f"Contracted routing graph has {R.number_of_nodes()} of {G.number_of_nodes()} nodes.")
+
+    def find_route(start, end):
+        length, route = nx.single_source_dijkstra(R, start, end, weight='length')
+        return length, expand_route(R, route)
+    return find_route
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print example tram routes between random termini.")
+    parser.add_argument("--seed", type=int, help="seed for picking the termini, so a run can be repeated")
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+
+    # Load the tram graph (binary arrays when available, GraphML otherwise); stops are parsed once here
+    print(f"Loading graph from {GRAPHML_PATH}...")
+    G = load_graph(GRAPHML_PATH)
+    print("Graph loaded successfully.")
+    find_route = make_route_finder(G)
+
+    # Find all terminus nodes
+    terminus_nodes = find_terminus_nodes(G)
+    print(f"Found {len(terminus_nodes)} terminus nodes (pętla).")
+
+    if not terminus_nodes:
+        print("No terminus nodes (pętla) found in the graph. Cannot generate routes based on them.")
+    else:
+        # Generate a few example tram routes between random terminus nodes
+        num_routes_to_generate = 5
+        print(f"\nGenerating {num_routes_to_generate} example tram routes:")
+
+        for i in range(num_routes_to_generate):
+            if len(terminus_nodes) < 2:
+                print("Not enough terminus nodes to generate multiple routes.")
+                break
+
+            # Pick two distinct random terminus nodes
+            start_node, end_node = rng.sample(terminus_nodes, 2)
+
+            # Get stop names for the start and end nodes if available
+            start_stop_name = "Unknown"
+            end_stop_name = "Unknown"
+            for stop in G.nodes[start_node].get('stops') or []:
+                if stop.get('type') == 'pętla':
+                    start_stop_name = stop.get('name', 'Unknown Pętla')
+                    break
+            for stop in G.nodes[end_node].get('stops') or []:
+                if stop.get('type') == 'pętla':
+                    end_stop_name = stop.get('name', 'Unknown Pętla')
+                    break
+
+            print(f"\n--- Example Route {i+1} ---")
+            print(f"  Starting from Pętla: '{start_stop_name}' (Node ID: {start_node})")
+            print(f"  Ending at Pętla: '{end_stop_name}' (Node ID: {end_node})")
+
             try:
-                end_stops_data = json.loads(G.nodes[end_node]['stops'])
-                for stop in end_stops_data:
-                    if stop.get('type') == 'pętla':
-                        end_stop_name = stop.get('name', 'Unknown Pętla')
-                        break
-            except json.JSONDecodeError:
-                pass
-
-        print(f"\n--- Example Route {i+1} ---")
-        print(f"  Starting from Pętla: '{start_stop_name}' (Node ID: {start_node})")
-        print(f"  Ending at Pętla: '{end_stop_name}' (Node ID: {end_node})")
-
-        try:
-            # Find the shortest path between the two terminus nodes
-            # We assume 'length' is a reliable weight for tram lines
-            route_nodes = nx.shortest_path(G, source=start_node, target=end_node, weight='length')
-            route_length = nx.shortest_path_length(G, source=start_node, target=end_node, weight='length')
-
-            print(f"  Route found with {len(route_nodes)} nodes and total length: {route_length:.2f} meters")
-            
-            # To show actual stops along the route, iterate through the route nodes
-            # and check for 'stops' attribute
-            stops_on_route = []
-            for node in route_nodes:
-                if 'stops' in G.nodes[node]:
-                    try:
-                        node_stops_data = json.loads(G.nodes[node]['stops'])
-                        for stop in node_stops_data:
-                            # You can refine this to only include specific types of stops if needed
-                            stops_on_route.append(stop.get('name', f"Stop at node {node}"))
-                    except json.JSONDecodeError:
-                        pass # Handle cases where JSON might be malformed
-
-            if stops_on_route:
-                print(f"  Key stops along this route: {', '.join(list(set(stops_on_route)))}") # Use set to avoid duplicates
-            else:
-                print("  No named stops found directly on the nodes of this route (they might be on edges, or missing 'stops' attribute).")
-
-        except nx.NetworkXNoPath:
-            print(f"  No path found between {start_stop_name} and {end_stop_name}.")
-        except Exception as e:
-            print(f"  An error occurred while finding route: {e}")
\ No newline at end of file
+                # Look up the shortest path between the two terminus nodes
+                # We assume 'length' is a reliable weight for tram lines
+                route_length, route_nodes = find_route(start_node, end_node)
+
+                print(f"  Route found with {len(route_nodes)} nodes and total length: {route_length:.2f} meters")
+
+                # To show actual stops along the route, iterate through the route nodes
+                # and check for 'stops' attribute
+                stops_on_route = []
+                for node in route_nodes:
+                    for stop in G.nodes[node].get('stops') or []:
+                        # You can refine this to only include specific types of stops if needed
+                        stops_on_route.append(stop.get('name', f"Stop at node {node}"))
+
+                if stops_on_route:
+                    print(f"  Key stops along this route: {', '.join(dict.fromkeys(stops_on_route))}") # Unique names in route order
+                else:
+                    print("  No named stops found directly on the nodes of this route (they might be on edges, or missing 'stops' attribute).")
+
+            except nx.NetworkXNoPath:
+                print(f"  No path found between {start_stop_name} and {end_stop_name}.")
+            except Exception as e:
+                print(f"  An error occurred while finding route: {e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import os
+import numpy as np
+
+DEFAULT_STORE_DIR = "stop_demand"
+DEMAND_FILE = "demand.npy"
+OBJECT_IDS_FILE = "object_ids.npy"
+MINUTES_FILE = "minutes.npy"
+POPULATION_FILE = "population.npy"
+
+
+def save_demand_store(object_ids, demand, store_dir=DEFAULT_STORE_DIR, minutes=None):
+    """
+    Save a stop × time slice demand matrix as plain .npy files so it can be memory-mapped:
+    - object_ids.npy: int64 stop OBJECTIDs, one per row
+    - demand.npy: float32 matrix, rows follow object_ids, columns are time slices
+    - minutes.npy: int64 start of every slice in minutes after midnight (hourly when omitted)
+    """
+    demand = np.asarray(demand, dtype=np.float32)
+    if demand.ndim != 2:
+        raise ValueError(f"Demand matrix must be 2-D, got shape {demand.shape}")
+    out = create_demand_store(object_ids, demand.shape[1], store_dir, minutes)
+    out[:] = demand
+    out.flush()
+    return store_dir
+
+
+def create_demand_store(object_ids, num_slices, store_dir=DEFAULT_STORE_DIR, minutes=None):
+    """
+    Create an empty store and return its demand.npy as a writable memory map, so
+    time slices can be filled in one at a time without holding the whole day in memory.
+    """
+    object_ids = np.asarray(object_ids, dtype=np.int64)
+    minutes = np.arange(num_slices) * 60 if minutes is None else np.asarray(minutes, dtype=np.int64)
+    if len(minutes) != num_slices:
+        raise ValueError(f"{len(minutes)} slice start minutes given for {num_slices} slices")
+
+    os.makedirs(store_dir, exist_ok=True)
+    np.save(os.path.join(store_dir, OBJECT_IDS_FILE), object_ids)
+    np.save(os.path.join(store_dir, MINUTES_FILE), minutes)
+    return np.lib.format.open_memmap(os.path.join(store_dir, DEMAND_FILE), mode='w+',
+                                     dtype=np.float32, shape=(len(object_ids), num_slices))
+
+
+def save_stop_population(object_ids, population, store_dir=DEFAULT_STORE_DIR):
+    """
+    Add a per-stop population column (population.npy, float32) to an existing store,
+    aligned with its object_ids; stops missing from object_ids get 0.
+    """
+    store_ids = np.load(os.path.join(store_dir, OBJECT_IDS_FILE))
+    by_id = dict(zip(np.asarray(object_ids, dtype=np.int64).tolist(), np.asarray(population).tolist()))
+    column = np.array([by_id.get(object_id, 0.0) for object_id in store_ids.tolist()], dtype=np.float32)
+    np.save(os.path.join(store_dir, POPULATION_FILE), column)
+    return store_dir
+
+
+class DemandStore:
+    """Read-only view of the stop × time slice demand matrix; geometry is never parsed."""
+
+    def __init__(self, object_ids, demand, minutes=None, population=None):
+        self.object_ids = object_ids
+        self.demand = demand
+        self.population = population
+        self.minutes = np.arange(demand.shape[1]) * 60 if minutes is None else minutes
+        self._row = {int(object_id): row for row, object_id in enumerate(object_ids)}
+        self._column = {int(minute): column for column, minute in enumerate(self.minutes)}
+        self._weights = None
+
+    @classmethod
+    def open(cls, store_dir=DEFAULT_STORE_DIR, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        object_ids = np.load(os.path.join(store_dir, OBJECT_IDS_FILE))
+        demand = np.load(os.path.join(store_dir, DEMAND_FILE), mmap_mode=mmap_mode)
+        minutes_path = os.path.join(store_dir, MINUTES_FILE)
+        minutes = np.load(minutes_path) if os.path.exists(minutes_path) else None
+        population_path = os.path.join(store_dir, POPULATION_FILE)
+        population = np.load(population_path) if os.path.exists(population_path) else None
+        return cls(object_ids, demand, minutes, population)
+
+    @staticmethod
+    def exists(store_dir=DEFAULT_STORE_DIR):
+        return (os.path.exists(os.path.join(store_dir, OBJECT_IDS_FILE)) and
+                os.path.exists(os.path.join(store_dir, DEMAND_FILE)))
+
+    @property
+    def num_slices(self):
+        return self.demand.shape[1]
+
+    @property
+    def num_hours(self):
+        return len(self.hours())
+
+    @property
+    def step_minutes(self):
+        return int(self.minutes[1] - self.minutes[0]) if len(self.minutes) > 1 else 24 * 60
+
+    def hours(self):
+        """Whole hours covered by at least one time slice."""
+        return np.flatnonzero(self._hour_weights().any(axis=0)).tolist()
+
+    def slice(self, column):
+        """Demand of every stop in the given time slice, aligned with object_ids."""
+        return np.asarray(self.demand[:, column])
+
+    def at(self, minute):
+        """Demand of every stop in the slice starting at the given minute after midnight."""
+        return self.slice(self._column[int(minute)])
+
+    def _hour_weights(self):
+        """
+        (slices × hours) share of each slice inside each hour of the day. A slice ends where
+        the next one starts (the last one step_minutes later); one straddling an hour
+        boundary, e.g. 00:45-01:30 with 45-minute steps, is split by the minutes on each side.
+        """
+        if self._weights is None:
+            starts = np.asarray(self.minutes, dtype=np.float64)
+            ends = np.append(starts[1:], starts[-1] + self.step_minutes) if len(starts) else starts
+            num_hours = int(np.ceil(ends.max() / 60)) if len(ends) else 0
+            hour_starts = np.arange(num_hours) * 60.0
+            overlap = (np.minimum(ends[:, None], hour_starts + 60) -
+                       np.maximum(starts[:, None], hour_starts)).clip(min=0)
+            self._weights = overlap / (ends - starts)[:, None]
+        return self._weights
+
+    def hour(self, hour):
+        """
+        Demand of every stop over the given hour, aligned with object_ids: the sum of the
+        slices inside [hour * 60, (hour + 1) * 60), whatever the slice length.
+        """
+        weights = self._hour_weights()
+        columns = np.flatnonzero(weights[:, hour]) if 0 <= hour < weights.shape[1] else []
+        if not len(columns):
+            raise KeyError(f"No time slice covers hour {hour}")
+        return np.asarray(self.demand[:, columns], dtype=np.float64) @ weights[columns, hour]
+
+    def hour_by_stop(self, hour):
+        """Demand in the given hour as a {OBJECTID: demand} dictionary."""
+        return dict(zip(self.object_ids.tolist(), self.hour(hour).tolist()))
+
+    def iter_slices(self):
+        """Yield (minute, stop demand vector) for every time slice in order."""
+        for column, minute in enumerate(self.minutes.tolist()):
+            yield minute, self.slice(column)
+
+    def day_by_stop(self):
+        """Demand summed over the whole day as a {OBJECTID: demand} dictionary."""
+        return dict(zip(self.object_ids.tolist(), np.asarray(self.demand).sum(axis=1).tolist()))
+
+    def population_by_stop(self):
+        """Catchment population as a {OBJECTID: residents} dictionary; empty when not computed."""
+        if self.population is None:
+            return {}
+        return dict(zip(self.object_ids.tolist(), self.population.tolist()))
+
+    def stop(self, object_id):
+        """Demand profile of a single stop over all time slices."""
+        return np.asarray(self.demand[self._row[int(object_id)]])
+
+    def profile(self):
+        """The whole stop × time slice matrix."""
+        return self.demand
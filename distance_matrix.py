@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse.csgraph import dijkstra
+from graph_store import TramGraphArrays, graph_arrays_dir
+from routing import NO_PREDECESSOR, min_weight_csr
+
+GRAPHML_PATH = "krakow_tram_graph.graphml"
+META_FILE = "meta.json"
+
+
+def distance_matrix_dir(graphml_path):
+    """Directory of the stop × stop distance matrix built for a GraphML file."""
+    return os.path.splitext(graphml_path)[0] + "_distances"
+
+
+def graph_fingerprint(graph):
+    """Hash of the graph arrays the matrix depends on; changes whenever the graph build changes."""
+    digest = hashlib.sha1()
+    for array in (graph.node_ids, graph.indptr, graph.targets, graph.edge_length, graph.stop_node):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def routing_matrix(graph):
+    """Sparse directed adjacency matrix of edge lengths; parallel edges keep their shortest length."""
+    return min_weight_csr(graph.edge_sources(), graph.targets, graph.edge_length, graph.num_nodes)
+
+
+_worker_matrix = None
+
+
+def _init_worker(store_dir):
+    global _worker_matrix
+    _worker_matrix = routing_matrix(TramGraphArrays.open(store_dir))
+
+
+def _run_sources(sources):
+    return dijkstra(_worker_matrix, directed=True, indices=sources, return_predecessors=True)
+
+
+def build_distance_matrix(graph_store_dir, out_dir, workers=None, chunk_size=16):
+    """
+    Run single-source Dijkstra from every stop node across a process pool and store:
+    - stop_nodes.npy: node positions of the stop nodes (rows/columns of the matrix)
+    - distances.npy: float64 stop × stop network distances (inf when unreachable)
+    - predecessors.npy: int32 stop × node predecessor arrays for rebuilding routes
+    Each worker memory-maps the graph arrays itself instead of receiving a pickled graph.
+    """
+    graph = TramGraphArrays.open(graph_store_dir)
+    stop_nodes = np.unique(np.asarray(graph.stop_node)).astype(np.int32)
+    os.makedirs(out_dir, exist_ok=True)
+
+    distances = np.lib.format.open_memmap(os.path.join(out_dir, "distances.npy"), mode='w+',
+                                          dtype=np.float64, shape=(len(stop_nodes), len(stop_nodes)))
+    predecessors = np.lib.format.open_memmap(os.path.join(out_dir, "predecessors.npy"), mode='w+',
+                                             dtype=np.int32, shape=(len(stop_nodes), graph.num_nodes))
+    chunks = [stop_nodes[i:i + chunk_size] for i in range(0, len(stop_nodes), chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(graph_store_dir,)) as pool:
+        row = 0
+        for dist, pred in pool.map(_run_sources, chunks):
+            distances[row:row + len(dist)] = dist[:, stop_nodes]
+            predecessors[row:row + len(pred)] = pred
+            row += len(dist)
+    distances.flush()
+    predecessors.flush()
+
+    np.save(os.path.join(out_dir, "stop_nodes.npy"), stop_nodes)
+    with open(os.path.join(out_dir, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump({"graph_fingerprint": graph_fingerprint(graph)}, f)
+    return out_dir
+
+
+class DistanceMatrix:
+    """Memory-mapped stop × stop network distances with predecessor arrays for route lookups."""
+
+    def __init__(self, graph, stop_nodes, distances, predecessors):
+        self.graph = graph
+        self.stop_nodes = stop_nodes
+        self.distances = distances
+        self.predecessors = predecessors
+        self._row = {int(node): row for row, node in enumerate(stop_nodes)}
+
+    @classmethod
+    def open(cls, graph, out_dir):
+        return cls(graph,
+                   np.load(os.path.join(out_dir, "stop_nodes.npy")),
+                   np.load(os.path.join(out_dir, "distances.npy"), mmap_mode='r'),
+                   np.load(os.path.join(out_dir, "predecessors.npy"), mmap_mode='r'))
+
+    @staticmethod
+    def is_fresh(graph, out_dir):
+        meta_path = os.path.join(out_dir, META_FILE)
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("graph_fingerprint") == graph_fingerprint(graph)
+
+    def distance(self, source, target):
+        """Network distance between two stop nodes (OSM ids), inf when unreachable."""
+        i = self._row[self.graph.node_index(source)]
+        j = self._row[self.graph.node_index(target)]
+        return float(self.distances[i, j])
+
+    def has_path(self, source, target):
+        return np.isfinite(self.distance(source, target))
+
+    def route(self, source, target):
+        """Node route (OSM ids) from a stop node to any node, rebuilt in O(path length); None if unreachable."""
+        src = self.graph.node_index(source)
+        node = self.graph.node_index(target)
+        pred = self.predecessors[self._row[src]]
+        path = [node]
+        while node != src:
+            node = int(pred[node])
+            if node == NO_PREDECESSOR:
+                return None
+            path.append(node)
+        return [int(self.graph.node_ids[i]) for i in reversed(path)]
+
+
+def load_distance_matrix(graphml_path=GRAPHML_PATH, workers=None):
+    """Open the distance matrix for a graph, rebuilding it first if the graph build has changed."""
+    store_dir = graph_arrays_dir(graphml_path)
+    graph = TramGraphArrays.open(store_dir)
+    out_dir = distance_matrix_dir(graphml_path)
+    if not DistanceMatrix.is_fresh(graph, out_dir):
+        print(f"Building stop distance matrix in {out_dir}...")
+        build_distance_matrix(store_dir, out_dir, workers)
+    return DistanceMatrix.open(graph, out_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the stop × stop network distance matrix.")
+    parser.add_argument("--graphml", default=GRAPHML_PATH, help="processed tram graph (its _arrays directory is used)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    args = parser.parse_args()
+
+    store_dir = graph_arrays_dir(args.graphml)
+    out_dir = build_distance_matrix(store_dir, distance_matrix_dir(args.graphml), args.workers)
+    matrix = DistanceMatrix.open(TramGraphArrays.open(store_dir), out_dir)
+    reachable = np.isfinite(matrix.distances).mean() * 100
+    print(f"Saved {len(matrix.stop_nodes)} × {len(matrix.stop_nodes)} stop distance matrix to {out_dir} "
+          f"({reachable:.1f}% of pairs reachable).")
+
+
+if __name__ == '__main__':
+    main()
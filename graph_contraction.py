@@ -0,0 +1,134 @@
+import networkx as nx
+from shapely.geometry import LineString
+
+
+def is_protected_node(data):
+    """Stops, termini and switches are never contracted."""
+    return bool(
+        data.get('stops') or
+        data.get('has_petla') or
+        data.get('is_railway_switch') or
+        data.get('railway') == 'switch'
+    )
+
+
+def _osmids(data):
+    osmid = data.get('osmid', [])
+    return set(osmid) if isinstance(osmid, list) else {osmid}
+
+
+def _continuations(G, node, data):
+    """
+    Map every in-edge (u, node, k) of a contractible node to the single out-edge it continues on.
+    A plain node continues to the other neighbour; a crossing node continues along the edge of
+    the same OSM way. Returns None when the node is not a clean pass-through.
+    """
+    in_edges = list(G.in_edges(node, keys=True, data=True))
+    out_edges = list(G.out_edges(node, keys=True, data=True))
+    if not in_edges or len(in_edges) != len(out_edges):
+        return None
+
+    # Two neighbours: a plain track node. More: only a crossing of separate ways can pass through.
+    is_crossing = len(set(G.predecessors(node)) | set(G.successors(node))) != 2
+    if is_crossing and 'crossing' not in str(data.get('railway', '')):
+        return None
+
+    continuations = {}
+    used = set()
+    for u, _, k_in, data_in in in_edges:
+        candidates = [(v, k_out) for _, v, k_out, data_out in out_edges
+                      if v != u and v != node and
+                      (not is_crossing or _osmids(data_in) & _osmids(data_out))]
+        if len(candidates) != 1 or candidates[0] in used:
+            return None
+        used.add(candidates[0])
+        continuations[(u, k_in)] = candidates[0]
+    return continuations
+
+
+def _edge_coords(G, u, v, data):
+    geometry = data.get('geometry')
+    if isinstance(geometry, LineString):
+        return list(geometry.coords)
+    return [(G.nodes[u]['x'], G.nodes[u]['y']), (G.nodes[v]['x'], G.nodes[v]['y'])]
+
+
+def contract_graph(G, keep=()):
+    """
+    Collapse chains of pass-through nodes (degree-2 track nodes and crossings) in one linear pass.
+    Stop nodes, switches, termini, dead ends and any node in keep are never contracted.
+
+    Each merged edge carries the summed length, a merged LineString geometry, the union of
+    the OSM way ids and 'osm_nodes' - the original node sequence - so routes found on the
+    contracted graph can be expanded with expand_route for drawing.
+    """
+    keep = set(keep)
+    through = {}
+    for node, data in G.nodes(data=True):
+        if node in keep or is_protected_node(data):
+            continue
+        continuations = _continuations(G, node, data)
+        if continuations is not None:
+            through[node] = continuations
+
+    H = nx.MultiDiGraph(**G.graph)
+    H.add_nodes_from((n, d) for n, d in G.nodes(data=True) if n not in through)
+    visited = set()
+
+    def walk_from(start):
+        for _, v, k, data in list(G.out_edges(start, keys=True, data=True)):
+            if (start, v, k) in visited:
+                continue
+            visited.add((start, v, k))
+            path = [start, v]
+            length = data.get('length', 0)
+            osmids = _osmids(data)
+            coords = _edge_coords(G, start, v, data)
+            prev, node, key = start, v, k
+            while node in through:
+                nxt, nxt_key = through[node][(prev, key)]
+                edge = G.edges[node, nxt, nxt_key]
+                visited.add((node, nxt, nxt_key))
+                length += edge.get('length', 0)
+                osmids |= _osmids(edge)
+                coords.extend(_edge_coords(G, node, nxt, edge)[1:])
+                path.append(nxt)
+                prev, node, key = node, nxt, nxt_key
+
+            if len(path) == 2:
+                H.add_edge(start, v, **data)
+                continue
+            attrs = dict(data)
+            attrs['length'] = length
+            if osmids:
+                attrs['osmid'] = sorted(osmids) if len(osmids) > 1 else next(iter(osmids))
+            attrs['geometry'] = LineString(coords)
+            attrs['osm_nodes'] = path
+            H.add_edge(start, node, **attrs)
+
+    for node in list(H.nodes):
+        walk_from(node)
+
+    # Whatever is left are closed loops made only of pass-through nodes: keep one node per loop
+    for u, v, k in G.edges(keys=True):
+        if (u, v, k) not in visited:
+            through.pop(u, None)
+            H.add_node(u, **G.nodes[u])
+            walk_from(u)
+
+    return H
+
+
+def expand_route(H, route, weight='length'):
+    """Expand a node route on a contracted graph back to the original OSM node sequence."""
+    if not route:
+        return route
+    expanded = [route[0]]
+    for u, v in zip(route[:-1], route[1:]):
+        edges = H.get_edge_data(u, v)
+        if not edges:
+            expanded.append(v)
+            continue
+        data = min(edges.values(), key=lambda d: d.get(weight, 0))
+        expanded.extend(data.get('osm_nodes', [u, v])[1:])
+    return expanded
@@ -0,0 +1,245 @@
+import os
+import re
+import json
+import numpy as np
+import networkx as nx
+
+GRAPH_ARRAY_FILES = (
+    "node_ids", "x", "y", "is_switch", "railway",
+    "indptr", "targets", "edge_keys", "edge_length",
+    "stop_node", "stop_id", "stop_name", "stop_type",
+)
+# Written by newer builds; stores without them still open
+OPTIONAL_GRAPH_ARRAY_FILES = ("edge_maxspeed",)
+MAXSPEED_PATTERN = re.compile(r"(\d+(?:\.\d+)?)\s*(mph)?$")
+
+
+def graph_arrays_dir(graphml_path):
+    """Directory of the binary graph written alongside a GraphML file."""
+    return os.path.splitext(graphml_path)[0] + "_arrays"
+
+
+def as_graph_nodes(G, nodes):
+    """
+    nodes keyed the way G keys its nodes. OSM ids stay ints in graphs built in memory
+    and in line JSON files, but are strings in graphs read back from GraphML or arrays.
+    """
+    nodes = list(nodes)
+    if not nodes or not len(G) or all(node in G for node in nodes):
+        return nodes
+    key = type(next(iter(G.nodes)))
+    return [node if node in G else key(node) for node in nodes]
+
+
+def _parse_stops(value):
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except json.JSONDecodeError:
+            return []
+    return value or []
+
+
+def parse_maxspeed(value):
+    """
+    An OSM maxspeed tag as km/h: the lowest of several values ('50;30' or a list
+    from osmnx), mph converted. None when missing or not numeric ('PL:urban').
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value) if value == value and value > 0 else None
+    values = value if isinstance(value, list) else str(value).split(';')
+    speeds = []
+    for item in values:
+        match = MAXSPEED_PATTERN.match(str(item).strip())
+        if match:
+            speed = float(match.group(1))
+            speeds.append(speed * 1.609344 if match.group(2) else speed)
+    return min(speeds) if speeds else None
+
+
+def save_graph_arrays(G, store_dir):
+    """
+    Write the processed tram graph as plain .npy arrays that can be memory-mapped:
+    - nodes: node_ids (int64), x / y (float64), is_switch (bool), railway tag
+    - edges: CSR adjacency (indptr, targets), edge_keys, edge_length and
+      edge_maxspeed (float64, km/h, NaN when untagged)
+    - stops: columnar table (stop_node, stop_id, stop_name, stop_type)
+    """
+    node_ids = list(G.nodes)
+    index = {node: i for i, node in enumerate(node_ids)}
+    node_data = [G.nodes[node] for node in node_ids]
+
+    sources, targets, keys, lengths, maxspeeds = [], [], [], [], []
+    for u, v, k, data in G.edges(keys=True, data=True):
+        sources.append(index[u])
+        targets.append(index[v])
+        keys.append(int(k))
+        lengths.append(float(data.get('length', 0.0)))
+        speed = parse_maxspeed(data.get('maxspeed'))
+        maxspeeds.append(np.nan if speed is None else speed)
+    sources = np.array(sources, dtype=np.int64)
+    order = np.argsort(sources, kind='stable')
+
+    stop_node, stop_id, stop_name, stop_type = [], [], [], []
+    for i, data in enumerate(node_data):
+        for stop in _parse_stops(data.get('stops')):
+            stop_node.append(i)
+            stop_id.append(str(stop.get('id', '')))
+            stop_name.append(str(stop.get('name', '')))
+            stop_type.append(str(stop.get('type', '')))
+
+    arrays = {
+        "node_ids": np.array([int(node) for node in node_ids], dtype=np.int64),
+        "x": np.array([float(d.get('x', np.nan)) for d in node_data], dtype=np.float64),
+        "y": np.array([float(d.get('y', np.nan)) for d in node_data], dtype=np.float64),
+        "is_switch": np.array([bool(d.get('is_railway_switch', False)) for d in node_data], dtype=bool),
+        "railway": np.array([str(d.get('railway', '')) for d in node_data], dtype=np.str_),
+        "indptr": np.concatenate([[0], np.cumsum(np.bincount(sources, minlength=len(node_ids)))]).astype(np.int64),
+        "targets": np.array(targets, dtype=np.int32)[order],
+        "edge_keys": np.array(keys, dtype=np.int32)[order],
+        "edge_length": np.array(lengths, dtype=np.float64)[order],
+        "edge_maxspeed": np.array(maxspeeds, dtype=np.float64)[order],
+        "stop_node": np.array(stop_node, dtype=np.int32),
+        "stop_id": np.array(stop_id, dtype=np.str_),
+        "stop_name": np.array(stop_name, dtype=np.str_),
+        "stop_type": np.array(stop_type, dtype=np.str_),
+    }
+
+    os.makedirs(store_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(store_dir, f"{name}.npy"), array)
+    return store_dir
+
+
+class TramGraphArrays:
+    """Memory-mapped tram graph: CSR adjacency, node coordinates and a columnar stop table."""
+
+    def __init__(self, arrays):
+        for name in GRAPH_ARRAY_FILES:
+            setattr(self, name, arrays[name])
+        for name in OPTIONAL_GRAPH_ARRAY_FILES:
+            setattr(self, name, arrays.get(name))
+        self._node_index = None
+
+    @classmethod
+    def open(cls, store_dir, mmap=True):
+        mmap_mode = 'r' if mmap else None
+        arrays = {name: np.load(os.path.join(store_dir, f"{name}.npy"), mmap_mode=mmap_mode)
+                  for name in GRAPH_ARRAY_FILES + OPTIONAL_GRAPH_ARRAY_FILES
+                  if name in GRAPH_ARRAY_FILES or os.path.exists(os.path.join(store_dir, f"{name}.npy"))}
+        return cls(arrays)
+
+    @staticmethod
+    def exists(store_dir):
+        return all(os.path.exists(os.path.join(store_dir, f"{name}.npy")) for name in GRAPH_ARRAY_FILES)
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def node_index(self, node_id):
+        """Position of an OSM node id in the arrays."""
+        if self._node_index is None:
+            self._node_index = {int(node): i for i, node in enumerate(self.node_ids)}
+        return self._node_index[int(node_id)]
+
+    def edge_sources(self):
+        """Source node position of every edge, aligned with targets."""
+        return np.repeat(np.arange(self.num_nodes, dtype=np.int32), np.diff(self.indptr))
+
+    def out_edges(self, i):
+        """(target positions, lengths) of the edges leaving node position i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.targets[start:end], self.edge_length[start:end]
+
+    def stops_by_node(self):
+        """{node position: [stop dicts]} built from the stop table."""
+        stops = {}
+        for node, stop_id, name, stop_type in zip(self.stop_node.tolist(), self.stop_id.tolist(),
+                                                  self.stop_name.tolist(), self.stop_type.tolist()):
+            stop_id = int(stop_id) if stop_id.lstrip('-').isdigit() else stop_id
+            stops.setdefault(node, []).append({"id": stop_id, "name": name, "type": stop_type})
+        return stops
+
+    def to_networkx(self):
+        """
+        Rebuild a networkx MultiDiGraph shaped like the one load_graph returns from GraphML:
+        string node ids, float x/y, 'stops' as a list of dicts, 'length' on every edge
+        and 'maxspeed' (km/h) on the edges that had one.
+        """
+        G = nx.MultiDiGraph()
+        names = [str(node) for node in self.node_ids.tolist()]
+        stops = self.stops_by_node()
+        for i, (name, x, y, is_switch, railway) in enumerate(zip(names, self.x.tolist(), self.y.tolist(),
+                                                                 self.is_switch.tolist(), self.railway.tolist())):
+            data = {"x": x, "y": y, "is_railway_switch": is_switch, "is_railway_crossing": False}
+            if railway:
+                data["railway"] = railway
+            if i in stops:
+                data["stops"] = stops[i]
+            G.add_node(name, **data)
+
+        sources = self.edge_sources().tolist()
+        G.add_edges_from(
+            (names[u], names[v], k, {"length": length})
+            for u, v, k, length in zip(sources, self.targets.tolist(), self.edge_keys.tolist(),
+                                       self.edge_length.tolist())
+        )
+        if self.edge_maxspeed is not None:
+            for u, v, k, speed in zip(sources, self.targets.tolist(), self.edge_keys.tolist(),
+                                      self.edge_maxspeed.tolist()):
+                if not np.isnan(speed):
+                    G.edges[names[u], names[v], k]["maxspeed"] = speed
+        return G
+
+
+def _arrays_mtime(store_dir):
+    return min(os.path.getmtime(os.path.join(store_dir, f"{name}.npy")) for name in GRAPH_ARRAY_FILES)
+
+
+def read_graphml(graphml_path):
+    """
+    Load the GraphML file and process node attributes:
+    - Convert x, y coordinates to floats.
+    - Convert "stops" attribute from JSON string to list.
+    """
+    G = nx.read_graphml(graphml_path)
+
+    for node, data in G.nodes(data=True):
+        # Convert coordinate strings to float
+        if "x" in data:
+            try:
+                data["x"] = float(data["x"])
+            except Exception:
+                pass
+        if "y" in data:
+            try:
+                data["y"] = float(data["y"])
+            except Exception:
+                pass
+        # Convert "stops" from JSON string to a Python list (if exists)
+        if "stops" in data:
+            try:
+                data["stops"] = json.loads(data["stops"])
+            except Exception:
+                pass
+    return G
+
+
+def load_graph(graphml_path):
+    """
+    Load the processed tram graph, preferring the binary arrays written alongside
+    the GraphML file when they are at least as new as the GraphML itself.
+    """
+    store_dir = graph_arrays_dir(graphml_path)
+    if TramGraphArrays.exists(store_dir) and (
+            not os.path.exists(graphml_path) or
+            _arrays_mtime(store_dir) >= os.path.getmtime(graphml_path)):
+        return TramGraphArrays.open(store_dir).to_networkx()
+    return read_graphml(graphml_path)
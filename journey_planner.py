@@ -0,0 +1,423 @@
+import json
+import time
+import argparse
+import numpy as np
+from distance_matrix import GRAPHML_PATH
+from graph_store import as_graph_nodes, load_graph
+from routing import RoutingSession
+from stop_assignment import StopIndex
+from travel_time import HOURS, TravelTimeModel, parse_clock
+
+LINES_FILE = "tram_lines_system.json"
+DEFAULT_HEADWAY_S = 600
+SERVICE_START_S = 5 * 3600      # first departure from a line's first stop
+SERVICE_END_S = 23 * 3600       # last departure
+DEFAULT_MAX_TRANSFERS = 3
+TRANSFER_S = 60                 # time to change trams at the same stop
+WALK_RADIUS_M = 250             # stops this close are linked by a footpath
+WALK_SPEED_MS = 1.2
+
+
+def _stop_name(G, node):
+    stops = G.nodes[node].get('stops') or [{}]
+    return stops[0].get('name', str(node))
+
+
+def _clock(seconds):
+    seconds = int(round(seconds))
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}"
+
+
+def line_directions(G, lines, headway_s=DEFAULT_HEADWAY_S, both_directions=True):
+    """
+    (line id, direction, route nodes, positions of its stops, headway in seconds) for
+    every direction of lines given like tram_lines_system.json ('line_id',
+    'route_nodes') or generate_tram_lines ('line_number', 'route') on graph G. A
+    line's own 'headway_min' overrides headway_s. Open lines also run back from their
+    last node to their first along the shortest track (each direction has its own
+    track and stop nodes in the graph); closed loops run one way. Directions with
+    fewer than two stops are left out.
+    """
+    session = RoutingSession(G)
+    directions = []
+    for i, line in enumerate(lines):
+        line_id = line.get('line_id', line.get('line_number', i + 1))
+        route = as_graph_nodes(G, line.get('route_nodes', line.get('route', [])))
+        headway = line['headway_min'] * 60 if 'headway_min' in line else headway_s
+        ways = [('forward', route)]
+        if both_directions and route and route[0] != route[-1]:
+            back = session.path(route[-1], route[0])
+            if back is not None:
+                ways.append(('reverse', back))
+        for direction, nodes in ways:
+            at = [k for k, node in enumerate(nodes) if G.nodes[node].get('stops')]
+            # A route stopping twice in a row at one node (a loop turning there) keeps the first
+            at = [k for j, k in enumerate(at) if j == 0 or nodes[k] != nodes[at[j - 1]]]
+            if len(at) >= 2:
+                directions.append((line_id, direction, nodes, at, headway))
+    return directions
+
+
+class Route:
+    """One direction of a line: its stops (positions into the planner's stops) and a trips × stops timetable."""
+
+    def __init__(self, line_id, direction, stops, times):
+        self.line_id = line_id
+        self.direction = direction
+        self.stops = np.asarray(stops, dtype=np.int64)
+        self.times = np.asarray(times, dtype=np.float64)
+
+    @property
+    def num_trips(self):
+        return self.times.shape[0]
+
+
+class Rounds:
+    """Result of a batched search: arrival times per round, row and stop, plus the labels that rebuild journeys."""
+
+    def __init__(self, sources, departs, arrival, labels):
+        self.sources = sources
+        self.departs = departs
+        self.arrival = arrival      # (rounds, rows, stops); round k rides at most k trams
+        self.labels = labels        # (route, trip, board position, walk origin) arrays shaped like arrival, or None
+
+    @property
+    def best(self):
+        """(rows, stops) earliest arrival over all rounds."""
+        return self.arrival[-1]
+
+
+class JourneyPlanner:
+    """
+    Round-based (RAPTOR) journey planner over a set of lines.
+
+    A line plan is flattened into routes (one per direction) with a trips × stops
+    timetable each, the stop → (route, position) index and walking footpaths between
+    nearby stops. Round k scans every route that has a stop improved in round k - 1,
+    so after k rounds every stop holds its earliest arrival with at most k trams
+    (k - 1 transfers).
+
+    Searches are batched: every row is a (source, departure) pair and each step of a
+    route scan is one numpy operation over all rows. All stop pairs at one departure
+    time are one search with a row per stop, and a profile query is one search with
+    a row per departure in the window.
+    """
+
+    def __init__(self, stop_nodes, stop_names, routes, footpaths=(), transfer_s=TRANSFER_S):
+        self.stop_nodes = list(stop_nodes)
+        self.stop_names = list(stop_names)
+        self.stop_of_node = {node: i for i, node in enumerate(self.stop_nodes)}
+        self.routes = list(routes)
+        self.transfer_s = transfer_s
+
+        # Footpaths grouped by the stop they lead to
+        footpaths = sorted(footpaths, key=lambda f: (f[1], f[0]))
+        self.walk_from = np.array([f[0] for f in footpaths], dtype=np.int64)
+        self.walk_to = np.array([f[1] for f in footpaths], dtype=np.int64)
+        self.walk_time = np.array([f[2] for f in footpaths], dtype=np.float64)
+        targets, starts = np.unique(self.walk_to, return_index=True)
+        self._walk_groups = list(zip(targets.tolist(), starts.tolist(), np.append(starts[1:], len(footpaths)).tolist()))
+
+        # Stop → routes serving it, to find departures for profile queries
+        self.stop_routes = [[] for _ in self.stop_nodes]
+        for r, route in enumerate(self.routes):
+            for p, stop in enumerate(route.stops.tolist()[:-1]):
+                self.stop_routes[stop].append((r, p))
+
+    @classmethod
+    def from_plan(cls, G, lines, model=None, headway_s=DEFAULT_HEADWAY_S, service=(SERVICE_START_S, SERVICE_END_S),
+                  both_directions=True, walk_radius=WALK_RADIUS_M, transfer_s=TRANSFER_S):
+        """
+        Planner over lines given like tram_lines_system.json ('line_id', 'route_nodes')
+        or generate_tram_lines ('line_number', 'route') on graph G. A line's own
+        'headway_min' overrides headway_s. Trips leave the first stop every headway
+        over the service span and run at the travel times (see TravelTimeModel) of
+        the hour they leave. Directions and stops come from line_directions.
+        """
+        model = model or TravelTimeModel.from_graph(G)
+        stop_of_node, stop_nodes = {}, []
+        routes = []
+        for line_id, direction, nodes, at, headway in line_directions(G, lines, headway_s, both_directions):
+            departures = np.arange(service[0], service[1] + 1, headway, dtype=np.float64)
+            if not len(departures):
+                continue
+            for k in at:
+                if nodes[k] not in stop_of_node:
+                    stop_of_node[nodes[k]] = len(stop_nodes)
+                    stop_nodes.append(nodes[k])
+            elapsed = model.route_times(nodes)[:, at]
+            hours = (departures // 3600).astype(np.int64) % HOURS
+            times = departures[:, None] + elapsed[hours]
+            # A later trip in a faster hour must not overtake the one before it
+            times = np.maximum.accumulate(times, axis=0)
+            routes.append(Route(line_id, direction, [stop_of_node[nodes[k]] for k in at], times))
+
+        names = [_stop_name(G, node) for node in stop_nodes]
+        footpaths = []
+        if walk_radius and stop_nodes:
+            lon = np.array([G.nodes[n]['x'] for n in stop_nodes], dtype=np.float64)
+            lat = np.array([G.nodes[n]['y'] for n in stop_nodes], dtype=np.float64)
+            sources, targets, distances = StopIndex(lon, lat).within(lon, lat, walk_radius)
+            footpaths = [(a, b, d / WALK_SPEED_MS) for a, b, d in
+                         zip(sources.tolist(), targets.tolist(), distances.tolist()) if a != b]
+        return cls(stop_nodes, names, routes, footpaths, transfer_s)
+
+    @property
+    def num_stops(self):
+        return len(self.stop_nodes)
+
+    def stop(self, key):
+        """Stop position of a graph node or a stop name."""
+        if key in self.stop_of_node:
+            return self.stop_of_node[key]
+        matches = [i for i, name in enumerate(self.stop_names) if name == key]
+        if not matches:
+            raise KeyError(f"No stop of the plan is called or located at {key!r}")
+        return matches[0]
+
+    # --- search ---
+
+    def _walk(self, arrival, best, rode, walk_label):
+        """Relax footpaths from the stops reached by tram this round (one walk per round, never two in a row)."""
+        if not len(self.walk_from):
+            return
+        start = np.where(rode[:, self.walk_from], arrival[:, self.walk_from], np.inf) + self.walk_time
+        rows = np.arange(arrival.shape[0])
+        for target, a, b in self._walk_groups:
+            block = start[:, a:b]
+            j = block.argmin(axis=1)
+            candidate = block[rows, j]
+            improved = candidate < best[:, target]
+            if improved.any():
+                arrival[improved, target] = candidate[improved]
+                best[improved, target] = candidate[improved]
+                if walk_label is not None:
+                    walk_label[improved, target] = self.walk_from[a:b][j[improved]]
+
+    def search(self, sources, departs, max_transfers=DEFAULT_MAX_TRANSFERS, labels=False):
+        """
+        Batched earliest-arrival search; row i leaves stop sources[i] at departs[i]
+        (seconds since midnight). Returns Rounds; labels=True also keeps what journey()
+        needs to rebuild the legs.
+        """
+        sources = np.asarray(sources, dtype=np.int64)
+        departs = np.asarray(departs, dtype=np.float64)
+        num_rows, num_rounds = len(sources), max_transfers + 2
+        rows = np.arange(num_rows)
+        arrival = np.full((num_rounds, num_rows, self.num_stops), np.inf)
+        route_label = trip_label = board_label = walk_label = None
+        if labels:
+            route_label = np.full(arrival.shape, -1, dtype=np.int32)
+            trip_label = np.full(arrival.shape, -1, dtype=np.int32)
+            board_label = np.full(arrival.shape, -1, dtype=np.int32)
+            walk_label = np.full(arrival.shape, -1, dtype=np.int32)
+
+        arrival[0, rows, sources] = departs
+        best = arrival[0].copy()
+        origin = np.zeros((num_rows, self.num_stops), dtype=bool)
+        origin[rows, sources] = True
+        self._walk(arrival[0], best, origin, None if walk_label is None else walk_label[0])
+        marked = np.isfinite(arrival[0])
+
+        for k in range(1, num_rounds):
+            previous, current = arrival[k - 1], arrival[k]
+            current[:] = previous
+            rode = np.zeros_like(marked)
+            ready = previous + (self.transfer_s if k > 1 else 0.0)
+            for r, route in enumerate(self.routes):
+                stops, times = route.stops, route.times
+                if not marked[:, stops].any():
+                    continue
+                trips = route.num_trips
+                trip = np.full(num_rows, trips)
+                board = np.full(num_rows, -1)
+                for p, stop in enumerate(stops.tolist()):
+                    riding = trip < trips
+                    if riding.any():
+                        at = np.full(num_rows, np.inf)
+                        at[riding] = times[trip[riding], p]
+                        improved = at < best[:, stop]
+                        if improved.any():
+                            current[improved, stop] = at[improved]
+                            best[improved, stop] = at[improved]
+                            rode[improved, stop] = True
+                            if labels:
+                                route_label[k, improved, stop] = r
+                                trip_label[k, improved, stop] = trip[improved]
+                                board_label[k, improved, stop] = board[improved]
+                    if p < len(stops) - 1:
+                        catch = np.searchsorted(times[:, p], ready[:, stop], side='left')
+                        earlier = catch < trip
+                        trip[earlier] = catch[earlier]
+                        board[earlier] = p
+            self._walk(current, best, rode, None if walk_label is None else walk_label[k])
+            marked = current < previous
+            if not marked.any():
+                arrival[k + 1:] = current
+                break
+
+        packed = (route_label, trip_label, board_label, walk_label) if labels else None
+        return Rounds(sources, departs, arrival, packed)
+
+    # --- queries ---
+
+    def earliest_arrival(self, source, depart, max_transfers=DEFAULT_MAX_TRANSFERS):
+        """Earliest arrival (seconds since midnight) at every stop leaving source at depart."""
+        return self.search([self.stop(source)], [depart], max_transfers).best[0]
+
+    def journey(self, source, target, depart, max_transfers=DEFAULT_MAX_TRANSFERS):
+        """
+        Legs of the earliest journey with the fewest transfers among the earliest, as
+        dicts with mode ('tram' or 'walk'), line, stops and times; None when target
+        cannot be reached.
+        """
+        s, t = self.stop(source), self.stop(target)
+        rounds = self.search([s], [depart], max_transfers, labels=True)
+        arrival = rounds.arrival[:, 0, t]
+        if not np.isfinite(arrival[-1]):
+            return None
+        route_label, trip_label, board_label, walk_label = (label[:, 0] for label in rounds.labels)
+
+        legs = []
+        k, stop = int(np.argmax(arrival == arrival[-1])), t
+        while True:
+            walked = walk_label[k, stop]
+            if walked >= 0:
+                legs.append({"mode": "walk", "from": self.stop_names[walked], "to": self.stop_names[stop],
+                             "depart": float(rounds.arrival[k, 0, walked]),
+                             "arrive": float(rounds.arrival[k, 0, stop])})
+                stop = int(walked)
+            if k == 0:
+                break
+            r = route_label[k, stop]
+            if r < 0:
+                k -= 1
+                continue
+            route = self.routes[r]
+            trip, board = trip_label[k, stop], board_label[k, stop]
+            # The position where the trip reached stop at the labelled time (a loop may pass it twice)
+            later = np.flatnonzero((route.stops[board + 1:] == stop) &
+                                   (route.times[trip, board + 1:] == rounds.arrival[k, 0, stop]))
+            alight = int(later[0]) + board + 1
+            legs.append({"mode": "tram", "line": route.line_id, "direction": route.direction,
+                         "from": self.stop_names[route.stops[board]], "to": self.stop_names[stop],
+                         "depart": float(route.times[trip, board]), "arrive": float(route.times[trip, alight]),
+                         "stops": alight - board})
+            stop = int(route.stops[board])
+            k -= 1
+        return legs[::-1]
+
+    def departures(self, source, start, end):
+        """Times within [start, end] at which a tram leaves source or a stop a short walk away, walk included."""
+        s = self.stop(source)
+        nearby = [(s, 0.0)] + [(to, walk) for origin, to, walk in
+                               zip(self.walk_from.tolist(), self.walk_to.tolist(), self.walk_time.tolist()) if origin == s]
+        times = []
+        for stop, walk_time in nearby:
+            for r, p in self.stop_routes[stop]:
+                leave = self.routes[r].times[:, p] - walk_time
+                times.extend(leave[(leave >= start) & (leave <= end)].tolist())
+        return np.unique(times)
+
+    def profile(self, source, start, end, max_transfers=DEFAULT_MAX_TRANSFERS):
+        """
+        Profile query: for every stop, the Pareto set of journeys leaving source in
+        [start, end] as (depart, arrive, transfers) tuples, where no other journey
+        leaves later, arrives earlier and transfers less. Every useful departure is a
+        row of one batched search.
+        """
+        s = self.stop(source)
+        departs = self.departures(source, start, end)
+        profiles = {node: [] for node in self.stop_nodes}
+        if not len(departs):
+            return profiles
+        rounds = self.search(np.full(len(departs), s), departs, max_transfers)
+        order = np.argsort(-departs)
+        for target, node in enumerate(self.stop_nodes):
+            if target == s:
+                continue
+            kept = []
+            # Latest departures first: a journey is kept when it beats every later one with as few transfers
+            for row in order.tolist():
+                for k in range(1, rounds.arrival.shape[0]):
+                    arrive = rounds.arrival[k, row, target]
+                    if not np.isfinite(arrive):
+                        continue
+                    transfers = k - 1
+                    if any(a <= arrive and x <= transfers for _, a, x in kept):
+                        continue
+                    kept.append((float(departs[row]), float(arrive), transfers))
+            profiles[node] = sorted(kept)
+        return profiles
+
+    def all_pairs(self, depart, max_transfers=DEFAULT_MAX_TRANSFERS):
+        """(stops × stops) journey time in seconds between every pair of stops leaving at depart."""
+        rounds = self.search(np.arange(self.num_stops), np.full(self.num_stops, float(depart)), max_transfers)
+        return rounds.best - depart
+
+
+def journey_time_stats(planner, departs, max_transfers=DEFAULT_MAX_TRANSFERS, weights=None):
+    """
+    Mean journey time in minutes over all stop pairs and departure times, and the
+    share of pairs that cannot be reached. weights, one per stop, weight a pair by
+    the product of its stops' weights (e.g. their demand).
+    """
+    times = np.stack([planner.all_pairs(depart, max_transfers) for depart in departs])
+    pair_weight = (np.ones((planner.num_stops, planner.num_stops)) if weights is None
+                   else np.outer(weights, weights))
+    np.fill_diagonal(pair_weight, 0.0)
+    reachable = np.isfinite(times)
+    total = pair_weight.sum() * len(departs)
+    served = (pair_weight * reachable).sum()
+    mean = (np.where(reachable, times, 0.0) * pair_weight).sum() / served if served else float('nan')
+    return {"mean_journey_min": float(mean / 60), "unreachable_share": float(1 - served / total) if total else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Journey planner (RAPTOR) over a set of tram lines.")
+    parser.add_argument("--lines", default=LINES_FILE, help="JSON list of lines with route_nodes")
+    parser.add_argument("--headway", type=float, default=DEFAULT_HEADWAY_S / 60, help="minutes between trams")
+    parser.add_argument("--depart", default="08:00", help="departure time HH:MM")
+    parser.add_argument("--transfers", type=int, default=DEFAULT_MAX_TRANSFERS, help="maximum transfers")
+    parser.add_argument("--from", dest="source", help="stop name; prints the journey to --to")
+    parser.add_argument("--to", dest="target", help="stop name")
+    parser.add_argument("--profile", metavar="HH:MM-HH:MM", help="print the --from → --to journeys leaving in this window")
+    args = parser.parse_args()
+
+    G = load_graph(GRAPHML_PATH)
+    with open(args.lines, 'r', encoding='utf-8') as f:
+        lines = json.load(f)
+    start = time.perf_counter()
+    planner = JourneyPlanner.from_plan(G, lines, headway_s=args.headway * 60)
+    trips = sum(route.num_trips for route in planner.routes)
+    print(f"{len(planner.routes)} routes, {planner.num_stops} stops, {trips} trips, "
+          f"{len(planner.walk_from)} footpaths built in {time.perf_counter() - start:.2f} s.")
+    depart = parse_clock(args.depart)
+
+    if args.source and args.target and args.profile:
+        window = [parse_clock(value) for value in args.profile.split('-')]
+        for leave, arrive, transfers in planner.profile(args.source, *window, args.transfers)[
+                planner.stop_nodes[planner.stop(args.target)]]:
+            print(f"  {_clock(leave)} → {_clock(arrive)} ({(arrive - leave) / 60:.0f} min, {transfers} transfers)")
+        return
+    if args.source and args.target:
+        legs = planner.journey(args.source, args.target, depart, args.transfers)
+        if legs is None:
+            print(f"No journey from {args.source} to {args.target} with at most {args.transfers} transfers.")
+            return
+        for leg in legs:
+            how = f"line {leg['line']}" if leg['mode'] == 'tram' else "walk"
+            print(f"  {_clock(leg['depart'])}-{_clock(leg['arrive'])} {how}: {leg['from']} → {leg['to']}")
+        return
+
+    start = time.perf_counter()
+    times = planner.all_pairs(depart, args.transfers)
+    elapsed = time.perf_counter() - start
+    reachable = np.isfinite(times)
+    np.fill_diagonal(reachable, False)
+    print(f"All {planner.num_stops ** 2:,} stop pairs at {args.depart} in {elapsed:.2f} s: "
+          f"{reachable.sum():,} reachable, mean journey {times[reachable].mean() / 60:.1f} min.")
+
+
+if __name__ == '__main__':
+    main()
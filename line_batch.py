@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import heapq
+import random
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from network_coverage import CoverageEngine
+from create_tram_graph_demand import generate_tram_lines, routing_graph, stop_demand_for
+from routing import RoutingSession
+
+BATCH_FILE = "tram_lines_batch.json"
+DEFAULT_RUNS = 1000
+DEFAULT_TOP = 10
+PERCENTILES = (0, 5, 25, 50, 75, 95, 100)
+
+_graph = None
+_session = None
+_engine = None
+
+
+def derive_seeds(seed, runs):
+    """One independent integer seed per run, derived from the batch seed with numpy's SeedSequence."""
+    return [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(runs)]
+
+
+def _init_worker(R):
+    # With the fork start method R arrives through the inherited memory, not a pickle
+    global _graph, _session, _engine
+    _graph = R
+    _session = RoutingSession(R)
+    _engine = CoverageEngine.from_graph(R)
+
+
+def run_once(R, session, engine, seed, num_lines):
+    """Generate one set of random loop lines from seed and summarize it."""
+    lines = generate_tram_lines(R, num_lines, session, rng=random.Random(seed), verbose=False)
+    engine = engine.copy()
+    for line in lines:
+        engine.add_line(line['line_number'], engine.plan(line['route']))
+    stats = engine.stats()
+    return {
+        "seed": seed,
+        "total_network_length_km": stats["total_network_length_km"],
+        "total_network_demand": stats["total_network_demand"],
+        "coverage_percentage": stats["coverage_percentage"],
+        "lines": [{k: v for k, v in line.items() if k != 'route'} for line in lines],
+    }
+
+
+def _run_chunk(task):
+    seeds, num_lines = task
+    return [run_once(_graph, _session, _engine, seed, num_lines) for seed in seeds]
+
+
+def distribution(values):
+    values = np.asarray(values, dtype=np.float64)
+    summary = {f"p{p}": float(v) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    summary["mean"] = float(values.mean())
+    summary["std"] = float(values.std())
+    return summary
+
+
+def run_batch(R, runs=DEFAULT_RUNS, seed=0, num_lines=6, top=DEFAULT_TOP, workers=None, chunk_size=64, hour=None):
+    """
+    Generate runs line sets with seeds derived from seed across a process pool. Each
+    worker gets the graph once (shared copy-on-write where fork is available) and
+    keeps its own routing cache. Returns the length, demand and coverage
+    distributions and the top plans by demand served, each with the seed that
+    regenerates it. hour only labels the result: the demand it selected (None for
+    the whole day) must already be attached to R.
+    """
+    seeds = derive_seeds(seed, runs)
+    chunks = [(seeds[i:i + chunk_size], num_lines) for i in range(0, runs, chunk_size)]
+    workers = workers or os.cpu_count() or 1
+
+    lengths, demands, coverages = [], [], []
+    best = []
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(R)
+        results = map(_run_chunk, chunks)
+        pool = None
+    else:
+        context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(R,))
+        results = pool.map(_run_chunk, chunks)
+    try:
+        for chunk in results:
+            for run in chunk:
+                lengths.append(run["total_network_length_km"])
+                demands.append(run["total_network_demand"])
+                coverages.append(run["coverage_percentage"])
+                # Ties are broken by the seed so the kept plans do not depend on the pool's timing
+                entry = (run["total_network_demand"], -run["seed"], run)
+                if len(best) < top:
+                    heapq.heappush(best, entry)
+                elif entry[:2] > best[0][:2]:
+                    heapq.heapreplace(best, entry)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "runs": runs,
+        "seed": seed,
+        "num_lines": num_lines,
+        "hour": hour,
+        "elapsed_s": elapsed,
+        "total_network_length_km": distribution(lengths),
+        "total_network_demand": distribution(demands),
+        "coverage_percentage": distribution(coverages),
+        "top": [run for _, _, run in sorted(best, key=lambda entry: entry[:2], reverse=True)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate many seeded sets of random loop lines and aggregate them.")
+    parser.add_argument("--runs", type=int, default=DEFAULT_RUNS)
+    parser.add_argument("--seed", type=int, default=0, help="batch seed; every run gets a seed derived from it")
+    parser.add_argument("--lines", type=int, default=6, help="lines per run")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP, help="plans to keep, by demand served")
+    parser.add_argument("--hour", type=int, help="demand of this hour (the whole day when omitted)")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("-o", "--output", default=BATCH_FILE)
+    args = parser.parse_args()
+
+    # Same graph and demand as create_tram_graph_demand.py, so its --seed replays a kept plan
+    R = routing_graph(stop_demand_for(args.hour))
+
+    result = run_batch(R, args.runs, args.seed, args.lines, args.top, args.workers, hour=args.hour)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+    print(f"{args.runs} runs in {result['elapsed_s']:.1f} s ({args.runs / result['elapsed_s']:,.0f} runs/s).")
+    for key in ("total_network_length_km", "total_network_demand", "coverage_percentage"):
+        d = result[key]
+        print(f"  {key}: median {d['p50']:.1f}, 5-95% {d['p5']:.1f}-{d['p95']:.1f}, max {d['p100']:.1f}")
+    best = result["top"][0]
+    print(f"Best plan: seed {best['seed']}, demand {best['total_network_demand']:.0f}, "
+          f"{best['total_network_length_km']:.1f} km. Saved to {args.output}")
+    hour = f" --hour {args.hour}" if args.hour is not None else ""
+    print(f"Replay it with: python create_tram_graph_demand.py --seed {best['seed']}{hour} --lines {args.lines}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+import os
+import json
+import math
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from network_coverage import CoverageEngine, LinePlan
+from demand_store import DemandStore
+from distance_matrix import GRAPHML_PATH
+from graph_contraction import contract_graph
+from graph_store import load_graph
+from routing import NO_PREDECESSOR, min_weight_csr
+from tram_pipeline import attach_demand
+
+DEFAULT_TIME_BUDGET = 30.0   # seconds of wall-clock time for the whole search
+DEFAULT_NUM_LINES = 6
+DEFAULT_MAX_WAYPOINTS = 6
+NEAREST_CANDIDATES = 16      # neighbourhood used by the "move a waypoint nearby" mutation
+LINE_COLORS = ['red', 'blue', 'green', 'orange', 'purple', 'brown', 'pink', 'gray']
+
+
+def is_petla(data):
+    return any(stop.get('type') == 'pętla' for stop in data.get('stops') or [])
+
+
+class Objective:
+    """
+    Score of a whole line plan, higher is better: the share of all stop demand the
+    plan serves, minus a small cost per km of line and a penalty per km by which the
+    network exceeds length_budget_km or a line leaves [min_line_km, max_line_km].
+    """
+
+    def __init__(self, length_budget_km=None, max_line_km=None, min_line_km=0.0,
+                 length_weight=0.002, penalty_per_km=0.05):
+        self.length_budget_km = length_budget_km
+        self.max_line_km = max_line_km
+        self.min_line_km = min_line_km
+        self.length_weight = length_weight
+        self.penalty_per_km = penalty_per_km
+
+    def score(self, engine, demand_total):
+        total_km = engine.total_length / 1000
+        excess = 0.0
+        if self.length_budget_km is not None:
+            excess += max(0.0, total_km - self.length_budget_km)
+        if self.max_line_km is not None or self.min_line_km:
+            for plan in engine.lines.values():
+                km = plan.length / 1000
+                if self.max_line_km is not None and km > self.max_line_km:
+                    excess += km - self.max_line_km
+                if km < self.min_line_km:
+                    excess += self.min_line_km - km
+        served = engine.covered_demand / demand_total if demand_total > 0 else 0.0
+        return served - self.length_weight * total_km - self.penalty_per_km * excess
+
+
+class LinePlanProblem:
+    """
+    Loop lines on the contracted graph, each written as a pętla terminus plus a list of
+    waypoint stops: the route runs terminus -> waypoints -> terminus along shortest
+    paths. Distances between all candidate nodes (termini and stops with demand) are
+    computed once; the stops along each hop are cached the first time it is used, so
+    turning a candidate line into a LinePlan never searches the graph.
+    """
+
+    def __init__(self, R, termini=None, max_waypoints=DEFAULT_MAX_WAYPOINTS):
+        self.R = R
+        self.max_waypoints = max_waypoints
+        self.engine = CoverageEngine.from_graph(R)
+        self.demand_total = float(self.engine.stop_demand.sum())
+
+        termini = [n for n, d in R.nodes(data=True) if is_petla(d)] if termini is None else list(termini)
+        waypoints = [n for n in self.engine.stop_nodes if R.nodes[n].get('total_demand', 0) > 0 and n not in termini]
+        candidates = termini + waypoints
+
+        self.nodes = list(R.nodes)
+        index = {node: i for i, node in enumerate(self.nodes)}
+        sources, targets, weights = zip(*[(index[u], index[v], d.get('length', 0))
+                                          for u, v, d in R.edges(data=True)])
+        matrix = min_weight_csr(sources, targets, weights, len(self.nodes))
+        candidate_index = np.array([index[n] for n in candidates])
+        dist, pred = dijkstra(matrix, directed=True, indices=candidate_index, return_predecessors=True)
+        dist = dist[:, candidate_index]
+
+        # A loop must get there and back: drop candidates cut off from most of the network
+        round_trip = np.isfinite(dist) & np.isfinite(dist.T)
+        keep = round_trip.sum(axis=1) > len(candidates) / 2
+        self.candidates = [n for n, k in zip(candidates, keep) if k]
+        num_termini = int(keep[:len(termini)].sum())
+        self.termini = list(range(num_termini))
+        self.waypoints = list(range(num_termini, len(self.candidates)))
+        self.candidate_index = candidate_index[keep]
+        self.pred = pred[keep]
+        self.dist = dist[np.ix_(keep, keep)]
+        termini = self.candidates[:num_termini]
+        # Waypoints each terminus reaches and returns from: every hop of a loop over them has
+        # a path (via the terminus if nothing shorter), so such a loop is always routable
+        both_ways = np.isfinite(self.dist) & np.isfinite(self.dist.T)
+        self.loop_waypoints = [[w for w in self.waypoints if both_ways[t, w]] for t in self.termini]
+
+        # For every waypoint the nearest other waypoints by track distance
+        order = np.argsort(self.dist[:, len(termini):], axis=1)[:, 1:NEAREST_CANDIDATES + 1]
+        self.nearby = (order + len(termini)).tolist()
+        self._stop_position = np.full(len(self.nodes), -1, dtype=np.int64)
+        for position, node in enumerate(self.engine.stop_nodes):
+            self._stop_position[index[node]] = position
+        self._hops = {}
+
+    def hop_nodes(self, a, b):
+        """Node positions of the shortest path between candidates a and b, both included."""
+        pred = self.pred[a]
+        node, source = self.candidate_index[b], self.candidate_index[a]
+        path = [node]
+        while node != source:
+            node = pred[node]
+            if node == NO_PREDECESSOR:
+                return None
+            path.append(node)
+        return path[::-1]
+
+    def hop_stops(self, a, b):
+        stops = self._hops.get((a, b))
+        if stops is None:
+            positions = self._stop_position[self.hop_nodes(a, b)]
+            stops = positions[positions >= 0]
+            self._hops[(a, b)] = stops
+        return stops
+
+    def sequence(self, line):
+        terminus, waypoints = line
+        return [terminus, *waypoints, terminus]
+
+    def length(self, line):
+        sequence = self.sequence(line)
+        return sum(self.dist[a, b] for a, b in zip(sequence, sequence[1:]))
+
+    def plan(self, line):
+        """LinePlan of (terminus, waypoints), or None when a hop is unreachable."""
+        sequence = self.sequence(line)
+        length = self.length(line)
+        if not math.isfinite(length):
+            return None
+        stops = np.unique(np.concatenate([self.hop_stops(a, b) for a, b in zip(sequence, sequence[1:])]))
+        return LinePlan(stops, length, None)
+
+    def route(self, line):
+        """The full route of a line as nodes of the contracted graph."""
+        sequence = self.sequence(line)
+        route = [self.nodes[self.candidate_index[sequence[0]]]]
+        for a, b in zip(sequence, sequence[1:]):
+            route.extend(self.nodes[i] for i in self.hop_nodes(a, b)[1:])
+        return route
+
+    def line_info(self, line, line_number):
+        """The line as a dictionary in the layout generate_tram_lines returns."""
+        route = self.route(line)
+        plan = self.engine.plan(route)
+        terminus = self.candidates[line[0]]
+        name = next(s['name'] for s in self.R.nodes[terminus]['stops'] if s.get('type') == 'pętla')
+        return {
+            'line_number': line_number,
+            'route': route,
+            'color': LINE_COLORS[(line_number - 1) % len(LINE_COLORS)],
+            'start_stop': name,
+            'total_demand': float(self.engine.stop_demand[plan.stops].sum()),
+            'length_km': plan.length / 1000,
+            'num_stops': int((self.engine.stop_demand[plan.stops] > 0).sum()),
+        }
+
+
+def _random_line(problem, rng, terminus):
+    """A routable random loop from terminus through 3-5 of the waypoints it can reach and return from."""
+    reachable = problem.loop_waypoints[terminus]
+    if not reachable:
+        raise ValueError(f"Terminus {problem.candidates[terminus]} cannot reach and return from any waypoint")
+    count = min(rng.randint(3, 5), len(reachable))
+    return terminus, rng.sample(reachable, count)
+
+
+def _mutate(problem, rng, line, used_termini):
+    """A neighbouring line: one waypoint replaced, moved nearby, added, dropped or reordered, or a new terminus."""
+    terminus, waypoints = line
+    waypoints = list(waypoints)
+    move = rng.random()
+    if move < 0.1:
+        free = [t for t in problem.termini if t not in used_termini]
+        if free:
+            return rng.choice(free), waypoints
+    if move < 0.35 and len(waypoints) > 1:
+        j = rng.randrange(len(waypoints))
+        waypoints[j] = rng.choice(problem.nearby[waypoints[j]])
+    elif move < 0.5:
+        waypoints[rng.randrange(len(waypoints))] = rng.choice(problem.waypoints)
+    elif move < 0.7 and len(waypoints) < problem.max_waypoints:
+        j = rng.randrange(len(waypoints) + 1)
+        anchor = waypoints[j - 1] if j else waypoints[0]
+        waypoints.insert(j, rng.choice(problem.nearby[anchor]))
+    elif move < 0.85 and len(waypoints) > 1:
+        del waypoints[rng.randrange(len(waypoints))]
+    elif len(waypoints) > 1:
+        i, j = sorted(rng.sample(range(len(waypoints)), 2))
+        waypoints[i:j + 1] = waypoints[i:j + 1][::-1]
+    return terminus, waypoints
+
+
+def anneal(problem, objective, num_lines, seed, time_budget, target=None, t_start=0.02, t_end=1e-4):
+    """
+    One simulated-annealing run over whole line plans. Each step mutates one line,
+    applies it to the coverage engine as a reroute (a delta update), scores the plan
+    and reroutes back if the move is rejected. The temperature falls geometrically
+    from t_start to t_end over the time budget.
+    """
+    rng = random.Random(seed)
+    engine = problem.engine.copy()
+    termini = rng.sample(problem.termini, min(num_lines, len(problem.termini)))
+    lines = []
+    for terminus in termini:
+        line = _random_line(problem, rng, terminus)
+        engine.add_line(len(lines), problem.plan(line))
+        lines.append(line)
+
+    score = objective.score(engine, problem.demand_total)
+    best_score, best_lines = score, list(lines)
+    evaluations, time_to_target = 0, None
+    start = time.perf_counter()
+    elapsed = 0.0
+    temperature = t_start
+    while elapsed < time_budget:
+        for _ in range(256):
+            i = rng.randrange(len(lines))
+            used = {terminus for j, (terminus, _) in enumerate(lines) if j != i}
+            candidate = _mutate(problem, rng, lines[i], used)
+            plan = problem.plan(candidate)
+            if plan is None:
+                continue
+            previous = engine.reroute_line(i, plan)
+            new_score = objective.score(engine, problem.demand_total)
+            evaluations += 1
+            if new_score >= score or rng.random() < math.exp((new_score - score) / temperature):
+                lines[i], score = candidate, new_score
+                if score > best_score:
+                    best_score, best_lines = score, list(lines)
+            else:
+                engine.reroute_line(i, previous)
+        elapsed = time.perf_counter() - start
+        temperature = t_start * (t_end / t_start) ** min(1.0, elapsed / time_budget)
+        if target is not None and time_to_target is None and best_score >= target:
+            time_to_target = elapsed
+            break
+
+    return {"seed": seed, "score": best_score, "lines": best_lines, "evaluations": evaluations,
+            "elapsed": elapsed, "time_to_target": time_to_target}
+
+
+_problem = None
+_objective = None
+
+
+def _init_worker(problem, objective):
+    global _problem, _objective
+    _problem, _objective = problem, objective
+
+
+def _run(task):
+    num_lines, seed, time_budget, target = task
+    return anneal(_problem, _objective, num_lines, seed, time_budget, target)
+
+
+def optimize(problem, objective, num_lines=DEFAULT_NUM_LINES, restarts=None, workers=None,
+             time_budget=DEFAULT_TIME_BUDGET, seed=0, target=None):
+    """
+    Independent annealing restarts with seeds derived from seed, spread over a process
+    pool so the whole search fits in time_budget seconds of wall time. The problem is
+    handed to each worker once. Returns (best run, all runs, candidate plans per second).
+    """
+    workers = workers or os.cpu_count() or 1
+    restarts = restarts or workers
+    rounds = -(-restarts // workers)
+    seeds = [int(s.generate_state(1)[0]) for s in np.random.SeedSequence(seed).spawn(restarts)]
+    tasks = [(num_lines, s, time_budget / rounds, target) for s in seeds]
+
+    start = time.perf_counter()
+    if workers == 1:
+        _init_worker(problem, objective)
+        runs = [_run(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(problem, objective)) as pool:
+            runs = list(pool.map(_run, tasks))
+    wall = time.perf_counter() - start
+    best = max(runs, key=lambda run: run["score"])
+    return best, runs, sum(run["evaluations"] for run in runs) / wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Optimize a set of tram loop lines with simulated annealing.")
+    parser.add_argument("--hour", type=int, help="demand of this hour (the whole day when omitted)")
+    parser.add_argument("--lines", type=int, default=DEFAULT_NUM_LINES)
+    parser.add_argument("--time-budget", type=float, default=DEFAULT_TIME_BUDGET, help="seconds of wall time")
+    parser.add_argument("--restarts", type=int, help="independent annealing runs (one per worker by default)")
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--target", type=float, help="stop a run once it reaches this score")
+    parser.add_argument("--length-budget-km", type=float, help="total network length allowed")
+    parser.add_argument("--max-line-km", type=float, default=20.0)
+    parser.add_argument("--min-line-km", type=float, default=0.0)
+    parser.add_argument("-o", "--output", help="write the lines in the tram_lines_summary.json layout")
+    args = parser.parse_args()
+
+    G = load_graph(GRAPHML_PATH)
+    stop_demand = {}
+    if DemandStore.exists():
+        store = DemandStore.open()
+        if args.hour is not None:
+            stop_demand = store.hour_by_stop(args.hour)
+        else:
+            stop_demand = store.day_by_stop()
+    R = attach_demand(contract_graph(G), stop_demand)
+    problem = LinePlanProblem(R)
+    objective = Objective(args.length_budget_km, args.max_line_km, args.min_line_km)
+    print(f"{len(problem.termini)} termini, {len(problem.waypoints)} waypoint candidates.")
+
+    best, runs, throughput = optimize(problem, objective, args.lines, args.restarts, args.workers,
+                                      args.time_budget, args.seed, args.target)
+    for run in runs:
+        reached = f", target after {run['time_to_target']:.1f} s" if run['time_to_target'] is not None else ""
+        print(f"  seed {run['seed']}: score {run['score']:.4f}, {run['evaluations']} plans{reached}")
+    print(f"Best score {best['score']:.4f} from seed {best['seed']}; {throughput:,.0f} candidate plans/s.")
+
+    lines = [problem.line_info(line, i + 1) for i, line in enumerate(best["lines"])]
+    for line in lines:
+        print(f"Line {line['line_number']}: {line['start_stop']} Loop - {line['length_km']:.1f}km, "
+              f"{line['num_stops']} stops, demand: {line['total_demand']:.0f}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump([{k: v for k, v in line.items() if k != 'route'} for line in lines], f,
+                      ensure_ascii=False, indent=2)
+        print(f"Line data saved to '{args.output}'")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+import json
+import time
+import random
+import argparse
+import numpy as np
+from demand_store import DemandStore
+from distance_matrix import GRAPHML_PATH
+from graph_store import load_graph
+from routing import RoutingSession
+from tram_pipeline import attach_demand
+
+LINES_FILE = "tram_lines_system.json"
+
+
+class Line:
+    """
+    One line of a LineSet: its route as an array of edge indices, how often it visits
+    every node, and its metrics. Prefix sums of length and demand along the route are
+    built on first use and dropped whenever the route changes.
+    """
+
+    def __init__(self, edges, num_nodes):
+        self.edges = edges
+        self.visits = np.zeros(num_nodes, dtype=np.int32)
+        self.length = 0.0
+        self.demand = 0.0
+        self.num_stops = 0
+        self._prefix = None
+
+
+class LineSet:
+    """
+    A set of lines on one graph with every line and network metric kept up to date.
+
+    Routes are stored as edge-index arrays. Each edit (replacing a segment, extending
+    to a new terminus, swapping a terminus) only visits the nodes it removes or adds:
+    length changes by the removed and added edge lengths, and the per-line and
+    network visit counts decide which nodes start or stop counting. Demand and stops
+    are counted once per line (and once for the network) however often a route
+    passes a node, so loops that revisit a node are not double-counted.
+    """
+
+    def __init__(self, G, weight='length', session=None):
+        self.G = G
+        self.nodes = list(G.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        self.node_demand = np.array([G.nodes[n].get('total_demand', 0.0) for n in self.nodes], dtype=np.float64)
+        self.is_stop = np.array([bool(G.nodes[n].get('stops')) for n in self.nodes])
+
+        # One edge per node pair, the shortest of any parallel edges (as routing uses)
+        best = {}
+        for u, v, data in G.edges(data=True):
+            key = (self.index[u], self.index[v])
+            length = float(data.get(weight, 0.0))
+            if key not in best or length < best[key]:
+                best[key] = length
+        self.edge_of = {key: e for e, key in enumerate(best)}
+        pairs = np.array(list(best), dtype=np.int64).reshape(-1, 2)
+        self.edge_source, self.edge_target = pairs[:, 0], pairs[:, 1]
+        self.edge_length = np.array(list(best.values()), dtype=np.float64)
+
+        self.lines = {}
+        self.node_lines = np.zeros(len(self.nodes), dtype=np.int32)
+        self.total_length = 0.0
+        self.network_demand = 0.0
+        self.network_stops = 0
+        self._session = session
+
+    @property
+    def session(self):
+        """RoutingSession over the same graph, created on first use by the routed edits."""
+        if self._session is None:
+            self._session = RoutingSession(self.G)
+        return self._session
+
+    # --- route representation ---
+
+    def _path_edges(self, path):
+        positions = [self.index[node] for node in path]
+        try:
+            return np.array([self.edge_of[edge] for edge in zip(positions, positions[1:])], dtype=np.int64)
+        except KeyError as e:
+            raise ValueError(f"Route uses a pair of nodes with no edge between them: {e}") from None
+
+    def route_positions(self, line_id):
+        """Node positions along a line's route."""
+        edges = self.lines[line_id].edges
+        return np.concatenate([self.edge_source[edges[:1]], self.edge_target[edges]])
+
+    def route(self, line_id):
+        """A line's route as graph nodes."""
+        return [self.nodes[i] for i in self.route_positions(line_id).tolist()]
+
+    def prefix(self, line_id):
+        """
+        (length, demand) prefix sums along the route, aligned with its nodes: the
+        length from the first node to node i, and the demand of nodes 0..i as passed
+        (a revisited node counts each time).
+        """
+        line = self.lines[line_id]
+        if line._prefix is None:
+            length = np.concatenate([[0.0], np.cumsum(self.edge_length[line.edges])])
+            demand = np.cumsum(self.node_demand[self.route_positions(line_id)])
+            line._prefix = (length, demand)
+        return line._prefix
+
+    def segment_length(self, line_id, i, j):
+        """Track length between route nodes i and j."""
+        length, _ = self.prefix(line_id)
+        return float(length[j] - length[i])
+
+    def segment_demand(self, line_id, i, j):
+        """Demand passed from route node i to route node j, both included."""
+        _, demand = self.prefix(line_id)
+        return float(demand[j] - (demand[i - 1] if i else 0.0))
+
+    # --- delta updates ---
+
+    def _visit(self, line, positions, sign):
+        """Add (sign=1) or remove (sign=-1) node visits and update every metric they affect."""
+        if not len(positions):
+            return
+        nodes, counts = np.unique(positions, return_counts=True)
+        before = line.visits[nodes]
+        line.visits[nodes] = before + sign * counts
+        changed = nodes[before == 0] if sign > 0 else nodes[line.visits[nodes] == 0]
+        if not len(changed):
+            return
+        line.demand += sign * self.node_demand[changed].sum()
+        line.num_stops += sign * int(self.is_stop[changed].sum())
+
+        before = self.node_lines[changed]
+        self.node_lines[changed] = before + sign
+        covered = changed[before == 0] if sign > 0 else changed[self.node_lines[changed] == 0]
+        self.network_demand += sign * self.node_demand[covered].sum()
+        self.network_stops += sign * int(self.is_stop[covered].sum())
+
+    def _splice(self, line, start, end, new_edges, removed, added):
+        """Replace line.edges[start:end] with new_edges, given the node positions it removes and adds."""
+        delta = self.edge_length[new_edges].sum() - self.edge_length[line.edges[start:end]].sum()
+        line.length += delta
+        self.total_length += delta
+        self._visit(line, added, 1)
+        self._visit(line, removed, -1)
+        line.edges = np.concatenate([line.edges[:start], new_edges, line.edges[end:]])
+        line._prefix = None
+
+    def add_line(self, line_id, route):
+        if line_id in self.lines:
+            raise KeyError(f"Line {line_id} already exists")
+        line = Line(self._path_edges(route), len(self.nodes))
+        self.lines[line_id] = line
+        line.length = float(self.edge_length[line.edges].sum())
+        self.total_length += line.length
+        self._visit(line, self.route_positions(line_id), 1)
+        return line
+
+    def remove_line(self, line_id):
+        positions = self.route_positions(line_id)
+        line = self.lines.pop(line_id)
+        self.total_length -= line.length
+        self._visit(line, positions, -1)
+        return line
+
+    def replace_segment(self, line_id, i, j, path):
+        """Replace the route between its nodes i and j (i < j) with path, which must start and end at those nodes."""
+        line = self.lines[line_id]
+        edges = line.edges
+        if (self.index[path[0]] != self.edge_source[edges[i]] or
+                self.index[path[-1]] != self.edge_target[edges[j - 1]]):
+            raise ValueError("The new segment must start and end at route nodes i and j")
+        new_edges = self._path_edges(path)
+        removed = self.edge_target[edges[i:j - 1]]
+        added = self.edge_target[new_edges[:-1]]
+        self._splice(line, i, j, new_edges, removed, added)
+
+    def extend(self, line_id, path, at='end'):
+        """Extend a line to a new terminus: path leads from the current end (or to the current start)."""
+        line = self.lines[line_id]
+        edges = line.edges
+        new_edges = self._path_edges(path)
+        if at == 'end':
+            if self.index[path[0]] != self.edge_target[edges[-1]]:
+                raise ValueError("The extension must start at the line's last node")
+            self._splice(line, len(edges), len(edges), new_edges, edges[:0], self.edge_target[new_edges])
+        else:
+            if self.index[path[-1]] != self.edge_source[edges[0]]:
+                raise ValueError("The extension must end at the line's first node")
+            self._splice(line, 0, 0, new_edges, edges[:0], self.edge_source[new_edges])
+
+    def swap_terminus(self, line_id, path, at='end'):
+        """
+        Replace the terminus at one end of a line: the route is cut back to the first
+        node of path (at='end') or the last node of path (at='start'), which must lie on
+        the route, and path is attached in its place.
+        """
+        line = self.lines[line_id]
+        positions = self.route_positions(line_id)
+        new_edges = self._path_edges(path)
+        if at == 'end':
+            cut = np.flatnonzero(positions == self.index[path[0]])
+            if not len(cut):
+                raise ValueError("The new leg must start on the line's route")
+            k = int(cut[-1])
+            self._splice(line, k, len(line.edges), new_edges, positions[k + 1:], self.edge_target[new_edges])
+        else:
+            cut = np.flatnonzero(positions == self.index[path[-1]])
+            if not len(cut):
+                raise ValueError("The new leg must end on the line's route")
+            k = int(cut[0])
+            self._splice(line, 0, k, new_edges, positions[:k], self.edge_source[new_edges])
+
+    def extend_to(self, line_id, terminus, at='end'):
+        """Extend along the shortest path to (or from) a new terminus."""
+        route = self.route(line_id)
+        path = self.session.path(route[-1], terminus) if at == 'end' else self.session.path(terminus, route[0])
+        if path is None:
+            raise ValueError(f"No path between the line and {terminus}")
+        self.extend(line_id, path, at)
+
+    # --- metrics ---
+
+    def line_metrics(self, line_id):
+        line = self.lines[line_id]
+        return {'length_km': line.length / 1000, 'total_demand': float(line.demand), 'num_stops': line.num_stops}
+
+    def network_metrics(self):
+        return {
+            'total_lines': len(self.lines),
+            'total_network_length_km': self.total_length / 1000,
+            'unique_stops_covered': self.network_stops,
+            'total_network_demand': float(self.network_demand),
+        }
+
+
+def full_recompute(G, routes):
+    """The metrics walked from the route node lists, as the line summaries were computed before."""
+    metrics = []
+    for route in routes:
+        length = sum(min(d.get('length', 0.0) for d in G.get_edge_data(u, v).values())
+                     for u, v in zip(route, route[1:]))
+        unique = set(route)
+        metrics.append((length, sum(G.nodes[n].get('total_demand', 0.0) for n in unique),
+                        sum(1 for n in unique if G.nodes[n].get('stops'))))
+    return metrics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time delta-evaluated segment edits on a set of tram lines.")
+    parser.add_argument("--lines", default=LINES_FILE, help="JSON list of lines with route_nodes")
+    parser.add_argument("--edits", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    G = load_graph(GRAPHML_PATH)
+    if DemandStore.exists():
+        G = attach_demand(G, DemandStore.open().day_by_stop())
+    line_set = LineSet(G)
+    with open(args.lines, 'r', encoding='utf-8') as f:
+        for line in json.load(f):
+            line_set.add_line(line['line_id'], [str(node) for node in line['route_nodes']])
+
+    # Detours through a random stop, routed up front so only the edits are timed
+    rng = random.Random(args.seed)
+    stops = [n for n, d in G.nodes(data=True) if d.get('stops')]
+    line_ids = list(line_set.lines)
+    edits = []
+    while len(edits) < args.edits:
+        line_id = rng.choice(line_ids)
+        route = line_set.route(line_id)
+        i = rng.randrange(len(route) - 1)
+        j = min(len(route) - 1, i + rng.randint(5, 60))
+        via = rng.choice(stops)
+        first, second = line_set.session.path(route[i], via), line_set.session.path(via, route[j])
+        if first and second:
+            edits.append((line_id, i, j, first + second[1:], route[i:j + 1]))
+
+    # Every detour is undone right away, so the routes are back to the original after each pair
+    start = time.perf_counter()
+    for line_id, i, j, detour, original in edits:
+        line_set.replace_segment(line_id, i, j, detour)
+        line_set.replace_segment(line_id, i, i + len(detour) - 1, original)
+    elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(2 * len(edits) // 100):
+        full_recompute(G, [line_set.route(line_id) for line_id in line_ids])
+    recompute = (time.perf_counter() - start) / max(1, 2 * len(edits) // 100)
+
+    print(f"{2 * len(edits)} segment edits in {elapsed:.2f} s ({2 * len(edits) / elapsed:,.0f} edits/s); "
+          f"a full recompute of all lines takes {recompute * 1000:.2f} ms.")
+    for line_id, (length, demand, num_stops) in zip(line_ids, full_recompute(G, [line_set.route(i) for i in line_ids])):
+        metrics = line_set.line_metrics(line_id)
+        print(f"Line {line_id}: {metrics['length_km']:.3f} km (walked {length / 1000:.3f}), "
+              f"demand {metrics['total_demand']:.2f} (walked {demand:.2f}), "
+              f"{metrics['num_stops']} stops (walked {num_stops})")
+
+
+if __name__ == '__main__':
+    main()
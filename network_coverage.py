@@ -0,0 +1,324 @@
+import json
+import time
+import random
+import argparse
+import numpy as np
+from demand_store import DemandStore
+from distance_matrix import GRAPHML_PATH
+from graph_store import load_graph
+from routing import RoutingSession
+from tram_pipeline import attach_demand
+
+LINES_FILE = "tram_lines_system.json"
+STATS_FILE = "tram_system_coverage_stats.json"
+
+
+class LinePlan:
+    """One line route reduced to what coverage needs: its stop positions (each once), length in metres and name."""
+
+    def __init__(self, stops, length, name):
+        self.stops = np.asarray(stops, dtype=np.int64)
+        self.length = float(length)
+        self.name = name
+
+
+class CoverageEngine:
+    """
+    Network coverage statistics kept up to date line by line.
+
+    Per-stop service counts, per-line lengths and the demand and population covered
+    are held in arrays and running totals, so adding, removing or rerouting a line
+    only touches the stops that change (plus the buffer cells of those stops). A route
+    is reduced to a LinePlan once with plan(); the updates themselves never walk it.
+
+    Population comes either from a per-stop column (stop_population, e.g. the demand
+    store's catchment population) or from a stops × cells buffer matrix with a
+    population per cell, in which case a cell is counted once however many served
+    stops reach it.
+    """
+
+    def __init__(self, stop_nodes, stop_names, stop_demand, edge_lengths,
+                 stop_population=None, catchment=None, cell_population=None):
+        self.stop_nodes = list(stop_nodes)
+        self.stop_names = list(stop_names)
+        self.stop_of_node = {node: i for i, node in enumerate(self.stop_nodes)}
+        self.stop_demand = np.asarray(stop_demand, dtype=np.float64)
+        self.edge_lengths = edge_lengths
+        self.stop_population = None if stop_population is None else np.asarray(stop_population, dtype=np.float64)
+        self.catchment = None if catchment is None else catchment.tocsr()
+        self.cell_population = None if cell_population is None else np.asarray(cell_population, dtype=np.float64)
+        if (self.catchment is None) != (self.cell_population is None):
+            raise ValueError("catchment and cell_population must be given together")
+
+        self.lines = {}
+        self.service_count = np.zeros(len(self.stop_nodes), dtype=np.int32)
+        self._mark = np.zeros(len(self.stop_nodes), dtype=bool)  # scratch for diffing stop sets
+        self.cell_count = None if self.catchment is None else np.zeros(self.catchment.shape[1], dtype=np.int32)
+        self.total_length = 0.0
+        self.total_stops_served = 0
+        self.unique_stops = 0
+        self.covered_demand = 0.0
+        self.covered_population = 0.0
+
+    @classmethod
+    def from_graph(cls, G, population_by_stop=None, catchment=None, cell_population=None):
+        """
+        Engine over every stop node of G. Stop demand is the node's total_demand (see
+        attach_demand) and population_by_stop is a {OBJECTID: residents} dictionary
+        summed per node, like DemandStore.population_by_stop. A catchment matrix must
+        have one row per stop node in G's node order.
+        """
+        stop_nodes = [node for node, data in G.nodes(data=True) if data.get('stops')]
+        names = [G.nodes[node]['stops'][0].get('name', str(node)) for node in stop_nodes]
+        demand = [G.nodes[node].get('total_demand', 0.0) for node in stop_nodes]
+        population = None
+        if population_by_stop:
+            population = [sum(population_by_stop.get(stop.get('id'), 0.0) for stop in G.nodes[node]['stops'])
+                          for node in stop_nodes]
+
+        # Routes may follow a track in either direction; keep the shortest parallel edge
+        edge_lengths = {}
+        for u, v, length in G.edges(data='length', default=0.0):
+            for key in ((u, v), (v, u)):
+                if key not in edge_lengths or length < edge_lengths[key]:
+                    edge_lengths[key] = float(length)
+        return cls(stop_nodes, names, demand, edge_lengths, population, catchment, cell_population)
+
+    @property
+    def num_stops(self):
+        return len(self.stop_nodes)
+
+    def plan(self, route, name=None):
+        """LinePlan of a route given as graph nodes; stops are kept in the order first visited."""
+        stops, seen = [], set()
+        for node in route:
+            stop = self.stop_of_node.get(node)
+            if stop is not None and stop not in seen:
+                seen.add(stop)
+                stops.append(stop)
+        length = sum(self.edge_lengths.get(edge, 0.0) for edge in zip(route, route[1:]))
+        if name is None:
+            name = f"{self.stop_names[stops[0]]} ↔ {self.stop_names[stops[-1]]}" if stops else "Unknown"
+        return LinePlan(stops, length, name)
+
+    # --- incremental updates ---
+
+    def _catchment_cells(self, stops):
+        indptr, indices = self.catchment.indptr, self.catchment.indices
+        return np.concatenate([indices[indptr[s]:indptr[s + 1]] for s in stops.tolist()])
+
+    def _serve(self, stops):
+        if not len(stops):
+            return
+        self.service_count[stops] += 1
+        new = stops[self.service_count[stops] == 1]
+        if not len(new):
+            return
+        self.unique_stops += len(new)
+        self.covered_demand += self.stop_demand[new].sum()
+        if self.catchment is not None:
+            cells = self._catchment_cells(new)
+            fresh = np.unique(cells[self.cell_count[cells] == 0])
+            np.add.at(self.cell_count, cells, 1)
+            self.covered_population += self.cell_population[fresh].sum()
+        elif self.stop_population is not None:
+            self.covered_population += self.stop_population[new].sum()
+
+    def _unserve(self, stops):
+        if not len(stops):
+            return
+        self.service_count[stops] -= 1
+        gone = stops[self.service_count[stops] == 0]
+        if not len(gone):
+            return
+        self.unique_stops -= len(gone)
+        self.covered_demand -= self.stop_demand[gone].sum()
+        if self.catchment is not None:
+            cells = self._catchment_cells(gone)
+            np.subtract.at(self.cell_count, cells, 1)
+            lost = np.unique(cells[self.cell_count[cells] == 0])
+            self.covered_population -= self.cell_population[lost].sum()
+        elif self.stop_population is not None:
+            self.covered_population -= self.stop_population[gone].sum()
+
+    def add_line(self, line_id, plan):
+        if line_id in self.lines:
+            raise KeyError(f"Line {line_id} already exists")
+        self.lines[line_id] = plan
+        self.total_length += plan.length
+        self.total_stops_served += len(plan.stops)
+        self._serve(plan.stops)
+
+    def remove_line(self, line_id):
+        plan = self.lines.pop(line_id)
+        self.total_length -= plan.length
+        self.total_stops_served -= len(plan.stops)
+        self._unserve(plan.stops)
+        return plan
+
+    def reroute_line(self, line_id, plan):
+        """Replace a line's route; only the stops it gains or loses are updated."""
+        old = self.lines[line_id]
+        self.lines[line_id] = plan
+        self.total_length += plan.length - old.length
+        self.total_stops_served += len(plan.stops) - len(old.stops)
+        mark = self._mark
+        mark[old.stops] = True
+        gained = plan.stops[~mark[plan.stops]]
+        mark[old.stops] = False
+        mark[plan.stops] = True
+        lost = old.stops[~mark[old.stops]]
+        mark[plan.stops] = False
+        # Serve the gained stops first so a stop moving between lines never drops to zero
+        self._serve(gained)
+        self._unserve(lost)
+        return old
+
+    def copy(self):
+        """Independent engine with the same lines, sharing the read-only stop and edge data."""
+        other = object.__new__(CoverageEngine)
+        other.__dict__.update(self.__dict__)
+        other.lines = dict(self.lines)
+        other.service_count = self.service_count.copy()
+        other._mark = np.zeros_like(self._mark)
+        other.cell_count = None if self.cell_count is None else self.cell_count.copy()
+        return other
+
+    def recompute(self):
+        """Rebuild every count and total from the current lines, clearing floating-point drift."""
+        lines = self.lines
+        self.lines = {}
+        self.service_count[:] = 0
+        if self.cell_count is not None:
+            self.cell_count[:] = 0
+        self.total_length = 0.0
+        self.total_stops_served = 0
+        self.unique_stops = 0
+        self.covered_demand = 0.0
+        self.covered_population = 0.0
+        for line_id, plan in lines.items():
+            self.add_line(line_id, plan)
+
+    # --- statistics ---
+
+    @property
+    def has_population(self):
+        return self.catchment is not None or self.stop_population is not None
+
+    def stats(self):
+        """Network statistics in the layout of tram_system_coverage_stats.json."""
+        num_lines = len(self.lines)
+        stats = {
+            "total_lines": num_lines,
+            "total_network_length_km": self.total_length / 1000,
+            "total_stops_served": self.total_stops_served,
+            "unique_stops_covered": self.unique_stops,
+            "total_stops_in_network": self.num_stops,
+            "coverage_percentage": 100 * self.unique_stops / self.num_stops if self.num_stops else 0.0,
+            "total_network_demand": float(self.covered_demand),
+            "average_line_length_km": self.total_length / 1000 / num_lines if num_lines else 0.0,
+        }
+        if self.has_population:
+            stats["population_covered"] = float(self.covered_population)
+        stats["lines_summary"] = [
+            {"line_id": line_id, "route": plan.name, "length_km": plan.length / 1000, "stops": len(plan.stops)}
+            for line_id, plan in self.lines.items()
+        ]
+        return stats
+
+
+def buffer_catchment(G, stop_nodes, radius):
+    """Population hexagons and the stops × hexagons matrix of hexagons within radius of each stop node."""
+    import geopandas as gpd
+    from population_catchment import (PL2000_CRS, TOTAL_COLUMN, HEXAGON_RADIUS, load_population,
+                                      hexagon_centers, hexagon_polygons, catchment_matrix)
+    df = load_population()
+    hexagons = hexagon_polygons(*hexagon_centers(df), HEXAGON_RADIUS)
+    points = gpd.GeoSeries(gpd.points_from_xy([G.nodes[n]['x'] for n in stop_nodes],
+                                              [G.nodes[n]['y'] for n in stop_nodes]),
+                           crs="EPSG:4326").to_crs(PL2000_CRS)
+    return catchment_matrix(hexagons, points.values, radius), df[TOTAL_COLUMN].to_numpy(dtype=float)
+
+
+def benchmark(engine, G, num_updates=20000, num_routes=64, seed=0):
+    """Time random add / remove / reroute updates over a pool of shortest-path routes between stops."""
+    rng = random.Random(seed)
+    session = RoutingSession(G)
+    plans = []
+    while len(plans) < num_routes:
+        source, target = rng.sample(engine.stop_nodes, 2)
+        route = session.path(source, target)
+        if route is not None:
+            plans.append(engine.plan(route))
+
+    start = time.perf_counter()
+    next_id = 0
+    for _ in range(num_updates):
+        action = rng.random()
+        if not engine.lines or action < 0.2:
+            engine.add_line(f"b{next_id}", rng.choice(plans))
+            next_id += 1
+        elif action < 0.4:
+            engine.remove_line(rng.choice(list(engine.lines)))
+        else:
+            engine.reroute_line(rng.choice(list(engine.lines)), rng.choice(plans))
+    elapsed = time.perf_counter() - start
+
+    incremental = engine.stats()
+    engine.recompute()
+    full = engine.stats()
+    drift = abs(incremental["total_network_demand"] - full["total_network_demand"])
+    print(f"{num_updates} updates in {elapsed:.2f} s ({num_updates / elapsed:,.0f} updates/s), "
+          f"{len(engine.lines)} lines at the end, demand drift after recompute: {drift:.2e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Network coverage statistics for a set of tram lines.")
+    parser.add_argument("--lines", default=LINES_FILE, help="JSON list of lines with route_nodes")
+    parser.add_argument("-o", "--output", default=STATS_FILE)
+    parser.add_argument("--hour", type=int, help="demand of this hour (the whole day when omitted)")
+    parser.add_argument("--buffer", type=float,
+                        help="count residents of population hexagons within this many metres of a served stop "
+                             "(the demand store's per-stop population otherwise)")
+    parser.add_argument("--benchmark", type=int, metavar="UPDATES",
+                        help="time this many random line updates instead of writing the statistics")
+    args = parser.parse_args()
+
+    G = load_graph(GRAPHML_PATH)
+    stop_demand, population_by_stop = {}, None
+    if DemandStore.exists():
+        store = DemandStore.open()
+        if args.hour is not None:
+            stop_demand = store.hour_by_stop(args.hour)
+        else:
+            stop_demand = store.day_by_stop()
+        population_by_stop = store.population_by_stop()
+    G = attach_demand(G, stop_demand)
+
+    if args.buffer:
+        stop_nodes = [node for node, data in G.nodes(data=True) if data.get('stops')]
+        catchment, cell_population = buffer_catchment(G, stop_nodes, args.buffer)
+        engine = CoverageEngine.from_graph(G, catchment=catchment, cell_population=cell_population)
+    else:
+        engine = CoverageEngine.from_graph(G, population_by_stop)
+
+    with open(args.lines, 'r', encoding='utf-8') as f:
+        lines = json.load(f)
+    for line in lines:
+        route = [str(node) for node in line['route_nodes']]
+        engine.add_line(line['line_id'], engine.plan(route))
+
+    if args.benchmark:
+        benchmark(engine, G, args.benchmark)
+        return
+
+    stats = engine.stats()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+    print(f"{stats['total_lines']} lines, {stats['total_network_length_km']:.1f} km, "
+          f"{stats['unique_stops_covered']}/{stats['total_stops_in_network']} stops covered "
+          f"({stats['coverage_percentage']:.1f}%). Saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+import csv
+import sys
+import json
+import argparse
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.sparse.csgraph import dijkstra
+from graph_store import TramGraphArrays, graph_arrays_dir
+from distance_matrix import GRAPHML_PATH, routing_matrix
+from stop_assignment import StopIndex
+
+DEFAULT_CHUNK_SIZE = 50000
+
+
+# ---------------------------
+# Reading OD pairs
+# ---------------------------
+def read_od_pairs(path):
+    """
+    Stream OD records from a CSV (with a header) or JSONL file as dicts.
+    Each endpoint is given either as origin / destination (a stop id or stop name)
+    or as origin_lon, origin_lat / destination_lon, destination_lat.
+    """
+    stream = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8', newline='')
+    try:
+        if path.endswith('.csv'):
+            yield from csv.DictReader(stream)
+        else:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+
+class EndpointResolver:
+    """Turn stop ids, stop names and coordinates into graph node positions using the stop table."""
+
+    def __init__(self, graph, max_snap_distance=None):
+        self.graph = graph
+        self.max_snap_distance = max_snap_distance
+        stop_node = graph.stop_node.tolist()
+        self.by_id = dict(zip(graph.stop_id.tolist(), stop_node))
+        self.by_name = {}
+        for name, node in zip(graph.stop_name.tolist(), stop_node):
+            self.by_name.setdefault(name.casefold(), node)
+        # Coordinates snap to the nearest stop node, so every search starts at a stop
+        self.stop_nodes = np.unique(np.asarray(graph.stop_node))
+        self.index = StopIndex(np.asarray(graph.x)[self.stop_nodes], np.asarray(graph.y)[self.stop_nodes])
+
+    def resolve(self, record, prefix):
+        """Node position of one endpoint, or None when it cannot be resolved."""
+        value = record.get(prefix)
+        if isinstance(value, (list, tuple)) and len(value) == 2:
+            lon, lat = value
+        elif value not in (None, ''):
+            value = str(value).strip()
+            node = self.by_id.get(value)
+            return node if node is not None else self.by_name.get(value.casefold())
+        else:
+            lon, lat = record.get(f"{prefix}_lon"), record.get(f"{prefix}_lat")
+            if lon in (None, '') or lat in (None, ''):
+                return None
+        indices, distances = self.index.nearest([float(lon)], [float(lat)])
+        if self.max_snap_distance is not None and distances[0] > self.max_snap_distance:
+            return None
+        return int(self.stop_nodes[indices[0]])
+
+
+def group_by_origin(records, resolver, first_row=0):
+    """
+    Resolve a chunk of records and group them by origin node.
+    Returns ({origin: [(record id, destination), ...]}, [error records]).
+    """
+    groups = {}
+    errors = []
+    for row, record in enumerate(records, start=first_row):
+        pair_id = record.get('id', row)
+        origin = resolver.resolve(record, 'origin')
+        destination = resolver.resolve(record, 'destination')
+        if origin is None or destination is None:
+            missing = 'origin' if origin is None else 'destination'
+            errors.append(json.dumps({"id": pair_id, "error": f"unresolved {missing}"}, ensure_ascii=False))
+            continue
+        groups.setdefault(origin, []).append((pair_id, destination))
+    return groups, errors
+
+
+# ---------------------------
+# Workers
+# ---------------------------
+_worker = None
+
+
+def _init_worker(store_dir):
+    """Each worker memory-maps the graph arrays and builds its own routing matrix."""
+    global _worker
+    graph = TramGraphArrays.open(store_dir)
+    _worker = {
+        "matrix": routing_matrix(graph),
+        "node_ids": graph.node_ids.tolist(),
+        "stops": graph.stops_by_node(),
+    }
+
+
+def _route_group(task):
+    """One Dijkstra search from the origin answers every pair in its group; returns JSONL lines."""
+    origin, pairs = task
+    dist, pred = dijkstra(_worker["matrix"], directed=True, indices=origin, return_predecessors=True)
+    dist, pred = dist.tolist(), pred.tolist()
+    node_ids, stops = _worker["node_ids"], _worker["stops"]
+    routes = {}
+    lines = []
+    for pair_id, destination in pairs:
+        if destination not in routes:
+            # Serialise each destination's route once; repeated pairs only differ by id
+            route = {"origin": node_ids[origin], "destination": node_ids[destination]}
+            if dist[destination] == float('inf'):
+                route.update(length_m=None, path=None, stops=None)
+            else:
+                path = [destination]
+                while path[-1] != origin:
+                    path.append(pred[path[-1]])
+                path.reverse()
+                route["length_m"] = round(dist[destination], 2)
+                route["path"] = [node_ids[node] for node in path]
+                route["stops"] = [{"id": stop["id"], "name": stop["name"]}
+                                  for node in path for stop in stops.get(node, [])]
+            routes[destination] = json.dumps(route, ensure_ascii=False)[1:]
+        lines.append(f'{{"id": {json.dumps(pair_id, ensure_ascii=False)}, {routes[destination]}')
+    return lines
+
+
+def run_batch(records, out, graphml_path=GRAPHML_PATH, workers=None, chunk_size=DEFAULT_CHUNK_SIZE,
+              max_snap_distance=None):
+    """
+    Route OD records in chunks of chunk_size and write one JSON line per pair to out.
+    Only one chunk is held in memory; within a chunk pairs are grouped by origin and
+    the groups are spread across the worker pool. Returns the number of lines written.
+    """
+    store_dir = graph_arrays_dir(graphml_path)
+    resolver = EndpointResolver(TramGraphArrays.open(store_dir), max_snap_distance)
+    records = iter(records)
+    written = 0
+    row = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(store_dir,)) as pool:
+        while True:
+            chunk = list(islice(records, chunk_size))
+            if not chunk:
+                break
+            groups, errors = group_by_origin(chunk, resolver, row)
+            row += len(chunk)
+            for line in errors:
+                out.write(line + '\n')
+            for lines in pool.map(_route_group, groups.items()):
+                out.write('\n'.join(lines) + '\n')
+            written += len(chunk)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Route a file of origin-destination pairs over the tram graph.")
+    parser.add_argument("input", help="CSV or JSONL file with OD pairs ('-' reads JSONL from stdin)")
+    parser.add_argument("-o", "--output", default='-', help="JSONL output file (default: stdout)")
+    parser.add_argument("--graphml", default=GRAPHML_PATH, help="processed tram graph (its _arrays directory is used)")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="OD pairs read per chunk")
+    parser.add_argument("--max-snap-distance", type=float, default=None,
+                        help="reject coordinates farther than this (metres) from any stop")
+    args = parser.parse_args()
+
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', encoding='utf-8')
+    try:
+        written = run_batch(read_od_pairs(args.input), out, args.graphml, args.workers,
+                            args.chunk_size, args.max_snap_distance)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(f"Routed {written} OD pairs.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,18 @@
 import json
 import random
+import argparse
+import numpy as np
 import networkx as nx
 import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
 from matplotlib.widgets import Button
+from graph_store import load_graph, graph_arrays_dir, TramGraphArrays
+from distance_matrix import load_distance_matrix
+from graph_contraction import contract_graph, expand_route
+from route_query import AStarRouter, ContractionHierarchy, contraction_hierarchy_path
 
 GRAPHML_PATH = "krakow_tram_graph.graphml"
-
-def load_graph(graphml_path):
-    """
-    Load the GraphML file and process node attributes:
-    - Convert x, y coordinates to floats.
-    - Convert "stops" attribute from JSON string to list.
-    """
-    G = nx.read_graphml(graphml_path)
-
-    for node, data in G.nodes(data=True):
-        # Convert coordinate strings to float
-        if "x" in data:
-            try:
-                data["x"] = float(data["x"])
-            except Exception:
-                pass
-        if "y" in data:
-            try:
-                data["y"] = float(data["y"])
-            except Exception:
-                pass
-        # Convert "stops" from JSON string to a Python list (if exists)
-        if "stops" in data:
-            try:
-                data["stops"] = json.loads(data["stops"])
-            except Exception:
-                pass
-    return G
+MAX_VISIBLE_LABELS = 500  # stop labels are only drawn when at most this many stops are in view
 
 def get_random_stop(G):
     """
@@ -48,7 +28,15 @@ def get_random_stop(G):
     stop_name = random.choice(stops_list)
     return node_id, stop_name
 
-def compute_random_route(G):
+def compute_random_route(G, find_route=None):
+    """
+    Pick two random stops and find the shortest route between them.
+    find_route(start, end) returns the node route on G (raising nx.NetworkXNoPath);
+    by default it is a plain networkx search over G.
+    """
+    if find_route is None:
+        find_route = lambda start, end: nx.shortest_path(G, source=start, target=end, weight="length")
+
     start_node, start_stop = get_random_stop(G)
     end_node, end_stop = get_random_stop(G)
     
@@ -59,98 +47,169 @@ def compute_random_route(G):
     print(f"Randomly selected end stop: {end_stop} (node: {end_node})")
     
     try:
-        route = nx.shortest_path(G, source=start_node, target=end_node, weight="length")
+        route = find_route(start_node, end_node)
         print("Shortest path (node ids):", route)
     except nx.NetworkXNoPath:
         print("No route found between the selected stops!")
         route = None
     return route
 
-def plot_graph_ax(ax, G, route=None):
+def make_route_finder(G, router="ch"):
     """
-    Plot the tram network graph on the given axis.
-    Draw nodes, edges and, if a route is provided, highlight it.
-    Additionally, stop nodes are plotted in green and annotates stop names.
+    Build find_route for compute_random_route:
+    - "ch": contraction hierarchy on the contracted graph, saved next to the GraphML
+    - "astar": A* with a great-circle heuristic on the contracted graph
+    - "matrix": lookups in the precomputed stop distance matrix
+    - "networkx": plain nx.shortest_path on G
     """
-    pos = {}
-    for node, data in G.nodes(data=True):
-        if "x" in data and "y" in data:
-            pos[node] = (data["x"], data["y"])
-
-    ax.clear()
-
-    # Plot all nodes in blue.
-    all_x = [coord[0] for coord in pos.values()]
-    all_y = [coord[1] for coord in pos.values()]
-    ax.scatter(all_x, all_y, s=10, c='blue', alpha=0.6)
-
-    # Plot all edges.
-    for u, v in G.edges():
-        if u in pos and v in pos:
-            x_vals = [pos[u][0], pos[v][0]]
-            y_vals = [pos[u][1], pos[v][1]]
-            ax.plot(x_vals, y_vals, color='gray', alpha=0.5)
-
-    # Highlight the route if provided.
-    if route is not None and len(route) > 0:
-        route_x = [pos[node][0] for node in route if node in pos]
-        route_y = [pos[node][1] for node in route if node in pos]
-        ax.scatter(route_x, route_y, s=30, c='red')
-        for i in range(len(route) - 1):
-            u = route[i]
-            v = route[i + 1]
-            if u in pos and v in pos:
-                x_vals = [pos[u][0], pos[v][0]]
-                y_vals = [pos[u][1], pos[v][1]]
-                ax.plot(x_vals, y_vals, color='red', linewidth=2)
-
-    # Optionally annotate nodes with stops info from JSON.
-    for node, data in G.nodes(data=True):
-        if "stops" in data and data["stops"]:
-            # Plot a bigger green dot at the node if stops exist.
-            if node in pos:
-                ax.scatter(pos[node][0], pos[node][1], s=40, c='green', zorder=4)
-                
-            if isinstance(data["stops"], list):
-                stops = data["stops"]
-            else:
+    if router == "networkx":
+        return None
+    if router == "matrix":
+        distances = load_distance_matrix(GRAPHML_PATH)
+
+        def find_route(start, end):
+            route = distances.route(start, end)
+            if route is None:
+                raise nx.NetworkXNoPath()
+            return [str(node) for node in route]
+        return find_route
+
+    # Routes are searched on the contracted graph; stops and switches are kept
+    R = contract_graph(G)
+    print(f"Contracted routing graph: {R.number_of_nodes()} of {G.number_of_nodes()} nodes.")
+    if router == "astar":
+        engine = AStarRouter(R)
+    else:
+        engine = ContractionHierarchy.load_or_build(R, contraction_hierarchy_path(GRAPHML_PATH))
+    return lambda start, end: expand_route(R, engine.shortest_path(start, end))
+
+class NetworkView:
+    """
+    The tram network drawn once on an axis, with a route overlay that can be swapped.
+    Edges are one LineCollection, nodes and stops one scatter each and the stop labels
+    are drawn with the static layers; all of it is cached as a bitmap after every full
+    draw. A new route only restores that bitmap and draws the two overlay artists.
+    Labels outside the view are hidden on every zoom or pan, so a full draw only lays
+    out the text that can be seen, and none at all on a view with too many stops.
+    """
+
+    def __init__(self, ax, G):
+        self.ax = ax
+        self.pos = {node: (data["x"], data["y"]) for node, data in G.nodes(data=True)
+                    if "x" in data and "y" in data}
+        ax.clear()
+
+        # Static layers: all edges in gray, all nodes in blue, stop nodes in green.
+        segments = [(self.pos[u], self.pos[v]) for u, v in G.edges() if u in self.pos and v in self.pos]
+        ax.add_collection(LineCollection(segments, colors='gray', alpha=0.5, zorder=1))
+        xy = np.array(list(self.pos.values()), dtype=float).reshape(-1, 2)
+        ax.scatter(xy[:, 0], xy[:, 1], s=10, c='blue', alpha=0.6, zorder=2)
+
+        stop_xy, labels = [], []
+        for node, data in G.nodes(data=True):
+            if not data.get("stops") or node not in self.pos:
+                continue
+            stops = data["stops"]
+            if not isinstance(stops, list):
                 try:
-                    stops = json.loads(data["stops"])
+                    stops = json.loads(stops)
                 except json.JSONDecodeError:
                     print(f"Node {node}: invalid JSON in stops.")
                     continue
-            # Annotate each stop's name near the node.
-            if node in pos:
-                for i, stop in enumerate(stops):
-                    stop_name = f"{stop.get("name", "")} ({stop.get("id", "unknown")})"
-                    ax.annotate(stop_name,
-                                (pos[node][0], pos[node][1]),
-                                fontsize=8,
-                                color='darkgreen')
-
-    ax.set_title("Tram Network with Highlighted Route")
-    ax.axis("off")
+            stop_xy.append(self.pos[node])
+            labels.extend((self.pos[node], f"{stop.get('name', '')} ({stop.get('id', 'unknown')})") for stop in stops)
+        stop_xy = np.array(stop_xy, dtype=float).reshape(-1, 2)
+        ax.scatter(stop_xy[:, 0], stop_xy[:, 1], s=40, c='green', zorder=4)
+        # Annotate each stop's name near the node.
+        self.labels = [ax.text(x, y, label, fontsize=8, color='darkgreen') for (x, y), label in labels]
+        self.label_xy = np.array([xy for xy, _ in labels], dtype=float).reshape(-1, 2)
+
+        # The route overlay is animated: left out of full draws and blitted on top of the cache.
+        self.route_line, = ax.plot([], [], color='red', linewidth=2, zorder=5, animated=True)
+        self.route_points = ax.scatter([], [], s=30, c='red', zorder=5, animated=True)
+        ax.autoscale_view()
+        ax.set_title("Tram Network with Highlighted Route")
+        ax.axis("off")
+
+        self.background = None
+        ax.figure.canvas.mpl_connect('draw_event', self._on_draw)
+        ax.callbacks.connect('xlim_changed', self._cull_labels)
+        ax.callbacks.connect('ylim_changed', self._cull_labels)
+        self._cull_labels(ax)
+
+    def _cull_labels(self, ax):
+        (x0, x1), (y0, y1) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+        x, y = self.label_xy[:, 0], self.label_xy[:, 1]
+        inside = (x >= x0) & (x <= x1) & (y >= y0) & (y <= y1)
+        if inside.sum() > MAX_VISIBLE_LABELS:
+            inside[:] = False
+        for text, visible in zip(self.labels, inside.tolist()):
+            if text.get_visible() != visible:
+                text.set_visible(visible)
+
+    def _on_draw(self, event):
+        # A full draw (first show, resize, zoom) refreshes the cached static layers
+        canvas = self.ax.figure.canvas
+        if canvas.supports_blit:
+            self.background = canvas.copy_from_bbox(self.ax.bbox)
+        self._draw_route()
+
+    def _draw_route(self):
+        self.ax.draw_artist(self.route_line)
+        self.ax.draw_artist(self.route_points)
+
+    def set_route(self, route):
+        """Show route (a node list, or None for no route); only the overlay is redrawn."""
+        coords = [self.pos[node] for node in route or [] if node in self.pos]
+        xy = np.array(coords, dtype=float).reshape(-1, 2)
+        self.route_line.set_data(xy[:, 0], xy[:, 1])
+        self.route_points.set_offsets(xy)
+
+        canvas = self.ax.figure.canvas
+        if self.background is None:
+            canvas.draw_idle()
+            return
+        canvas.restore_region(self.background)
+        self._draw_route()
+        canvas.blit(self.ax.bbox)
+
+def plot_graph_ax(ax, G, route=None):
+    """
+    Plot the tram network graph on the given axis and highlight route if provided.
+    Returns the NetworkView, whose set_route swaps the highlighted route.
+    """
+    view = NetworkView(ax, G)
+    view.set_route(route)
+    return view
 
 def main():
+    parser = argparse.ArgumentParser(description="Interactive random route viewer.")
+    parser.add_argument("--router", choices=["ch", "astar", "matrix", "networkx"], default="ch",
+                        help="route query engine")
+    args = parser.parse_args()
+
     G = load_graph(GRAPHML_PATH)
     print("Graph loaded successfully.")
+    # The distance matrix needs the binary graph arrays; fall back to the hierarchy without them
+    router = args.router
+    if router == "matrix" and not TramGraphArrays.exists(graph_arrays_dir(GRAPHML_PATH)):
+        router = "ch"
+    find_route = make_route_finder(G, router)
     
     # Create the initial figure and axis for the graph plot.
     fig, ax = plt.subplots(figsize=(12, 12))
     plt.subplots_adjust(bottom=0.2)
     
     # Compute and plot the initial random route.
-    route = compute_random_route(G)
-    plot_graph_ax(ax, G, route)
+    route = compute_random_route(G, find_route)
+    view = plot_graph_ax(ax, G, route)
     
     # Add a button for generating a new random route.
     button_ax = plt.axes([0.4, 0.05, 0.2, 0.075])
     button = Button(button_ax, 'New Route')
     
     def update_route(event):
-        new_route = compute_random_route(G)
-        plot_graph_ax(ax, G, new_route)
-        plt.draw()
+        view.set_route(compute_random_route(G, find_route))
     
     button.on_clicked(update_route)
     plt.show()
@@ -0,0 +1,295 @@
+import os
+import json
+import math
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# --- Base weights for the POI categories ---
+BASE_CATEGORY_WEIGHTS = {
+    "schools": 1.5,
+    "universities": 2.0,
+    "museums": 1.8,
+    "theaters": 1.8,
+    "shops": 1.0,
+    "bars": 1.4,
+    "train_stations": 4.5,
+    "bus_stations": 1.5,
+    "hospitals": 3.0,
+    "restaurants": 1.3,
+    "pharmacies": 1.0,
+    "libraries": 1.2,
+    "churches": 1.0,
+    "parks": 1.8,
+    "cinemas": 1.5,
+    "post_offices": 4.0,
+    "police_stations": 1.6
+}
+
+DEFAULT_WEIGHT = 0.5  # Weight for categories not explicitly listed
+
+# Only bars follow the night curve; every other listed category follows the day curve
+NIGHT_AFFECTED_CATEGORIES = {"bars"}
+
+# Floor for multipliers that the curves push below zero
+MIN_MULTIPLIER = 0.001
+
+MINUTES_PER_DAY = 24 * 60
+
+
+def day_demand_function_chart(x_input):
+    #  y=-0.5 (x^(2)-1.5) (x^(2)+0.8)
+    # <-1.2;1.2>
+    x_prime = -1.2 + (2.4 * x_input / 23)
+    y_value = -0.5 * (x_prime**2 - 1.5) * (x_prime**2 + 0.8)
+    return y_value
+
+
+def night_demand_function_chart(x_input):
+    # y=(((x)/(2)))^(2) + 0.2
+    # <-1.2;1.2>
+    x_prime = -1.2 + (2.4 * x_input / 23) + 0.4
+    y_value = ((x_prime/2)**2)
+    return y_value
+
+
+def clamp_multiplier(multiplier):
+    """Negative multipliers become MIN_MULTIPLIER, as in the original animation."""
+    return np.where(multiplier < 0, MIN_MULTIPLIER, multiplier)
+
+
+# ---------------------------
+# Time slices
+# ---------------------------
+def slice_minutes(step_minutes=60):
+    """Start of every time slice of a day, in minutes after midnight."""
+    if step_minutes <= 0 or MINUTES_PER_DAY % step_minutes:
+        raise ValueError(f"step_minutes must divide a day evenly, got {step_minutes}")
+    return np.arange(0, MINUTES_PER_DAY, step_minutes)
+
+
+def slice_label(minute, step_minutes=60):
+    """File label of a slice: 'hour_HH' for hourly data (the historical names), 'time_HHMM' otherwise."""
+    hour, minute = divmod(int(minute), 60)
+    if step_minutes == 60:
+        return f"hour_{hour:02d}"
+    return f"time_{hour:02d}{minute:02d}"
+
+
+def hexbin_filename(hexbin_dir, minute, step_minutes=60):
+    return os.path.join(hexbin_dir, f"hexbin_{slice_label(minute, step_minutes)}.json")
+
+
+# ---------------------------
+# Reading POIs
+# ---------------------------
+def feature_category(properties, categories=BASE_CATEGORY_WEIGHTS):
+    """Category of a feature from its 'amenity', 'shop' or 'category' property, None if unknown."""
+    for key in ("amenity", "shop", "category"):
+        if properties.get(key) in categories:
+            return properties[key]
+    return None
+
+
+def load_poi_points(geojson_file):
+    """
+    Read point POIs from a GeoJSON FeatureCollection (or single Feature).
+    Returns (longitudes, latitudes, categories) with None for unknown categories.
+    """
+    with open(geojson_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    if data.get("type") == "FeatureCollection":
+        features = data.get("features", [])
+    elif data.get("type") == "Feature":
+        features = [data]
+    else:
+        raise ValueError("Unsupported GeoJSON format")
+
+    longitudes, latitudes, categories = [], [], []
+    for feature in features:
+        geometry = feature.get("geometry")
+        if not geometry or geometry.get("type") != "Point":
+            continue
+        coordinates = geometry.get("coordinates")
+        if coordinates and len(coordinates) >= 2:
+            longitudes.append(coordinates[0])
+            latitudes.append(coordinates[1])
+            categories.append(feature_category(feature.get("properties") or {}))
+    return np.array(longitudes, dtype=float), np.array(latitudes, dtype=float), categories
+
+
+# ---------------------------
+# Hexagonal grid
+# ---------------------------
+def _nonsingular(vmin, vmax, expander=0.1, tiny=1e-15):
+    """Expand a degenerate [vmin, vmax] range the same way matplotlib does."""
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        return -expander, expander
+    vmin, vmax = float(min(vmin, vmax)), float(max(vmin, vmax))
+    maxabsvalue = max(abs(vmin), abs(vmax))
+    if maxabsvalue < (1e6 / tiny) * np.finfo(float).tiny:
+        return -expander, expander
+    if vmax - vmin <= maxabsvalue * tiny:
+        if vmax == 0 and vmin == 0:
+            return -expander, expander
+        return vmin - expander * abs(vmin), vmax + expander * abs(vmax)
+    return vmin, vmax
+
+
+class HexGrid:
+    """
+    Hexagonal grid laid out exactly like matplotlib's Axes.hexbin: two interleaved
+    rectangular lattices of (nx + 1) × (ny + 1) and nx × ny centres spanning the
+    extent, where nx = gridsize and ny = int(nx / sqrt(3)). Cell ids follow hexbin's
+    ordering, so per-cell values line up with the offsets of a hexbin collection.
+    """
+
+    def __init__(self, xmin, xmax, ymin, ymax, gridsize=50):
+        self.gridsize = gridsize
+        self.nx = gridsize
+        self.ny = int(gridsize / math.sqrt(3))
+        # In the x-direction the hexagons exactly cover the extent; pad against round-off
+        padding = 1.e-9 * (xmax - xmin)
+        self.xmin = xmin - padding
+        self.xmax = xmax + padding
+        self.ymin = ymin
+        self.ymax = ymax
+        self.sx = (self.xmax - self.xmin) / self.nx
+        self.sy = (self.ymax - self.ymin) / self.ny
+
+    @classmethod
+    def from_points(cls, x, y, gridsize=50):
+        """Grid spanning the points, as hexbin builds it when no extent is given."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        xmin, xmax = (x.min(), x.max()) if len(x) else (0, 1)
+        ymin, ymax = (y.min(), y.max()) if len(y) else (0, 1)
+        xmin, xmax = _nonsingular(xmin, xmax)
+        ymin, ymax = _nonsingular(ymin, ymax)
+        return cls(xmin, xmax, ymin, ymax, gridsize)
+
+    @property
+    def num_cells(self):
+        return (self.nx + 1) * (self.ny + 1) + self.nx * self.ny
+
+    def cell_index(self, x, y):
+        """Cell id of every point, -1 for points outside the grid."""
+        ix = (np.asarray(x, dtype=float) - self.xmin) / self.sx
+        iy = (np.asarray(y, dtype=float) - self.ymin) / self.sy
+        ix1 = np.round(ix).astype(int)
+        iy1 = np.round(iy).astype(int)
+        ix2 = np.floor(ix).astype(int)
+        iy2 = np.floor(iy).astype(int)
+        nx1, ny1 = self.nx + 1, self.ny + 1
+        i1 = np.where((0 <= ix1) & (ix1 < nx1) & (0 <= iy1) & (iy1 < ny1), ix1 * ny1 + iy1, -1)
+        i2 = np.where((0 <= ix2) & (ix2 < self.nx) & (0 <= iy2) & (iy2 < self.ny),
+                      nx1 * ny1 + ix2 * self.ny + iy2, -1)
+        d1 = (ix - ix1) ** 2 + 3.0 * (iy - iy1) ** 2
+        d2 = (ix - ix2 - 0.5) ** 2 + 3.0 * (iy - iy2 - 0.5) ** 2
+        return np.where(d1 < d2, i1, i2)
+
+    def centers(self):
+        """(num_cells, 2) array of cell centres."""
+        nx1, ny1 = self.nx + 1, self.ny + 1
+        offsets = np.zeros((self.num_cells, 2), float)
+        offsets[:nx1 * ny1, 0] = np.repeat(np.arange(nx1), ny1)
+        offsets[:nx1 * ny1, 1] = np.tile(np.arange(ny1), nx1)
+        offsets[nx1 * ny1:, 0] = np.repeat(np.arange(self.nx) + 0.5, self.ny)
+        offsets[nx1 * ny1:, 1] = np.tile(np.arange(self.ny), self.nx) + 0.5
+        offsets[:, 0] = offsets[:, 0] * self.sx + self.xmin
+        offsets[:, 1] = offsets[:, 1] * self.sy + self.ymin
+        return offsets
+
+
+# ---------------------------
+# Demand
+# ---------------------------
+class PoiDemandModel:
+    """
+    Hourly POI demand per hex cell. Every POI is mapped to a category index and a cell
+    once, giving a sparse cell × category count matrix; the day/night curves become a
+    category × hour weight matrix, and one sparse product yields cell × hour demand.
+    Categories outside base_weights share one 'other' column weighted by default_weight
+    and unaffected by the curves.
+    """
+
+    def __init__(self, lon, lat, categories, grid, base_weights=BASE_CATEGORY_WEIGHTS,
+                 default_weight=DEFAULT_WEIGHT, night_categories=NIGHT_AFFECTED_CATEGORIES, mincnt=1):
+        self.grid = grid
+        self.base_weights = base_weights
+        self.default_weight = default_weight
+        self.night_categories = night_categories
+        self.category_names = list(base_weights)
+        category_index = {name: i for i, name in enumerate(self.category_names)}
+        other = len(self.category_names)
+        codes = np.array([category_index.get(c, other) for c in categories], dtype=np.int64)
+
+        cells = grid.cell_index(lon, lat)
+        inside = cells >= 0
+        counts = csr_matrix((np.ones(int(inside.sum())), (cells[inside], codes[inside])),
+                            shape=(grid.num_cells, other + 1))
+        # Like hexbin's mincnt: only cells holding at least mincnt POIs are reported
+        occupied = np.asarray(counts.sum(axis=1)).ravel() >= mincnt
+        self.cells = np.flatnonzero(occupied)
+        self.counts = counts[self.cells]
+
+    def weight_matrix(self, hours):
+        """
+        (categories + 1) × times matrix of base weight × time multiplier.
+        Times are hours of the day and may be fractional (e.g. 7.25 for 07:15).
+        """
+        hours = np.asarray(hours, dtype=float)
+        day = clamp_multiplier(day_demand_function_chart(hours))
+        night = clamp_multiplier(night_demand_function_chart(hours))
+        rows = [self.base_weights[name] * (night if name in self.night_categories else day)
+                for name in self.category_names]
+        rows.append(np.full(len(hours), self.default_weight))
+        return np.vstack(rows)
+
+    def demand(self, hours=range(24)):
+        """Cells × hours demand matrix for the occupied cells."""
+        return np.asarray(self.counts @ self.weight_matrix(hours))
+
+    def iter_slices(self, minutes):
+        """
+        Yield (minute, cell demand vector) one time slice at a time, so a whole day at a
+        fine resolution never has to be held in memory at once.
+        """
+        for minute in minutes:
+            yield minute, self.demand([minute / 60])[:, 0]
+
+    def cell_centers(self):
+        """(longitude, latitude) centres of the occupied cells."""
+        return self.grid.centers()[self.cells]
+
+
+def write_hexbin_json(filename, centers, values):
+    """Write one hour of cell demand in the poi_demand_time/hexbin_hour_XX.json layout."""
+    hex_data = [{"longitude": lon, "latitude": lat, "demand": demand}
+                for (lon, lat), demand in zip(centers.tolist(), np.asarray(values).tolist())]
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    with open(filename, 'w', encoding='utf-8') as f:
+        json.dump(hex_data, f, indent=4)
+
+
+def write_demand_npz(filename, centers, slices, minutes, gridsize):
+    """
+    Write every time slice of cell demand into one compressed .npz: longitude / latitude of
+    the cell centres (float64), demand as a float32 cells × slices matrix, the slice start
+    minutes and gridsize. slices is an iterable of (minute, vector); they are collected in
+    a temporary memory-mapped file, so only one slice is in memory at a time.
+    """
+    out_dir = os.path.dirname(filename) or '.'
+    os.makedirs(out_dir, exist_ok=True)
+    scratch = os.path.join(out_dir, ".hexbin_demand.npy")
+    demand = np.lib.format.open_memmap(scratch, mode='w+', dtype=np.float32,
+                                       shape=(len(centers), len(minutes)))
+    try:
+        for column, (_, values) in enumerate(slices):
+            demand[:, column] = values
+        demand.flush()
+        np.savez_compressed(filename, longitude=centers[:, 0], latitude=centers[:, 1], demand=demand,
+                            minutes=np.asarray(minutes), gridsize=np.array(gridsize))
+    finally:
+        del demand
+        os.remove(scratch)
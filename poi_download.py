@@ -0,0 +1,226 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+import unicodedata
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import geopandas as gpd
+import osmnx as ox
+from shapely.geometry import shape
+
+PLACE_NAME = "Kraków, Poland"
+CACHE_FOLDER = "cache"
+
+# Overpass serves two concurrent queries per client by default
+DEFAULT_MAX_WORKERS = 2
+
+POI_TAGS = {
+    "schools": {"amenity": "school"},
+    "universities": {"amenity": "university"},
+    "museums": {"tourism": "museum"},
+    "theaters": {"amenity": "theatre"},
+    "shops": {"shop": ["supermarket", "retail", "bakery", "clothes", "electronics"]}, # Expanded shop types
+    "bars": {"amenity": "bar"},
+    "train_stations": {"railway": "station"},
+    "bus_stations": {"amenity": "bus_station"},
+    "hospitals": {"amenity": "hospital"},
+    "restaurants": {"amenity": "restaurant"},
+    "pharmacies": {"amenity": "pharmacy"},
+    "libraries": {"amenity": "library"},
+    "churches": {"amenity": "place_of_worship", "religion": "christian"},
+    "parks": {"leisure": "park"},
+    "cinemas": {"amenity": "cinema"},
+    "post_offices": {"amenity": "post_office"},
+    "police_stations": {"amenity": "police"}
+}
+
+
+def _values(value):
+    return [value] if isinstance(value, str) else list(value)
+
+
+def merge_tag_queries(category_tags, num_queries=1):
+    """
+    Merge the per-category tag filters into at most num_queries osmnx tag dicts.
+    Values are first merged per OSM key (every amenity=* category becomes one
+    {"amenity": [...]} filter, True anywhere stays True), then the keys are spread
+    over the queries so each carries a similar number of filters.
+    """
+    merged = {}
+    for tags in category_tags.values():
+        for key, value in tags.items():
+            if value is True or merged.get(key) is True:
+                merged[key] = True
+            else:
+                merged.setdefault(key, set()).update(_values(value))
+
+    def size(key):
+        return float('inf') if merged[key] is True else len(merged[key])
+
+    queries = [{} for _ in range(max(1, min(num_queries, len(merged))))]
+    for key in sorted(merged, key=lambda k: (-size(k), k)):
+        query = min(queries, key=lambda q: sum(size(k) for k in q))
+        query[key] = True if merged[key] is True else sorted(merged[key])
+    return queries
+
+
+def category_mask(gdf, tags):
+    """Rows matching any of the category's tag filters (the OR semantics osmnx uses)."""
+    mask = pd.Series(False, index=gdf.index)
+    for key, value in tags.items():
+        if key not in gdf.columns:
+            continue
+        if value is True:
+            mask |= gdf[key].notna()
+        else:
+            mask |= gdf[key].isin(_values(value))
+    return mask
+
+
+def split_by_category(gdf, category_tags):
+    """Split one merged features GeoDataFrame back into {category: GeoDataFrame} with a 'category' column."""
+    categories = {}
+    for category, tags in category_tags.items():
+        subset = gdf[category_mask(gdf, tags)].dropna(axis="columns", how="all").copy()
+        subset['category'] = category
+        categories[category] = subset
+    return categories
+
+
+def _fetch(polygon, tags):
+    try:
+        return ox.features_from_polygon(polygon, tags)
+    except ValueError:  # osmnx's InsufficientResponseError: no feature matched
+        return None
+
+
+def cached_overpass_elements(cache_folder=CACHE_FOLDER):
+    """Every element of the Overpass responses stored in the osmnx cache, deduplicated by type and id."""
+    elements = {}
+    for filename in sorted(os.listdir(cache_folder)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(cache_folder, filename), 'r', encoding='utf-8') as f:
+            response = json.load(f)
+        if isinstance(response, dict):
+            for element in response.get("elements", []):
+                elements.setdefault((element["type"], element["id"]), element)
+    return list(elements.values())
+
+
+def write_osm_xml(elements, filepath):
+    """Write Overpass JSON elements (nodes, ways, relations with tags) as an OSM XML file."""
+    root = ET.Element("osm", version="0.6", generator="poi_download")
+    for element in elements:
+        attrs = {"id": str(element["id"])}
+        if element["type"] == "node":
+            attrs.update(lat=repr(element["lat"]), lon=repr(element["lon"]))
+        node = ET.SubElement(root, element["type"], attrs)
+        for ref in element.get("nodes", []):
+            ET.SubElement(node, "nd", ref=str(ref))
+        for member in element.get("members", []):
+            ET.SubElement(node, "member", type=member["type"], ref=str(member["ref"]), role=member.get("role", ""))
+        for key, value in element.get("tags", {}).items():
+            ET.SubElement(node, "tag", k=key, v=str(value))
+    ET.ElementTree(root).write(filepath, encoding="utf-8", xml_declaration=True)
+
+
+def features_from_cache(polygon, tags, cache_folder=CACHE_FOLDER):
+    """
+    Features matching tags within polygon, built from the cached Overpass responses
+    only. osmnx parses raw responses solely through features_from_xml, so the cached
+    elements are written to a temporary OSM XML file first. None when nothing matches.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        filepath = os.path.join(tmp, "cache.osm")
+        write_osm_xml(cached_overpass_elements(cache_folder), filepath)
+        try:
+            return ox.features_from_xml(filepath, polygon=polygon, tags=tags)
+        except ValueError:
+            return None
+
+
+def _place_key(name):
+    """First component of a place name, without accents or case ("Kraków, Poland" -> "krakow")."""
+    name = unicodedata.normalize('NFKD', name.split(',')[0].strip())
+    return ''.join(c for c in name if not unicodedata.combining(c)).casefold()
+
+
+def cached_place_polygon(place, cache_folder=CACHE_FOLDER):
+    """
+    Boundary polygon of place from the Nominatim responses stored in the osmnx cache,
+    picking the first (Multi)Polygon result whose name matches the place, like
+    ox.geocode_to_gdf does online. Raises ValueError when the place was never geocoded.
+    """
+    key = _place_key(place)
+    for filename in sorted(os.listdir(cache_folder)):
+        if not filename.endswith('.json'):
+            continue
+        with open(os.path.join(cache_folder, filename), 'r', encoding='utf-8') as f:
+            response = json.load(f)
+        if not isinstance(response, list):
+            continue
+        for result in response:
+            geojson = result.get("geojson", {})
+            if geojson.get("type") not in ("Polygon", "MultiPolygon"):
+                continue
+            names = (result.get("name", ""), result.get("display_name", ""))
+            if key in (_place_key(name) for name in names):
+                return shape(geojson)
+    raise ValueError(f"No cached geocoder response for '{place}' in {cache_folder}; pass polygon explicitly")
+
+
+def download_pois(category_tags=POI_TAGS, place=PLACE_NAME, max_workers=DEFAULT_MAX_WORKERS,
+                  offline=False, cache_folder=CACHE_FOLDER, polygon=None):
+    """
+    Download POIs for every category with as few Overpass queries as possible:
+    the place is geocoded once, the categories are merged into max_workers queries
+    that run side by side on a bounded thread pool (one round-trip of wall time),
+    and the merged result is split back into categories locally. With offline=True
+    nothing is requested; the features are rebuilt from the Overpass responses
+    already in cache_folder and the place boundary, unless polygon is given, from
+    the cached geocoder response.
+    Returns {category: GeoDataFrame}; categories without matches get an empty frame.
+    """
+    ox.settings.use_cache = True
+    ox.settings.cache_folder = cache_folder
+    if polygon is None:
+        polygon = cached_place_polygon(place, cache_folder) if offline else ox.geocode_to_gdf(place).geometry.iloc[0]
+    queries = merge_tag_queries(category_tags, max_workers)
+    all_tags = {key: value for query in queries for key, value in query.items()}
+
+    if offline:
+        results = [features_from_cache(polygon, all_tags, cache_folder)]
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(lambda tags: _fetch(polygon, tags), queries))
+
+    results = [gdf for gdf in results if gdf is not None and not gdf.empty]
+    if not results:
+        combined = gpd.GeoDataFrame(geometry=[], crs=ox.settings.default_crs)
+    else:
+        combined = pd.concat(results)
+        combined = combined[~combined.index.duplicated(keep='first')]
+    return split_by_category(combined, category_tags)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download POIs for every category with merged Overpass queries.")
+    parser.add_argument("--place", default=PLACE_NAME)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent Overpass queries")
+    parser.add_argument("--offline", action="store_true", help="replay the responses in the cache folder only")
+    parser.add_argument("--cache-folder", default=CACHE_FOLDER)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    pois = download_pois(POI_TAGS, args.place, args.workers, args.offline, args.cache_folder)
+    for category, gdf in pois.items():
+        print(f"{category}: {len(gdf)} features")
+    print(f"Done in {time.perf_counter() - start:.1f} s.")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,58 +1,34 @@
-import os
+import argparse
 import matplotlib.pyplot as plt
 import pandas as pd
-import numpy as np
-import osmnx as ox
-import geopandas as gpd
+from poi_download import PLACE_NAME, POI_TAGS, DEFAULT_MAX_WORKERS, download_pois
 
 
+parser = argparse.ArgumentParser(description="Download and plot Points of Interest (POIs).")
+parser.add_argument("--offline", action="store_true",
+                    help="rebuild the POIs from the cached Overpass responses without any network access")
+parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS, help="concurrent Overpass queries")
+args = parser.parse_args()
+
 # Define the place for which to download and plot POIs
-place_name = "Kraków, Poland"
-
-tags = {
-    "schools": {"amenity": "school"},
-    "universities": {"amenity": "university"},
-    "museums": {"tourism": "museum"},
-    "theaters": {"amenity": "theatre"},
-    "shops": {"shop": ["supermarket", "retail", "bakery", "clothes", "electronics"]}, # Expanded shop types
-    "bars": {"amenity": "bar"},
-    "train_stations": {"railway": "station"},
-    "bus_stations": {"amenity": "bus_station"},
-    "hospitals": {"amenity": "hospital"},
-    "restaurants": {"amenity": "restaurant"},
-    "pharmacies": {"amenity": "pharmacy"},
-    "libraries": {"amenity": "library"},
-    "churches": {"amenity": "place_of_worship", "religion": "christian"},
-    "parks": {"leisure": "park"},
-    "cinemas": {"amenity": "cinema"},
-    "post_offices": {"amenity": "post_office"},
-    "police_stations": {"amenity": "police"}
-}
+place_name = PLACE_NAME
 
-print(f"Preparing to download Points of Interest (POIs) for {place_name}...")
+tags = POI_TAGS
 
-# Initialize an empty dictionary to store GeoDataFrames for each POI category.
-# GeoDataFrames are used to handle geospatial data (points, lines, polygons) with attributes.
-all_pois_gdfs = {}
+print(f"Preparing to download Points of Interest (POIs) for {place_name}...")
 
-# Iterate through each category and its corresponding OSM tags to download data.
-for category, tag_dict in tags.items():
-    print(f"Downloading {category} data...")
-    try:
-        # Use osmnx.features_from_place to query OpenStreetMap for features
-        # within the specified place that match the given tags.
-        gdf = ox.features_from_place(place_name, tag_dict)
+# The categories are merged into a few Overpass queries (one per worker) that run concurrently,
+# the place is geocoded once, and the features are split back into categories locally.
+downloaded = download_pois(tags, place_name, max_workers=args.workers, offline=args.offline)
 
-        if not gdf.empty:
-            # Add a 'category' column to the GeoDataFrame to easily identify the type of POI.
-            gdf['category'] = category
-            all_pois_gdfs[category] = gdf
-            print(f"Successfully downloaded {len(gdf)} {category} features.")
-        else:
-            print(f"No {category} features found for {place_name}.")
-    except Exception as e:
-        # Catch and print any errors that occur during the download process.
-        print(f"Error downloading {category}: {e}")
+# Dictionary of GeoDataFrames for each POI category that has any features.
+all_pois_gdfs = {}
+for category, gdf in downloaded.items():
+    if not gdf.empty:
+        all_pois_gdfs[category] = gdf
+        print(f"Successfully downloaded {len(gdf)} {category} features.")
+    else:
+        print(f"No {category} features found for {place_name}.")
 
 print("All POI data downloads complete.")
 
@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import shapely
+from scipy.sparse import csr_matrix
+
+POPULATION_FILE = "ludnosc_dane.xlsx"
+PL2000_CRS = "EPSG:2178"  # PL-2000 Zone 3, the projection of the population grid
+
+PERMANENT_COLUMN = "Liczba osób zameldowanych na stałe"
+TEMPORARY_COLUMN = "Liczba osób zameldowanych czasowo"
+TOTAL_COLUMN = "Liczba mieszkańców"
+X_COLUMN = "Współrzędna X (układ PL-2000)"
+Y_COLUMN = "Współrzędna Y (układ PL-2000)"
+
+HEXAGON_RADIUS = 250            # metres from a hexagon centre to each vertex
+DEFAULT_CATCHMENT_RADIUS = 500  # metres of walking distance to a stop
+
+
+def load_population(xlsx_file=POPULATION_FILE):
+    """Read the population grid and add the total residents (permanent plus temporary)."""
+    df = pd.read_excel(xlsx_file)
+    df[TOTAL_COLUMN] = df[PERMANENT_COLUMN] + df[TEMPORARY_COLUMN]
+    return df
+
+
+def hexagon_centers(df):
+    """
+    Hexagon centres in PL-2000 metres. The grid's X column is the northing, so the
+    Y column is used as the x coordinate.
+    """
+    return df[Y_COLUMN].to_numpy(dtype=float), df[X_COLUMN].to_numpy(dtype=float)
+
+
+def hexagon_polygons(cx, cy, radius=HEXAGON_RADIUS):
+    """
+    Regular hexagons with a vertex every 60° starting at 0°, built for all centres at once
+    from an (n, 6, 2) vertex array with shapely's bulk constructor.
+    """
+    angles = np.radians(60 * np.arange(6))
+    vertices = np.empty((len(cx), 6, 2))
+    vertices[:, :, 0] = np.asarray(cx)[:, None] + radius * np.cos(angles)
+    vertices[:, :, 1] = np.asarray(cy)[:, None] + radius * np.sin(angles)
+    return shapely.polygons(vertices)
+
+
+def catchment_pairs(hexagons, stop_points, radius=DEFAULT_CATCHMENT_RADIUS):
+    """
+    (hexagon index, stop index) pairs for every stop within radius of a hexagon, found
+    with one bulk STRtree query over the stop points.
+    """
+    tree = shapely.STRtree(stop_points)
+    hex_idx, stop_idx = tree.query(hexagons, predicate='dwithin', distance=radius)
+    return hex_idx, stop_idx
+
+
+def assign_population_to_stops(population, hexagons, stop_points, radius=DEFAULT_CATCHMENT_RADIUS):
+    """
+    Split each hexagon's population evenly among the stops within radius of it and sum
+    per stop. Returns (stop population, population of hexagons with no stop in reach).
+    """
+    population = np.asarray(population, dtype=np.float64)
+    hex_idx, stop_idx = catchment_pairs(hexagons, stop_points, radius)
+    stops_in_reach = np.bincount(hex_idx, minlength=len(population))
+    shares = population[hex_idx] / stops_in_reach[hex_idx]
+    stop_population = np.bincount(stop_idx, weights=shares, minlength=len(stop_points))
+    return stop_population, float(population[stops_in_reach == 0].sum())
+
+
+def catchment_matrix(hexagons, stop_points, radius=DEFAULT_CATCHMENT_RADIUS):
+    """Boolean stops × hexagons CSR matrix marking the hexagons within radius of each stop."""
+    hex_idx, stop_idx = catchment_pairs(hexagons, stop_points, radius)
+    return csr_matrix((np.ones(len(hex_idx), dtype=bool), (stop_idx, hex_idx)),
+                      shape=(len(stop_points), len(hexagons)))
@@ -1,56 +1,65 @@
-import pandas as pd
+import time
+import argparse
 import geopandas as gpd
 import matplotlib.pyplot as plt
-from shapely.geometry import Polygon
-import math
+from population_catchment import (PL2000_CRS, TOTAL_COLUMN, HEXAGON_RADIUS, DEFAULT_CATCHMENT_RADIUS,
+                                  load_population, hexagon_centers, hexagon_polygons,
+                                  assign_population_to_stops)
+from demand_store import DEFAULT_STORE_DIR, DemandStore, save_stop_population
+from stop_assignment import StopIndex, DecayStopAggregator, DECAY_KERNELS
 
-# --- Step 1: Load the Excel file ---
-df = pd.read_excel("ludnosc_dane.xlsx")
+STOPS_GEOJSON = "Przystanki_Komunikacji_Miejskiej_w_Krakowie_6ab29dbb62854448803c0125c291aca3.geojson"
 
-# --- Step 2: Calculate the total number of residents ---
-df["Liczba mieszkańców"] = (df["Liczba osób zameldowanych na stałe"] + 
-                             df["Liczba osób zameldowanych czasowo"])
+parser = argparse.ArgumentParser(description="Build population hexagons and join them to stop catchments.")
+parser.add_argument("--catchment-radius", type=float, default=DEFAULT_CATCHMENT_RADIUS,
+                    help="distance in metres within which a hexagon's residents count for a stop")
+parser.add_argument("--kernel", choices=sorted(DECAY_KERNELS), default=None,
+                    help="spread residents with a distance-decay kernel from the hexagon centres "
+                         "instead of splitting them evenly among the stops in reach")
+parser.add_argument("--store-dir", default=DEFAULT_STORE_DIR,
+                    help="demand store that receives the per-stop population column")
+args = parser.parse_args()
 
-# --- Step 3: Create a GeoDataFrame with points ---
-# We assume the two coordinate columns represent X and Y coordinates in PL-2000 (EPSG:2178).
-# Note: be sure that you pass the correct columns to points_from_xy.
-gdf_points = gpd.GeoDataFrame(
-    df,
-    geometry=gpd.points_from_xy(df["Współrzędna Y (układ PL-2000)"],
-                                df["Współrzędna X (układ PL-2000)"]),
-    crs="EPSG:2178"  # PL-2000 Zone 3, suitable for the local area
-)
+# --- Step 1 & 2: Load the Excel file and calculate the total number of residents ---
+df = load_population()
 
-# --- Function: create a hexagon polygon ---
-def create_hexagon(center, radius):
-    """
-    Create a regular hexagon polygon centered at 'center'
-    with each vertex 'radius' distance away from the center.
-    
-    Parameters:
-        center (tuple): The (x, y) coordinate of the center.
-        radius (float): Distance from the center to each vertex (in meters).
-        
-    Returns:
-        shapely.geometry.Polygon: Hexagon polygon.
-    """
-    cx, cy = center
-    angles = [math.radians(60 * i) for i in range(6)]
-    points = [(cx + radius * math.cos(a), cy + radius * math.sin(a)) for a in angles]
-    return Polygon(points)
+# --- Step 3 & 4: Build the hexagons in PL-2000 (EPSG:2178) ---
+# We assume the two coordinate columns represent X and Y coordinates in PL-2000, with X the northing.
+# All hexagons are created at once from a numpy vertex array.
+cx, cy = hexagon_centers(df)
+gdf_hex = gpd.GeoDataFrame(df, geometry=hexagon_polygons(cx, cy, HEXAGON_RADIUS), crs=PL2000_CRS)
 
-# --- Step 4: Replace points with hexagon polygons in the original projection ---
-# Create a new geometry column with hexagons.
-radius = 250
-gdf_hex = gdf_points.copy()
-gdf_hex["geometry"] = gdf_hex.geometry.apply(
-    lambda point: create_hexagon((point.x, point.y), radius)
-)
+# --- Step 5: Join hexagon residents to the stops within the catchment radius ---
+stops_gdf = gpd.read_file(STOPS_GEOJSON).to_crs(PL2000_CRS)
+stops_gdf['geometry'] = stops_gdf.geometry.centroid
+start = time.perf_counter()
+if args.kernel:
+    # Same sparse stop × cell kernel matrix as the POI demand model, with hexagon centres as cells
+    centres = gpd.GeoSeries(gpd.points_from_xy(cx, cy), crs=PL2000_CRS).to_crs("EPSG:4326")
+    aggregate = DecayStopAggregator(StopIndex.from_gdf(stops_gdf), args.catchment_radius, args.kernel,
+                                    fallback_nearest=False)
+    weights = aggregate.matrix(centres.x.to_numpy(), centres.y.to_numpy())
+    population = gdf_hex[TOTAL_COLUMN].to_numpy(dtype=float)
+    stop_population = weights @ population
+    unserved = float(population[weights.getnnz(axis=0) == 0].sum())
+else:
+    stop_population, unserved = assign_population_to_stops(
+        gdf_hex[TOTAL_COLUMN].to_numpy(), gdf_hex.geometry.values, stops_gdf.geometry.values, args.catchment_radius
+    )
+print(f"Assigned {stop_population.sum():,.0f} residents to {int((stop_population > 0).sum())} stops "
+      f"within {args.catchment_radius:.0f} m in {time.perf_counter() - start:.2f} s "
+      f"({unserved:,.0f} residents have no stop in reach).")
 
-# --- Step 5: Convert the hexagon GeoDataFrame to WGS84 (EPSG:4326) ---
+if DemandStore.exists(args.store_dir):
+    save_stop_population(stops_gdf['OBJECTID'].to_numpy(), stop_population, args.store_dir)
+    print(f"Saved per-stop population to the demand store in: {args.store_dir}")
+else:
+    print(f"No demand store in {args.store_dir}; run add_weight_to_stops.py first to save the population column.")
+
+# --- Step 6: Convert the hexagon GeoDataFrame to WGS84 (EPSG:4326) ---
 gdf_hex_wgs84 = gdf_hex.to_crs("EPSG:4326")
 
-# --- Step 6: Plot the hexagon GeoDataFrame with a base map for verification ---
+# --- Step 7: Plot the hexagon GeoDataFrame with a base map for verification ---
 fig, ax = plt.subplots(figsize=(12, 12))
 
 # Plot the hexagons
@@ -64,7 +73,7 @@ ax.set_ylabel('Latitude (WGS84)', fontsize=12)
 # Add a legend
 ax.legend()
 
-# --- Step 7: Export hexagons to GeoJSON ---
+# --- Step 8: Export hexagons to GeoJSON ---
 # Save the hexagons with population data to GeoJSON file
 output_file = "population_hexagons.geojson"
 gdf_hex_wgs84.to_file(output_file, driver='GeoJSON')
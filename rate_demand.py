@@ -1,196 +1,101 @@
-import json
-import matplotlib.pyplot as plt
-import numpy as np
-from matplotlib.animation import FuncAnimation
 import os # Import the os module for directory creation
-
-# --- Load GeoJSON data from file ---
-geojson_file = "krakow_pois.geojson"
-try:
-    with open(geojson_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
-except FileNotFoundError:
-    print(f"Error: The file '{geojson_file}' was not found. Please ensure it's in the same directory as the script.")
-    print("A sample GeoJSON content was provided in the previous turn. Please save it as 'krakow_pois.geojson'.")
-    exit() # Exit if the file is not found
-
-# Determine if the GeoJSON is a FeatureCollection or a single Feature
-if data.get("type") == "FeatureCollection":
-    features = data.get("features", [])
-elif data.get("type") == "Feature":
-    features = [data]
-else:
-    raise ValueError("Unsupported GeoJSON format")
-
-# --- Define base weights for different categories ---
-base_category_weights = {
-    "schools": 1.5,
-    "universities": 2.0,
-    "museums": 1.8,
-    "theaters": 1.8,
-    "shops": 1.0,
-    "bars": 1.4,
-    "train_stations": 4.5,
-    "bus_stations": 1.5,
-    "hospitals": 3.0,
-    "restaurants": 1.3,
-    "pharmacies": 1.0,
-    "libraries": 1.2,
-    "churches": 1.0,
-    "parks": 1.8,
-    "cinemas": 1.5,
-    "post_offices": 4.0,
-    "police_stations": 1.6
-}
-
-default_weight = 0.5 # Weight for categories not explicitly listed
-
-# --- Categories to be affected by specific demand functions ---
-# Tylko bary są objęte funkcją nocną
-night_affected_categories = {"bars"}
-# Pozostałe kategorie z base_category_weights będą objęte funkcją dzienną.
-
-# --- Demand functions for animation ---
-def day_demand_function_chart(x_input):
-    #  y=-0.5 (x^(2)-1.5) (x^(2)+0.8)
-    # <-1.2;1.2>
-    x_prime = -1.2 + (2.4 * x_input / 23)
-    y_value = -0.5 * (x_prime**2 - 1.5) * (x_prime**2 + 0.8)
-    return y_value
-
-def night_demand_function_chart(x_input):
-    # y=(((x)/(2)))^(2) + 0.2
-    # <-1.2;1.2>
-    x_prime = -1.2 + (2.4 * x_input / 23) + 0.4
-    y_value = ((x_prime/2)**2)
-    return y_value
-
-# --- Prepare initial data for heatmap ---
-latitudes = []
-longitudes = []
-feature_categories = [] # Store categories to re-apply weights during animation
-
-for feature in features:
-    if "properties" not in feature:
-        feature["properties"] = {}
-
-    category = None
-    # Determine the category based on 'amenity', 'shop', or 'category' property
-    if "amenity" in feature["properties"] and feature["properties"]["amenity"] in base_category_weights:
-        category = feature["properties"]["amenity"]
-    elif "shop" in feature["properties"] and feature["properties"]["shop"] in base_category_weights:
-        category = feature["properties"]["shop"]
-    elif "category" in feature["properties"] and feature["properties"]["category"] in base_category_weights:
-        category = feature["properties"]["category"]
-
-    geometry = feature.get("geometry")
-    if geometry and geometry.get("type") == "Point":
-        coordinates = geometry.get("coordinates")
-        if coordinates and len(coordinates) >= 2:
-            lon, lat = coordinates[:2]
-            longitudes.append(lon)
-            latitudes.append(lat)
-            feature_categories.append(category) # Store the determined category
-        else:
-            pass
-    else:
-        pass
-
-# --- Set up the plot for animation ---
-fig, ax = plt.subplots(figsize=(12, 10))
-
-# Initialize the hexbin plot with dummy data or initial weights
-hb = ax.hexbin(longitudes, latitudes, C=None, reduce_C_function=np.sum,
-               gridsize=50, cmap="Reds", mincnt=1)
-cb = fig.colorbar(hb, ax=ax, label="Total Weighted Demand in Bin")
-
-ax.set_title("Animated Weighted Heatmap of Krakow POIs")
-ax.set_xlabel("Longitude")
-ax.set_ylabel("Latitude")
-ax.grid(True, linestyle='--', alpha=0.6)
-
-# Set initial limits to ensure consistent view, even if no points are shown initially
-if longitudes and latitudes:
-    ax.set_xlim(min(longitudes) - 0.01, max(longitudes) + 0.01)
-    ax.set_ylim(min(latitudes) - 0.01, max(latitudes) + 0.01)
-else:
-    # Fallback for empty data, adjust as needed for your specific map area
-    ax.set_xlim(19.85, 20.1)
-    ax.set_ylim(50.0, 50.1)
-
-# --- Create directory for hourly data ---
-output_dir = "poi_demand_time"
-os.makedirs(output_dir, exist_ok=True) # Create the directory if it doesn't exist
-
-# --- Animation function ---
-def update(frame):
-    day_multiplier = day_demand_function_chart(frame)
-    night_multiplier = night_demand_function_chart(frame)
-
-    # Ensure multipliers don't become negative or zero for visualization
-    if day_multiplier < 0:
-        day_multiplier = 0.001
-    if night_multiplier < 0:
-        night_multiplier = 0.001
-
-    animated_weights = []
-    for i, category in enumerate(feature_categories):
-        base_w = base_category_weights.get(category, default_weight)
-
-        # Apply night multiplier only to bars
-        if category in night_affected_categories:
-            animated_weights.append(base_w * night_multiplier)
-        # Apply day multiplier to all other categories that have a base weight
-        elif category in base_category_weights:
-            animated_weights.append(base_w * day_multiplier)
-        # For categories not in base_category_weights, use default_weight (unaffected by multipliers)
-        else:
-            animated_weights.append(base_w)
-
-    # Remove existing hexbin collections before drawing new one
-    for collection in ax.collections:
-        if isinstance(collection, type(hb)):
-            collection.remove()
-
-    new_hb = ax.hexbin(longitudes, latitudes, C=animated_weights, reduce_C_function=np.sum,
-                       gridsize=50, cmap="Reds", mincnt=1)
-
-    cb.update_normal(new_hb)
-    cb.set_label("Total Weighted Demand in Bin")
-
-    ax.set_title(f"Animated Heatmap (Hour: {frame}, Day Demand: {day_multiplier:.2f}, Night Demand (Bars): {night_multiplier:.2f})")
-
-    # --- Save hexbin data for the current hour ---
-    offsets = new_hb.get_offsets()
-    values = new_hb.get_array()
-
-    # Prepare data for saving
-    hex_data = []
-    for i in range(len(offsets)):
-        hex_data.append({
-            "longitude": offsets[i][0],
-            "latitude": offsets[i][1],
-            "demand": values[i]
-        })
-
-    # Save to JSON file
-    output_filename = os.path.join(output_dir, f"hexbin_hour_{frame:02d}.json")
-    with open(output_filename, 'w', encoding='utf-8') as f:
-        json.dump(hex_data, f, indent=4)
-    print(f"Saved hexbin data for hour {frame:02d} to '{output_filename}'")
-
-
-    return new_hb,
-
-# --- Create and save the animation ---
-anim = FuncAnimation(fig, update, frames=range(24), blit=False, repeat=False, interval=50)
-
-try:
-    print("Attempting to save animation to 'krakow_heatmap_day_all_night_bars_demand.gif'...")
-    anim.save('krakow_heatmap_day_all_night_bars_demand.gif', writer='pillow', fps=5)
-    print("Animation saved as 'krakow_heatmap_day_all_night_bars_demand.gif'.")
-except Exception as e:
-    print(f"Error saving animation: {e}")
-    print("Please ensure 'pillow' (pip install pillow) or an appropriate writer (e.g., 'imagemagick'/'ffmpeg') is installed and in your PATH.")
-
-# plt.show() # Uncomment if you want to try interactive display
\ No newline at end of file
+import argparse
+from poi_demand import (HexGrid, PoiDemandModel, load_poi_points, write_hexbin_json, write_demand_npz,
+                        slice_minutes, slice_label, hexbin_filename,
+                        day_demand_function_chart, night_demand_function_chart, clamp_multiplier)
+
+GEOJSON_FILE = "krakow_pois.geojson"
+OUTPUT_DIR = "poi_demand_time"
+GIF_FILE = "krakow_heatmap_day_all_night_bars_demand.gif"
+DEFAULT_GRIDSIZE = 50
+
+
+def resolution_dir(output_dir, gridsize):
+    """The default resolution writes straight to output_dir, others to a gridsize_NN subdirectory."""
+    if gridsize == DEFAULT_GRIDSIZE:
+        return output_dir
+    return os.path.join(output_dir, f"gridsize_{gridsize}")
+
+
+def export_demand(model, minutes, out_dir, fmt="json", step_minutes=60):
+    """
+    Stream the cell demand slice by slice into hexbin_<label>.json files or a single
+    hexbin_demand.npz; no more than one time slice is computed at a time.
+    """
+    centers = model.cell_centers()
+    slices = model.iter_slices(minutes)
+    os.makedirs(out_dir, exist_ok=True)
+    if fmt == "npz":
+        output_filename = os.path.join(out_dir, "hexbin_demand.npz")
+        write_demand_npz(output_filename, centers, slices, minutes, model.grid.gridsize)
+        print(f"Saved hexbin data for {len(minutes)} time slices to '{output_filename}'")
+        return
+    for minute, values in slices:
+        output_filename = hexbin_filename(out_dir, minute, step_minutes)
+        write_hexbin_json(output_filename, centers, values)
+        print(f"Saved hexbin data for {slice_label(minute, step_minutes)} to '{output_filename}'")
+
+
+def render_gif(longitudes, latitudes, cell_demand, hours, gif_file=GIF_FILE, gridsize=DEFAULT_GRIDSIZE,
+               workers=None):
+    """
+    Animate the precomputed demand, one frame per time slice. The frames are rendered
+    side by side in a process pool and assembled with Pillow afterwards.
+    """
+    from render import HexbinScene, render_animation
+
+    titles = []
+    for hour in hours:
+        day_multiplier = clamp_multiplier(day_demand_function_chart(hour))
+        night_multiplier = clamp_multiplier(night_demand_function_chart(hour))
+        titles.append(f"Animated Heatmap (Hour: {hour:g}, Day Demand: {day_multiplier:.2f}, Night Demand (Bars): {night_multiplier:.2f})")
+    scene = HexbinScene(longitudes, latitudes, cell_demand, titles, gridsize)
+
+    try:
+        print(f"Attempting to save animation to '{gif_file}'...")
+        render_animation(scene, gif_file, figsize=(12, 10), fps=5, workers=workers)
+        print(f"Animation saved as '{gif_file}'.")
+    except Exception as e:
+        print(f"Error saving animation: {e}")
+        print("Please ensure 'pillow' (pip install pillow) is installed.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute POI demand per hex cell and time slice.")
+    parser.add_argument("--geojson", default=GEOJSON_FILE, help="POI GeoJSON file")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR, help="directory for the cell demand files")
+    parser.add_argument("--gridsize", type=int, nargs='+', default=[DEFAULT_GRIDSIZE],
+                        help="one or more hex grid resolutions (hexagons across the x extent)")
+    parser.add_argument("--format", choices=["json", "npz"], default="json",
+                        help="hexbin_hour_XX.json files or one compact hexbin_demand.npz per resolution")
+    parser.add_argument("--step-minutes", type=int, default=60,
+                        help="length of a time slice in minutes (60 keeps the hexbin_hour_XX files)")
+    parser.add_argument("--gif", action="store_true", help=f"also render the animation to {GIF_FILE}")
+    parser.add_argument("--workers", type=int, help="processes rendering the animation frames (all cores by default)")
+    args = parser.parse_args()
+
+    # --- Load GeoJSON data from file ---
+    try:
+        longitudes, latitudes, feature_categories = load_poi_points(args.geojson)
+    except FileNotFoundError:
+        print(f"Error: The file '{args.geojson}' was not found. Please ensure it's in the same directory as the script.")
+        print("A sample GeoJSON content was provided in the previous turn. Please save it as 'krakow_pois.geojson'.")
+        exit() # Exit if the file is not found
+
+    # --- Compute demand for every hex cell, one time slice at a time ---
+    # Each POI is assigned to a category and a hex cell once; the day/night curves form a
+    # category × time weight matrix, so every slice is a single sparse product.
+    minutes = slice_minutes(args.step_minutes)
+    for gridsize in args.gridsize:
+        grid = HexGrid.from_points(longitudes, latitudes, gridsize=gridsize)
+        demand_model = PoiDemandModel(longitudes, latitudes, feature_categories, grid)
+        export_demand(demand_model, minutes, resolution_dir(args.output_dir, gridsize), args.format,
+                      args.step_minutes)
+        if args.gif and gridsize == args.gridsize[0]:
+            hours = minutes / 60
+            render_gif(longitudes, latitudes, demand_model.demand(hours), hours, gridsize=gridsize,
+                       workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+import io
+import os
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+import matplotlib.patches as mpatches
+from graph_store import as_graph_nodes, load_graph
+
+LINE_COLORS = ['red', 'blue', 'green', 'orange', 'purple', 'brown', 'pink', 'gray']
+LINES_FILE = "tram_lines_system.json"
+DAY_GIF_FILE = "tram_lines_day.gif"
+LABEL_SHARE = 0.3  # stops above this share of the highest demand get a name label
+
+
+def _short(name, limit):
+    return name[:limit] + ('...' if len(name) > limit else '')
+
+
+def _line_name(line):
+    start = line.get('start_stop', 'Unknown')
+    return start.get('name', 'Unknown') if isinstance(start, dict) else start
+
+
+class LineMapScene:
+    """
+    Everything needed to draw the lines map, as plain arrays so it can be handed to
+    worker processes: base network segments and nodes, stop positions with their
+    demand per frame (stops × frames), line segments with a colour each and the termini.
+    Every layer is drawn as one collection; only the name labels are separate texts.
+    """
+
+    tight_layout = True
+
+    def __init__(self, edge_segments, node_xy, stop_xy, stop_names, stop_demand,
+                 line_segments, segment_colors, termini_xy, line_colors, line_labels, legend_labels,
+                 titles=None):
+        self.edge_segments = edge_segments
+        self.node_xy = node_xy
+        self.stop_xy = stop_xy
+        self.stop_names = stop_names
+        self.stop_demand = stop_demand
+        self.line_segments = line_segments
+        self.segment_colors = segment_colors
+        self.termini_xy = termini_xy
+        self.line_colors = line_colors
+        self.line_labels = line_labels
+        self.legend_labels = legend_labels
+        self.titles = titles or ['Kraków Tram Network - Multiple Loop Lines'] * stop_demand.shape[1]
+        # One colour scale for all frames, so the hours of an animation are comparable
+        self.max_demand = float(stop_demand.max()) if stop_demand.size and stop_demand.max() > 0 else 1.0
+
+    @classmethod
+    def from_graph(cls, G, tram_lines, stop_demand=None, titles=None):
+        """
+        Scene of G and its lines. Each line needs a 'route' (or 'route_nodes') and may
+        carry 'color', 'line_number' / 'line_id', 'start_stop' and 'length_km'.
+        stop_demand is a {node: demand per frame} mapping; by default the nodes'
+        total_demand gives a single frame.
+        """
+        pos = {node: (data['x'], data['y']) for node, data in G.nodes(data=True)}
+        edge_segments = np.array([(pos[u], pos[v]) for u, v in G.edges()], dtype=float).reshape(-1, 2, 2)
+        node_xy = np.array(list(pos.values()), dtype=float).reshape(-1, 2)
+
+        stop_nodes = [node for node, data in G.nodes(data=True) if data.get('stops')]
+        if stop_demand is None:
+            stop_demand = {node: [G.nodes[node].get('total_demand', 0)] for node in stop_nodes}
+        num_frames = len(next(iter(stop_demand.values()))) if stop_demand else 1
+        demand = np.array([stop_demand.get(node, [0.0] * num_frames) for node in stop_nodes],
+                          dtype=float).reshape(len(stop_nodes), num_frames)
+        stop_xy = np.array([pos[node] for node in stop_nodes], dtype=float).reshape(-1, 2)
+        stop_names = [_short(G.nodes[node]['stops'][0].get('name', 'Unknown'), 25) for node in stop_nodes]
+
+        line_segments, segment_colors = [], []
+        termini_xy, line_colors, line_labels, legend_labels = [], [], [], []
+        for i, line in enumerate(tram_lines):
+            route = as_graph_nodes(G, line.get('route', line.get('route_nodes', [])))
+            color = line.get('color', LINE_COLORS[i % len(LINE_COLORS)])
+            number = line.get('line_number', line.get('line_id', i + 1))
+            segments = [(pos[u], pos[v]) for u, v in zip(route, route[1:]) if G.has_edge(u, v)]
+            line_segments.extend(segments)
+            segment_colors.extend([color] * len(segments))
+            if route:
+                termini_xy.append(pos[route[0]])
+                line_colors.append(color)
+                name = _line_name(line)
+                line_labels.append(f"P{number}: {name[:20]}")
+                length = line.get('length_km', 0.0)
+                legend_labels.append(f"Line {number}: {name[:20]}... ({length:.1f}km)")
+
+        return cls(edge_segments, node_xy, stop_xy, stop_names, demand,
+                   np.array(line_segments, dtype=float).reshape(-1, 2, 2), segment_colors,
+                   np.array(termini_xy, dtype=float).reshape(-1, 2), line_colors, line_labels, legend_labels,
+                   titles)
+
+    @property
+    def num_frames(self):
+        return self.stop_demand.shape[1]
+
+    def draw(self, fig, ax, frame=0):
+        # Base network
+        ax.add_collection(LineCollection(self.edge_segments, colors='lightgray', linewidths=0.5,
+                                         alpha=0.4, zorder=1))
+        ax.scatter(self.node_xy[:, 0], self.node_xy[:, 1], s=15, c='lightgray', alpha=0.4,
+                   linewidths=0, zorder=2)
+
+        # Demand stops, sized and coloured by their share of the highest demand
+        demand = self.stop_demand[:, frame]
+        served = demand > 0
+        intensity = demand[served] / self.max_demand
+        ax.scatter(self.stop_xy[served, 0], self.stop_xy[served, 1], c=intensity, cmap='YlOrRd', vmin=0, vmax=1,
+                   s=20 + intensity * 80, alpha=0.7, edgecolors='black', linewidths=0.3, zorder=3)
+        for i in np.flatnonzero(demand > self.max_demand * LABEL_SHARE).tolist():
+            ax.annotate(self.stop_names[i], self.stop_xy[i], xytext=(5, 5), textcoords='offset points', fontsize=8,
+                        bbox=dict(boxstyle='round,pad=0.3', facecolor='white', alpha=0.8), zorder=5)
+
+        # Lines and their termini
+        ax.add_collection(LineCollection(self.line_segments, colors=self.segment_colors, linewidths=3,
+                                         alpha=0.8, zorder=4))
+        if len(self.termini_xy):
+            ax.scatter(self.termini_xy[:, 0], self.termini_xy[:, 1], c=self.line_colors, s=150, marker='D',
+                       edgecolors='black', linewidths=2, zorder=6, alpha=0.9)
+        for xy, color, label in zip(self.termini_xy, self.line_colors, self.line_labels):
+            ax.annotate(label, xy, xytext=(10, -10), textcoords='offset points', fontsize=9, fontweight='bold',
+                        bbox=dict(boxstyle='round,pad=0.3', facecolor=color, alpha=0.8, edgecolor='black'),
+                        color='white', zorder=7)
+        handles = [mpatches.Patch(color=color, label=label)
+                   for color, label in zip(self.line_colors, self.legend_labels)]
+        if handles:
+            ax.legend(handles=handles, loc='upper left', bbox_to_anchor=(0.02, 0.98), fontsize=10)
+
+        ax.autoscale_view()
+        # Same aspect osmnx uses for unprojected graphs
+        if len(self.node_xy):
+            ax.set_aspect(1 / np.cos(np.radians(np.nanmean(self.node_xy[:, 1]))))
+        ax.set_title(self.titles[frame], fontsize=16, fontweight='bold')
+        ax.set_xlabel('Longitude')
+        ax.set_ylabel('Latitude')
+
+
+class HexbinScene:
+    """The POI demand heatmap: point coordinates and the demand of every hexbin cell per frame (cells × frames)."""
+
+    tight_layout = False
+
+    def __init__(self, longitudes, latitudes, cell_demand, titles, gridsize):
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.cell_demand = np.asarray(cell_demand)
+        self.titles = titles
+        self.gridsize = gridsize
+
+    @property
+    def num_frames(self):
+        return self.cell_demand.shape[1]
+
+    def draw(self, fig, ax, frame=0):
+        # The hexbin's cells are the occupied cells of the demand model, in the same order
+        hb = ax.hexbin(self.longitudes, self.latitudes, C=None, reduce_C_function=np.sum,
+                       gridsize=self.gridsize, cmap="Reds", mincnt=1)
+        hb.set_array(self.cell_demand[:, frame])
+        hb.autoscale()
+        fig.colorbar(hb, ax=ax, label="Total Weighted Demand in Bin")
+
+        ax.set_xlabel("Longitude")
+        ax.set_ylabel("Latitude")
+        ax.grid(True, linestyle='--', alpha=0.6)
+        if len(self.longitudes):
+            ax.set_xlim(self.longitudes.min() - 0.01, self.longitudes.max() + 0.01)
+            ax.set_ylim(self.latitudes.min() - 0.01, self.latitudes.max() + 0.01)
+        else:
+            ax.set_xlim(19.85, 20.1)
+            ax.set_ylim(50.0, 50.1)
+        ax.set_title(self.titles[frame])
+
+
+def render_frame(scene, frame, figsize, dpi, fmt='png'):
+    """One frame rendered off-screen with the Agg canvas (no pyplot state), as image bytes."""
+    fig = Figure(figsize=figsize, dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    scene.draw(fig, ax, frame)
+    if scene.tight_layout:
+        fig.tight_layout()
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+_scene = None
+
+
+def _init_worker(scene):
+    # With the fork start method the scene arrives through the inherited memory, not a pickle
+    global _scene
+    _scene = scene
+
+
+def _render(task):
+    frame, figsize, dpi = task
+    return render_frame(_scene, frame, figsize, dpi)
+
+
+def render_frames(scene, frames=None, figsize=(20, 16), dpi=100, workers=None):
+    """PNG bytes of every frame, rendered side by side in a process pool (in order)."""
+    frames = list(range(scene.num_frames)) if frames is None else list(frames)
+    workers = min(workers or os.cpu_count() or 1, len(frames))
+    tasks = [(frame, figsize, dpi) for frame in frames]
+    if workers <= 1:
+        _init_worker(scene)
+        return [_render(task) for task in tasks]
+    context = multiprocessing.get_context("fork") if "fork" in multiprocessing.get_all_start_methods() else None
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(scene,)) as pool:
+        return list(pool.map(_render, tasks))
+
+
+def save_gif(frames, gif_file, fps=5):
+    """Assemble rendered PNG frames into a looping GIF with Pillow."""
+    from PIL import Image
+    images = [Image.open(io.BytesIO(frame)).convert("RGB") for frame in frames]
+    images[0].save(gif_file, save_all=True, append_images=images[1:], duration=int(1000 / fps), loop=0)
+    return gif_file
+
+
+def render_animation(scene, gif_file, figsize=(20, 16), dpi=100, fps=5, workers=None):
+    frames = render_frames(scene, figsize=figsize, dpi=dpi, workers=workers)
+    return save_gif(frames, gif_file, fps)
+
+
+def node_demand_by_hour(G, store):
+    """{stop node: demand in each hour of the store} summed over the stops on the node."""
+    hours = store.hours()
+    rows = {int(object_id): row for row, object_id in enumerate(store.object_ids.tolist())}
+    matrix = np.column_stack([store.hour(hour) for hour in hours]) if hours else np.zeros((len(rows), 0))
+    demand = {}
+    for node, data in G.nodes(data=True):
+        found = [rows[stop['id']] for stop in data.get('stops') or [] if stop.get('id') in rows]
+        if found:
+            demand[node] = matrix[found].sum(axis=0).tolist()
+    return demand, hours
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a line plan over the day of stop demand.")
+    parser.add_argument("--lines", default=LINES_FILE, help="JSON list of lines with route_nodes or route")
+    parser.add_argument("-o", "--output", default=DAY_GIF_FILE)
+    parser.add_argument("--workers", type=int, help="processes rendering frames (all cores by default)")
+    parser.add_argument("--dpi", type=int, default=100)
+    parser.add_argument("--fps", type=float, default=2)
+    args = parser.parse_args()
+
+    from demand_store import DemandStore
+    from distance_matrix import GRAPHML_PATH
+
+    G = load_graph(GRAPHML_PATH)
+    with open(args.lines, 'r', encoding='utf-8') as f:
+        tram_lines = json.load(f)
+    store = DemandStore.open()
+    demand, hours = node_demand_by_hour(G, store)
+    titles = [f"Kraków Tram Network - Hour {hour:02d}" for hour in hours]
+    scene = LineMapScene.from_graph(G, tram_lines, demand, titles)
+
+    start = time.perf_counter()
+    frames = render_frames(scene, dpi=args.dpi, workers=args.workers)
+    rendered = time.perf_counter() - start
+    save_gif(frames, args.output, args.fps)
+    print(f"Rendered {len(frames)} frames in {rendered:.1f} s ({rendered / len(frames):.2f} s per frame); "
+          f"saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,416 @@
+import os
+import math
+import time
+import heapq
+import random
+import hashlib
+import argparse
+import numpy as np
+import networkx as nx
+
+GRAPHML_PATH = "krakow_tram_graph.graphml"
+EARTH_RADIUS_M = 6371009  # mean Earth radius used by osmnx for edge lengths
+
+
+def _graph_edges(G, weight):
+    """(nodes, index, {(u, v): min weight}) with nodes as integer positions."""
+    nodes = list(G.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    edges = {}
+    for u, v, data in G.edges(data=True):
+        if u == v:
+            continue
+        key = (index[u], index[v])
+        w = float(data.get(weight, 0))
+        if key not in edges or w < edges[key]:
+            edges[key] = w
+    return nodes, index, edges
+
+
+def _adjacency(num_nodes, edges):
+    adjacency = [[] for _ in range(num_nodes)]
+    for (u, v), w in edges.items():
+        adjacency[u].append((v, w))
+    return adjacency
+
+
+def graph_fingerprint(G, weight='length'):
+    """Hash of the node ids and weighted edges, used to tell whether a saved hierarchy is stale."""
+    nodes, _, edges = _graph_edges(G, weight)
+    digest = hashlib.sha1(repr(nodes).encode('utf-8'))
+    digest.update(repr(sorted(edges.items())).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class AStarRouter:
+    """
+    A* search with an admissible great-circle heuristic built from node x/y (lon/lat).
+    osmnx edge lengths are great-circle distances, so the straight-line distance to the
+    target never overestimates the remaining track length.
+    """
+
+    def __init__(self, G, weight='length'):
+        self.nodes, self.index, edges = _graph_edges(G, weight)
+        self.adjacency = _adjacency(len(self.nodes), edges)
+        self.lon = np.radians([float(G.nodes[n]['x']) for n in self.nodes]).tolist()
+        self.lat = np.radians([float(G.nodes[n]['y']) for n in self.nodes]).tolist()
+        self.cos_lat = [math.cos(lat) for lat in self.lat]
+
+    def _heuristic(self, u, t):
+        dlat = self.lat[t] - self.lat[u]
+        dlon = self.lon[t] - self.lon[u]
+        a = math.sin(dlat / 2) ** 2 + self.cos_lat[u] * self.cos_lat[t] * math.sin(dlon / 2) ** 2
+        # Shrink by a hair so rounding can never make the heuristic inadmissible
+        return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a))) * 0.999999
+
+    def shortest_path_with_length(self, source, target):
+        s, t = self.index[source], self.index[target]
+        dist = {s: 0.0}
+        pred = {s: None}
+        heap = [(self._heuristic(s, t), 0.0, s)]
+        closed = set()
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in closed:
+                continue
+            if u == t:
+                path = [t]
+                while pred[path[-1]] is not None:
+                    path.append(pred[path[-1]])
+                return d, [self.nodes[i] for i in reversed(path)]
+            closed.add(u)
+            for v, w in self.adjacency[u]:
+                nd = d + w
+                if nd < dist.get(v, math.inf):
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd + self._heuristic(v, t), nd, v))
+        raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+
+    def shortest_path(self, source, target):
+        """Same contract as nx.shortest_path(G, source, target, weight='length')."""
+        return self.shortest_path_with_length(source, target)[1]
+
+
+class ContractionHierarchy:
+    """
+    Contraction hierarchy over a directed weighted graph. Nodes are contracted in
+    edge-difference order with witness searches; queries run a bidirectional Dijkstra
+    on the upward graphs and unpack shortcuts back into original edges.
+    """
+
+    def __init__(self, nodes, rank, up_forward, up_backward, middle, fingerprint=None):
+        self.nodes = nodes
+        self.index = {node: i for i, node in enumerate(nodes)}
+        self.rank = rank
+        self.up_forward = up_forward
+        self.up_backward = up_backward
+        self.middle = middle
+        self.fingerprint = fingerprint
+
+    # ---------------------------
+    # Preprocessing
+    # ---------------------------
+    @classmethod
+    def build(cls, G, weight='length', witness_settle_limit=64):
+        nodes, _, edges = _graph_edges(G, weight)
+        n = len(nodes)
+        out_edges = [dict() for _ in range(n)]
+        in_edges = [dict() for _ in range(n)]
+        for (u, v), w in edges.items():
+            out_edges[u][v] = w
+            in_edges[v][u] = w
+        middle = {}
+        contracted = [False] * n
+        deleted_neighbours = [0] * n
+
+        def witness_distance(source, target, avoid, limit):
+            dist = {source: 0.0}
+            heap = [(0.0, source)]
+            settled = 0
+            while heap and settled < witness_settle_limit:
+                d, u = heapq.heappop(heap)
+                if d > limit:
+                    break
+                if u == target:
+                    return d
+                if d > dist.get(u, math.inf):
+                    continue
+                settled += 1
+                for v, w in out_edges[u].items():
+                    if v == avoid or contracted[v]:
+                        continue
+                    nd = d + w
+                    if nd < dist.get(v, math.inf):
+                        dist[v] = nd
+                        heapq.heappush(heap, (nd, v))
+            return dist.get(target, math.inf)
+
+        def shortcuts_for(v):
+            shortcuts = []
+            outs = [(w, c) for w, c in out_edges[v].items() if not contracted[w]]
+            if not outs:
+                return shortcuts
+            max_out = max(c for _, c in outs)
+            for u, cu in in_edges[v].items():
+                if contracted[u]:
+                    continue
+                for w, cw in outs:
+                    if w == u:
+                        continue
+                    via = cu + cw
+                    if witness_distance(u, w, v, cu + max_out) > via:
+                        shortcuts.append((u, w, via))
+            return shortcuts
+
+        def priority(v):
+            degree = (sum(not contracted[u] for u in in_edges[v]) +
+                      sum(not contracted[w] for w in out_edges[v]))
+            return len(shortcuts_for(v)) - degree + deleted_neighbours[v]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        rank = [0] * n
+        order = 0
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+            # Lazy update: re-evaluate and push back if the node is no longer the cheapest
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, w, via in shortcuts_for(v):
+                if via < out_edges[u].get(w, math.inf):
+                    out_edges[u][w] = via
+                    in_edges[w][u] = via
+                    middle[(u, w)] = v
+            contracted[v] = True
+            rank[v] = order
+            order += 1
+            for neighbour in list(in_edges[v]) + list(out_edges[v]):
+                deleted_neighbours[neighbour] += 1
+
+        up_forward = [[(w, c) for w, c in out_edges[u].items() if rank[w] > rank[u]] for u in range(n)]
+        up_backward = [[(u, c) for u, c in in_edges[w].items() if rank[u] > rank[w]] for w in range(n)]
+        return cls(nodes, rank, up_forward, up_backward, middle, graph_fingerprint(G, weight))
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def save(self, path):
+        def flatten(adjacency):
+            indptr = np.zeros(len(adjacency) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(row) for row in adjacency])
+            targets = np.array([v for row in adjacency for v, _ in row], dtype=np.int32)
+            weights = np.array([c for row in adjacency for _, c in row], dtype=np.float64)
+            return indptr, targets, weights
+
+        f_ptr, f_to, f_w = flatten(self.up_forward)
+        b_ptr, b_to, b_w = flatten(self.up_backward)
+        shortcut_keys = np.array(list(self.middle.keys()), dtype=np.int32).reshape(-1, 2)
+        np.savez(path, nodes=np.array(self.nodes), rank=np.array(self.rank, dtype=np.int32),
+                 f_ptr=f_ptr, f_to=f_to, f_w=f_w, b_ptr=b_ptr, b_to=b_to, b_w=b_w,
+                 shortcut_keys=shortcut_keys,
+                 shortcut_middle=np.array(list(self.middle.values()), dtype=np.int32),
+                 fingerprint=np.array(self.fingerprint or ''))
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+
+        def unflatten(indptr, targets, weights):
+            targets, weights = targets.tolist(), weights.tolist()
+            return [list(zip(targets[indptr[i]:indptr[i + 1]], weights[indptr[i]:indptr[i + 1]]))
+                    for i in range(len(indptr) - 1)]
+
+        middle = dict(zip(map(tuple, data['shortcut_keys'].tolist()), data['shortcut_middle'].tolist()))
+        return cls(data['nodes'].tolist(), data['rank'].tolist(),
+                   unflatten(data['f_ptr'], data['f_to'], data['f_w']),
+                   unflatten(data['b_ptr'], data['b_to'], data['b_w']),
+                   middle, str(data['fingerprint']))
+
+    @classmethod
+    def load_or_build(cls, G, path, weight='length'):
+        """Load the hierarchy saved at path, rebuilding and saving it if it was built for another graph."""
+        fingerprint = graph_fingerprint(G, weight)
+        if os.path.exists(path):
+            hierarchy = cls.load(path)
+            if hierarchy.fingerprint == fingerprint:
+                return hierarchy
+        hierarchy = cls.build(G, weight)
+        hierarchy.save(path)
+        return hierarchy
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+    def _unpack(self, u, w, out):
+        v = self.middle.get((u, w))
+        if v is None:
+            out.append(w)
+        else:
+            self._unpack(u, v, out)
+            self._unpack(v, w, out)
+
+    def shortest_path_with_length(self, source, target):
+        s, t = self.index[source], self.index[target]
+        if s == t:
+            return 0.0, [source]
+        dist = ({s: 0.0}, {t: 0.0})
+        pred = ({s: None}, {t: None})
+        heaps = ([(0.0, s)], [(0.0, t)])
+        graphs = (self.up_forward, self.up_backward)
+        best, meet = math.inf, None
+        side = 0
+        while heaps[0] or heaps[1]:
+            if not heaps[side] or (heaps[1 - side] and heaps[1 - side][0][0] < heaps[side][0][0]):
+                side = 1 - side
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side].get(u, math.inf):
+                continue
+            if d >= best:
+                # Upward searches cannot improve once both frontiers pass the best meeting cost
+                heaps[side].clear()
+                continue
+            other = dist[1 - side].get(u)
+            if other is not None and d + other < best:
+                best, meet = d + other, u
+            for v, c in graphs[side][u]:
+                nd = d + c
+                if nd < dist[side].get(v, math.inf):
+                    dist[side][v] = nd
+                    pred[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+
+        if meet is None:
+            raise nx.NetworkXNoPath(f"No path between {source} and {target}.")
+
+        up = [meet]
+        while pred[0][up[-1]] is not None:
+            up.append(pred[0][up[-1]])
+        up.reverse()
+        down = [meet]
+        while pred[1][down[-1]] is not None:
+            down.append(pred[1][down[-1]])
+        hops = up + down[1:]
+
+        path = [hops[0]]
+        for u, w in zip(hops[:-1], hops[1:]):
+            self._unpack(u, w, path)
+        return best, [self.nodes[i] for i in path]
+
+    def shortest_path(self, source, target):
+        """Same contract as nx.shortest_path(G, source, target, weight='length')."""
+        return self.shortest_path_with_length(source, target)[1]
+
+
+def contraction_hierarchy_path(graphml_path):
+    """File the contraction hierarchy for a GraphML graph is saved to."""
+    return os.path.splitext(graphml_path)[0] + "_ch.npz"
+
+
+def _path_length(G, path, weight='length'):
+    """Length of a node path walked on G (cheapest parallel edge per hop), inf if a hop is missing."""
+    try:
+        return nx.path_weight(G, path, weight)
+    except nx.NetworkXNoPath:
+        return math.inf
+
+
+def compare_paths(G, pairs, baseline, paths, weight='length', tol=1e-6):
+    """
+    Check expanded node paths against the networkx baseline paths on G. A path that is not
+    the baseline path still passes as a tie when it walks existing edges of G from source
+    to target at the baseline length (within tol): both engines break ties between
+    equal-length routes deterministically by node position in the heap, networkx by
+    insertion order, so they may settle on different equally short routes.
+    Returns (number of identical paths, number of ties, [(pair, baseline, path)] mismatches).
+    """
+    identical, ties, mismatches = 0, 0, []
+    for (s, t), expected, path in zip(pairs, baseline, paths):
+        if path == expected:
+            identical += 1
+        elif (path is not None and expected is not None and path[0] == s and path[-1] == t and
+              abs(_path_length(G, path, weight) - _path_length(G, expected, weight)) < tol):
+            ties += 1
+        else:
+            mismatches.append(((s, t), expected, path))
+    return identical, ties, mismatches
+
+
+def benchmark(G, R, queries=1000, seed=0, ch_path=None):
+    """
+    Time random stop-to-stop queries: networkx on the full graph (today's baseline),
+    networkx on the contracted graph, A* and the contraction hierarchy. The routes of
+    the contracted-graph engines are expanded back to full-graph node paths and checked
+    against nx.shortest_path on the full graph (see compare_paths for ties).
+    """
+    from graph_contraction import expand_route
+
+    stops = [n for n, d in R.nodes(data=True) if d.get('stops')]
+    rng = random.Random(seed)
+    pairs = [tuple(rng.sample(stops, 2)) for _ in range(queries)]
+
+    t0 = time.perf_counter()
+    if ch_path:
+        hierarchy = ContractionHierarchy.load_or_build(R, ch_path)
+    else:
+        hierarchy = ContractionHierarchy.build(R)
+    t1 = time.perf_counter()
+    astar = AStarRouter(R)
+    print(f"Contraction hierarchy ready in {t1 - t0:.2f} s ({len(hierarchy.middle)} shortcuts).")
+
+    def run(name, query):
+        paths = []
+        start = time.perf_counter()
+        for s, t in pairs:
+            try:
+                paths.append(query(s, t))
+            except nx.NetworkXNoPath:
+                paths.append(None)
+        elapsed = time.perf_counter() - start
+        print(f"{name:<28} {elapsed / len(pairs) * 1e6:10.1f} µs/query")
+        return paths
+
+    baseline = run("networkx (full graph)", lambda s, t: nx.shortest_path(G, s, t, weight='length'))
+    results = {
+        "networkx (contracted)": run("networkx (contracted)",
+                                     lambda s, t: nx.shortest_path(R, s, t, weight='length')),
+        "A*": run("A* (contracted)", astar.shortest_path),
+        "CH": run("contraction hierarchy", hierarchy.shortest_path),
+    }
+    for name, paths in results.items():
+        expanded = [None if path is None else expand_route(R, path) for path in paths]
+        identical, ties, mismatches = compare_paths(G, pairs, baseline, expanded)
+        print(f"{name}: {identical} identical paths, {ties} equal-length ties, "
+              f"{len(mismatches)} mismatches of {len(pairs)}.")
+        for (s, t), expected, path in mismatches[:5]:
+            print(f"  {s} -> {t}: baseline {_path_length(G, expected) if expected else math.inf:.1f} m, "
+                  f"got {_path_length(G, path) if path else math.inf:.1f} m")
+
+
+def main():
+    from graph_store import load_graph
+    from graph_contraction import contract_graph
+
+    parser = argparse.ArgumentParser(description="Route query engines (A*, contraction hierarchy).")
+    parser.add_argument("--graphml", default=GRAPHML_PATH)
+    parser.add_argument("--benchmark", action="store_true", help="compare query latency with networkx")
+    parser.add_argument("--queries", type=int, default=1000)
+    args = parser.parse_args()
+
+    G = load_graph(args.graphml)
+    R = contract_graph(G)
+    ch_path = contraction_hierarchy_path(args.graphml)
+    if args.benchmark:
+        benchmark(G, R, args.queries, ch_path=ch_path)
+    else:
+        hierarchy = ContractionHierarchy.load_or_build(R, ch_path)
+        print(f"Contraction hierarchy for {len(hierarchy.nodes)} nodes saved to {ch_path}.")
+
+
+if __name__ == '__main__':
+    main()
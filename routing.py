@@ -0,0 +1,97 @@
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+NO_PREDECESSOR = -9999  # scipy.sparse.csgraph marker for "no predecessor"
+
+
+def min_weight_csr(sources, targets, weights, num_nodes):
+    """
+    Sparse directed adjacency matrix keeping the smallest weight of parallel edges
+    (the csr constructor would sum them). Zero weights stay explicit edges.
+    """
+    sources = np.asarray(sources)
+    targets = np.asarray(targets)
+    weights = np.asarray(weights, dtype=np.float64)
+    order = np.lexsort((weights, targets, sources))
+    sources, targets, weights = sources[order], targets[order], weights[order]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    return csr_matrix((weights[first], (sources[first], targets[first])), shape=(num_nodes, num_nodes))
+
+
+class RoutingSession:
+    """
+    Shortest-path queries over one graph backed by an LRU cache of single-source
+    shortest-path trees. One tree per source answers reachability, the path and its
+    length, so repeated hops from the same node never search twice.
+
+    The weights come from an edge attribute of G, or from a ready matrix over G's
+    nodes in G's order (e.g. TravelTimeModel.matrix for one hour of the day).
+    """
+
+    def __init__(self, G, weight='length', max_trees=256, matrix=None):
+        self.G = G
+        self.weight = weight
+        self.max_trees = max_trees
+        self.nodes = list(G.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        if matrix is None:
+            edges = [(self.index[u], self.index[v], data.get(weight, 0)) for u, v, data in G.edges(data=True)]
+            sources, targets, weights = zip(*edges) if edges else ((), (), ())
+            matrix = min_weight_csr(sources, targets, weights, len(self.nodes))
+        self.matrix = matrix
+        self._trees = OrderedDict()
+        self._demand_ranking = None
+        self.hits = 0
+        self.misses = 0
+
+    def tree(self, source):
+        """(distances, predecessors) arrays of the shortest-path tree rooted at source."""
+        tree = self._trees.get(source)
+        if tree is not None:
+            self._trees.move_to_end(source)
+            self.hits += 1
+            return tree
+
+        self.misses += 1
+        tree = dijkstra(self.matrix, directed=True, indices=self.index[source], return_predecessors=True)
+        self._trees[source] = tree
+        if len(self._trees) > self.max_trees:
+            self._trees.popitem(last=False)
+        return tree
+
+    def reweight(self, matrix):
+        """Route over other weights on the same nodes; the cached trees are dropped."""
+        self.matrix = matrix
+        self._trees.clear()
+
+    def has_path(self, source, target):
+        return bool(np.isfinite(self.tree(source)[0][self.index[target]]))
+
+    def path_length(self, source, target):
+        """Length of the shortest path, or None when target is unreachable."""
+        length = self.tree(source)[0][self.index[target]]
+        return float(length) if np.isfinite(length) else None
+
+    def path(self, source, target):
+        """Node list of the shortest path, or None when target is unreachable."""
+        dist, pred = self.tree(source)
+        src, node = self.index[source], self.index[target]
+        if not np.isfinite(dist[node]):
+            return None
+        path = [node]
+        while node != src:
+            node = pred[node]
+            path.append(node)
+        return [self.nodes[i] for i in reversed(path)]
+
+    def demand_ranking(self):
+        """Nodes with positive total_demand, highest first; computed once per session."""
+        if self._demand_ranking is None:
+            ranking = [(n, d.get('total_demand', 0)) for n, d in self.G.nodes(data=True)
+                       if d.get('total_demand', 0) > 0]
+            ranking.sort(key=lambda x: x[1], reverse=True)
+            self._demand_ranking = ranking
+        return self._demand_ranking
@@ -0,0 +1,308 @@
+import json
+import time
+import heapq
+import argparse
+import numpy as np
+from demand_store import DemandStore
+from distance_matrix import GRAPHML_PATH
+from graph_store import load_graph
+from journey_planner import (LINES_FILE, DEFAULT_HEADWAY_S, SERVICE_START_S, SERVICE_END_S,
+                             line_directions)
+from travel_time import HOURS, TravelTimeModel
+
+STATS_FILE = "tram_simulation_stats.json"
+CAPACITY = 200                  # passengers per tram
+PASSENGERS_PER_UNIT = 10.0      # passengers generated per unit of stop demand
+DWELL_BASE_S = 15.0             # doors open and close at every stop
+DWELL_PER_PASSENGER_S = 0.5     # boarding or alighting, spread over the doors
+
+
+class SimRoute:
+    """One direction of a line as the simulator runs it: stop nodes, hourly running times and segment lengths."""
+
+    def __init__(self, line_id, direction, stop_nodes, running, segment_km, headway):
+        self.line_id = line_id
+        self.direction = direction
+        self.stop_nodes = stop_nodes
+        self.running = running          # (24, stops - 1) seconds from each stop to the next, per hour
+        self.segment_km = segment_km    # (stops - 1) track length between consecutive stops
+        self.headway = headway
+
+    @property
+    def num_stops(self):
+        return len(self.stop_nodes)
+
+
+def _segment_km(G, nodes, at):
+    lengths = [min(d.get('length', 0.0) for d in G.get_edge_data(u, v).values()) if G.has_edge(u, v) else 0.0
+               for u, v in zip(nodes, nodes[1:])]
+    cumulative = np.concatenate([[0.0], np.cumsum(lengths)])
+    return np.diff(cumulative[at]) / 1000
+
+
+def build_routes(G, lines, model=None, headway_s=DEFAULT_HEADWAY_S, both_directions=True):
+    """SimRoutes of a line plan, directions and stops as in the journey planner (see line_directions)."""
+    # Dwell is simulated from the passengers, so the model only gives running times
+    model = model or TravelTimeModel.from_graph(G, dwell_s=0.0)
+    routes = []
+    for line_id, direction, nodes, at, headway in line_directions(G, lines, headway_s, both_directions):
+        running = np.diff(model.route_times(nodes)[:, at], axis=1)
+        routes.append(SimRoute(line_id, direction, [nodes[k] for k in at], running,
+                               _segment_km(G, nodes, at), headway))
+    return routes
+
+
+class Passengers:
+    """
+    Every passenger of the day as parallel arrays, ordered by the queue they wait in
+    (route, boarding stop) and by arrival time within it, so a queue is a slice.
+    """
+
+    def __init__(self, arrival, route, board, alight, queue_offsets):
+        self.arrival = arrival
+        self.route = route
+        self.board = board
+        self.alight = alight
+        self.queue_offsets = queue_offsets      # queue q holds passengers queue_offsets[q]:queue_offsets[q + 1]
+        self.board_time = np.full(len(arrival), np.nan)
+        self.left_behind = np.zeros(len(arrival), dtype=np.int16)
+
+    def __len__(self):
+        return len(self.arrival)
+
+
+def generate_passengers(routes, store, G, scale=PASSENGERS_PER_UNIT, rng=None,
+                        service=(SERVICE_START_S, SERVICE_END_S)):
+    """
+    Passengers from the demand store: a stop node with demand d in a time slice of
+    the service span generates Poisson(d * scale) passengers at uniform times within
+    the slice. Each takes one of the routes leaving the stop and rides to a later
+    stop on it chosen in proportion to the stops' demand over the day.
+    """
+    rng = rng or np.random.default_rng()
+    row = {int(object_id): i for i, object_id in enumerate(store.object_ids.tolist())}
+    node_rows = {}
+    for route in routes:
+        for node in route.stop_nodes:
+            if node not in node_rows:
+                node_rows[node] = [row[stop['id']] for stop in G.nodes[node].get('stops', [])
+                                   if stop.get('id') in row]
+    nodes = list(node_rows)
+    demand = np.asarray(store.profile(), dtype=np.float64)
+    node_demand = np.array([demand[rows].sum(axis=0) if rows else np.zeros(demand.shape[1])
+                            for rows in node_rows.values()]).reshape(len(nodes), demand.shape[1])
+    node_index = {node: i for i, node in enumerate(nodes)}
+    day = node_demand.sum(axis=1)
+
+    # Queues: every (route, stop) a passenger can board at, i.e. all but a route's last stop
+    queue_start = np.concatenate([[0], np.cumsum([route.num_stops - 1 for route in routes])])
+    boarding = [[] for _ in nodes]
+    for r, route in enumerate(routes):
+        for p, node in enumerate(route.stop_nodes[:-1]):
+            boarding[node_index[node]].append((r, p))
+
+    # Destination weights along each route: cumulative day demand, floored so no stop is impossible
+    floor = max(day.mean(), 1e-9) * 0.01
+    cumulative = [np.concatenate([[0.0], np.cumsum(day[[node_index[n] for n in route.stop_nodes]] + floor)])
+                  for route in routes]
+
+    step = store.step_minutes * 60
+    slice_start = np.asarray(store.minutes, dtype=np.float64) * 60
+    counts = rng.poisson(node_demand * scale)
+    counts[[i for i, b in enumerate(boarding) if not b]] = 0
+    counts[:, (slice_start < service[0]) | (slice_start >= service[1])] = 0
+    origin = np.repeat(np.repeat(np.arange(len(nodes)), counts.shape[1]), counts.ravel())
+    start = np.repeat(np.tile(slice_start, len(nodes)), counts.ravel())
+    arrival = start + rng.uniform(0, step, len(origin))
+
+    choice = (rng.random(len(origin)) * np.array([len(b) for b in boarding])[origin]).astype(np.int64)
+    options = np.array([opt for b in boarding for opt in b], dtype=np.int64).reshape(-1, 2)
+    option_start = np.concatenate([[0], np.cumsum([len(b) for b in boarding])])
+    route_of, board = options[option_start[origin] + choice].T
+
+    alight = np.empty(len(origin), dtype=np.int64)
+    for r, weights in enumerate(cumulative):
+        mine = np.flatnonzero(route_of == r)
+        if not len(mine):
+            continue
+        low, high = weights[board[mine] + 1], weights[-1]
+        alight[mine] = np.searchsorted(weights, low + rng.random(len(mine)) * (high - low), side='right') - 1
+        alight[mine] = np.clip(alight[mine], board[mine] + 1, routes[r].num_stops - 1)
+
+    queue = queue_start[route_of] + board
+    order = np.lexsort((arrival, queue))
+    offsets = np.searchsorted(queue[order], np.arange(queue_start[-1] + 1))
+    return Passengers(arrival[order], route_of[order].astype(np.int32), board[order].astype(np.int32),
+                      alight[order].astype(np.int32), offsets)
+
+
+class Simulation:
+    """
+    Discrete-event simulation of a service day. Every trip is a vehicle whose only
+    pending event is its arrival at the next stop, kept in one binary heap of
+    (time, vehicle). At a stop the vehicle lets off the passengers bound there,
+    boards the waiting queue in arrival order up to its capacity (the rest are left
+    behind for the next one), dwells in proportion to the passengers moved and runs
+    on at the speed of the current hour. Vehicle state lives in flat arrays and
+    passengers in the arrays of Passengers; a queue is a moving head into its slice.
+    Trams do not block each other, so late ones may bunch but never queue.
+    """
+
+    def __init__(self, routes, passengers, capacity=CAPACITY, service=(SERVICE_START_S, SERVICE_END_S),
+                 dwell_base_s=DWELL_BASE_S, dwell_per_passenger_s=DWELL_PER_PASSENGER_S):
+        self.routes = routes
+        self.passengers = passengers
+        self.capacity = capacity
+        self.dwell_base_s = dwell_base_s
+        self.dwell_per_passenger_s = dwell_per_passenger_s
+        self.queue_start = np.concatenate([[0], np.cumsum([route.num_stops - 1 for route in routes])]).tolist()
+
+        departures = [np.arange(service[0], service[1] + 1, route.headway, dtype=np.float64) for route in routes]
+        self.vehicle_route = np.repeat(np.arange(len(routes)), [len(d) for d in departures]).astype(np.int32)
+        self.vehicle_depart = np.concatenate(departures) if departures else np.zeros(0)
+        num_vehicles = len(self.vehicle_route)
+        max_stops = max((route.num_stops for route in routes), default=0)
+        self.onboard = np.zeros((num_vehicles, max_stops), dtype=np.int32)   # riders by the stop they leave at
+        self.load = np.zeros(num_vehicles, dtype=np.int32)
+        self.position = np.zeros(num_vehicles, dtype=np.int32)
+        self.finish = np.full(num_vehicles, np.nan)
+        self.peak_load = np.zeros(num_vehicles, dtype=np.int32)
+        self.full_departures = np.zeros(num_vehicles, dtype=np.int32)
+        self.passenger_km = np.zeros(len(routes))
+        self.events = 0
+
+    def run(self):
+        """Simulate until every vehicle has reached the end of its route; returns the number of events."""
+        pax = self.passengers
+        arrival, alight, offsets = pax.arrival, pax.alight, pax.queue_offsets
+        board_time, left_behind = pax.board_time, pax.left_behind
+        heads = offsets[:-1].copy()
+        onboard, load, position = self.onboard, self.load, self.position
+        capacity, base, per_passenger = self.capacity, self.dwell_base_s, self.dwell_per_passenger_s
+        routes, queue_start = self.routes, self.queue_start
+        running = [route.running.tolist() for route in routes]
+        segment_km = [route.segment_km.tolist() for route in routes]
+        vehicle_route = self.vehicle_route.tolist()
+
+        heap = list(zip(self.vehicle_depart.tolist(), range(len(vehicle_route))))
+        heapq.heapify(heap)
+        events = 0
+        while heap:
+            t, v = heapq.heappop(heap)
+            events += 1
+            r = vehicle_route[v]
+            p = int(position[v])
+            off = int(onboard[v, p])
+            onboard[v, p] = 0
+            riders = int(load[v]) - off
+
+            boarded = 0
+            last = routes[r].num_stops - 1
+            if p < last:
+                q = queue_start[r] + p
+                head, end = heads[q], offsets[q + 1]
+                waiting = int(np.searchsorted(arrival[head:end], t, side='right'))
+                boarded = min(waiting, capacity - riders)
+                if boarded:
+                    board_time[head:head + boarded] = t
+                    onboard[v, :last + 1] += np.bincount(alight[head:head + boarded], minlength=last + 1)
+                    heads[q] = head + boarded
+                    riders += boarded
+                if waiting > boarded:
+                    left_behind[head + boarded:head + waiting] += 1
+                    self.full_departures[v] += 1
+            load[v] = riders
+            if riders > self.peak_load[v]:
+                self.peak_load[v] = riders
+
+            if p == last:
+                self.finish[v] = t
+                continue
+            self.passenger_km[r] += riders * segment_km[r][p]
+            position[v] = p + 1
+            leave = t + base + per_passenger * (off + boarded)
+            heapq.heappush(heap, (leave + running[r][int(leave // 3600) % HOURS][p], v))
+        self.events += events
+        return events
+
+    def stats(self):
+        """Day totals, wait times and per-line load in the layout of tram_system_coverage_stats.json."""
+        pax = self.passengers
+        served = np.isfinite(pax.board_time)
+        wait = (pax.board_time[served] - pax.arrival[served]) / 60
+        place_km = np.array([route.segment_km.sum() * self.capacity * (self.vehicle_route == r).sum()
+                             for r, route in enumerate(self.routes)])
+        lines = {}
+        for r, route in enumerate(self.routes):
+            mine = self.vehicle_route == r
+            entry = lines.setdefault(route.line_id, {"line_id": route.line_id, "trips": 0, "boardings": 0,
+                                                     "peak_load": 0, "full_departures": 0,
+                                                     "passenger_km": 0.0, "place_km": 0.0})
+            entry["trips"] += int(mine.sum())
+            entry["boardings"] += int((served & (pax.route == r)).sum())
+            entry["peak_load"] = max(entry["peak_load"], int(self.peak_load[mine].max(initial=0)))
+            entry["full_departures"] += int(self.full_departures[mine].sum())
+            entry["passenger_km"] += float(self.passenger_km[r])
+            entry["place_km"] += float(place_km[r])
+        for entry in lines.values():
+            entry["occupancy_percentage"] = 100 * entry["passenger_km"] / entry["place_km"] if entry["place_km"] else 0.0
+
+        return {
+            "passengers": len(pax),
+            "boarded": int(served.sum()),
+            "not_served": int((~served).sum()),
+            "left_behind_once_or_more": int((pax.left_behind > 0).sum()),
+            "denied_boardings": int(pax.left_behind.sum()),
+            "mean_wait_min": float(wait.mean()) if len(wait) else 0.0,
+            "p95_wait_min": float(np.percentile(wait, 95)) if len(wait) else 0.0,
+            "trips": len(self.vehicle_route),
+            "passenger_km": float(self.passenger_km.sum()),
+            "occupancy_percentage": 100 * float(self.passenger_km.sum() / place_km.sum()) if place_km.sum() else 0.0,
+            "lines_summary": list(lines.values()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a service day of tram operations on a set of lines.")
+    parser.add_argument("--lines", default=LINES_FILE, help="JSON list of lines with route_nodes")
+    parser.add_argument("--headway", type=float, default=DEFAULT_HEADWAY_S / 60, help="minutes between trams")
+    parser.add_argument("--capacity", type=int, default=CAPACITY, help="passengers per tram")
+    parser.add_argument("--scale", type=float, default=PASSENGERS_PER_UNIT, help="passengers per unit of stop demand")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=STATS_FILE)
+    args = parser.parse_args()
+
+    if not DemandStore.exists():
+        print("No demand store found; run add_weight_to_stops.py first.")
+        return
+    G = load_graph(GRAPHML_PATH)
+    with open(args.lines, 'r', encoding='utf-8') as f:
+        lines = json.load(f)
+
+    start = time.perf_counter()
+    routes = build_routes(G, lines, headway_s=args.headway * 60)
+    passengers = generate_passengers(routes, DemandStore.open(), G, args.scale, np.random.default_rng(args.seed))
+    setup = time.perf_counter() - start
+
+    simulation = Simulation(routes, passengers, args.capacity)
+    start = time.perf_counter()
+    events = simulation.run()
+    elapsed = time.perf_counter() - start
+
+    stats = simulation.stats()
+    stats["events"] = events
+    stats["events_per_second"] = events / elapsed if elapsed else 0.0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    print(f"{len(routes)} routes, {stats['trips']} trips, {len(passengers):,} passengers (set up in {setup:.1f} s).")
+    print(f"Simulated the day in {elapsed:.2f} s: {events:,} events, {stats['events_per_second']:,.0f} events/s, "
+          f"{len(passengers) / elapsed:,.0f} passengers/s.")
+    print(f"Boarded {stats['boarded']:,}, not served {stats['not_served']:,}, "
+          f"left behind at least once {stats['left_behind_once_or_more']:,}; "
+          f"wait {stats['mean_wait_min']:.1f} min on average, {stats['p95_wait_min']:.1f} min at p95; "
+          f"occupancy {stats['occupancy_percentage']:.1f}%. Saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import json
+import numpy as np
+import shapely
+from scipy.sparse import csr_matrix
+from scipy.spatial import cKDTree
+
+# Web Mercator (EPSG:3857) sphere radius in metres
+WEB_MERCATOR_RADIUS = 6378137.0
+
+DEFAULT_WALK_RADIUS = 600.0  # metres
+
+
+def lonlat_to_web_mercator(lon, lat):
+    """Project lon/lat arrays (EPSG:4326) to Web Mercator (EPSG:3857) metres in one pass."""
+    lon = np.asarray(lon, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+    x = np.radians(lon) * WEB_MERCATOR_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * WEB_MERCATOR_RADIUS
+    return x, y
+
+
+def stop_lonlat(stops_gdf):
+    """Return lon/lat arrays of the stops, using centroids for non-point geometries."""
+    points = shapely.centroid(np.asarray(stops_gdf.to_crs("EPSG:4326").geometry.array))
+    return shapely.get_x(points), shapely.get_y(points)
+
+
+class StopIndex:
+    """KD-tree over projected stop locations, built once and queried in bulk."""
+
+    def __init__(self, lon, lat):
+        x, y = lonlat_to_web_mercator(lon, lat)
+        self.size = len(x)
+        self.tree = cKDTree(np.column_stack([x, y]))
+
+    @classmethod
+    def from_gdf(cls, stops_gdf):
+        return cls(*stop_lonlat(stops_gdf))
+
+    def nearest(self, lon, lat):
+        """
+        Return (stop positions, ground distances in metres) of the nearest stop for each
+        point. Web Mercator stretches distances by 1 / cos(latitude), scaled back per point.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        x, y = lonlat_to_web_mercator(lon, lat)
+        distances, indices = self.tree.query(np.column_stack([x, y]))
+        return indices, distances * np.cos(np.radians(lat))
+
+    def within(self, lon, lat, radius):
+        """
+        (point indices, stop positions, ground distances in metres) of every stop within
+        radius of each point. Web Mercator stretches distances by 1 / cos(latitude), so
+        the search radius is widened and the distances scaled back per point.
+        """
+        lat = np.asarray(lat, dtype=np.float64)
+        x, y = lonlat_to_web_mercator(lon, lat)
+        stretch = 1.0 / np.cos(np.radians(lat))
+        neighbours = self.tree.query_ball_point(np.column_stack([x, y]), r=radius * stretch)
+        counts = np.fromiter((len(n) for n in neighbours), dtype=np.int64, count=len(neighbours))
+        point_idx = np.repeat(np.arange(len(neighbours)), counts)
+        stop_idx = np.fromiter((i for n in neighbours for i in n), dtype=np.int64, count=int(counts.sum()))
+        stop_xy = self.tree.data[stop_idx]
+        distances = np.hypot(stop_xy[:, 0] - x[point_idx], stop_xy[:, 1] - y[point_idx]) / stretch[point_idx]
+        return point_idx, stop_idx, distances
+
+
+def read_hexbin_file(filename):
+    """(cell_lon, cell_lat, demand) arrays of a single hexbin_<label>.json file."""
+    with open(filename, 'r', encoding='utf-8') as f:
+        hex_data = json.load(f)
+    cells = [(cell["longitude"], cell["latitude"], cell.get("demand", 0)) for cell in hex_data
+             if cell.get("longitude") is not None and cell.get("latitude") is not None]
+    cells = np.array(cells, dtype=np.float64).reshape(-1, 3)
+    return cells[:, 0], cells[:, 1], cells[:, 2]
+
+
+class NearestStopAggregator:
+    """
+    Sum one time slice of cell demand into the nearest stops. The cell -> stop mapping is
+    kept while consecutive slices share the same cell grid, so a stream of slices costs
+    one KD-tree query plus one bincount per slice.
+    """
+
+    def __init__(self, stop_index):
+        self.stop_index = stop_index
+        self._cells = None
+        self._cell_to_stop = None
+
+    def __call__(self, cell_lon, cell_lat, demand):
+        cells = np.column_stack([cell_lon, cell_lat])
+        if self._cells is None or not np.array_equal(cells, self._cells):
+            self._cells = cells
+            self._cell_to_stop, _ = self.stop_index.nearest(cell_lon, cell_lat)
+        return np.bincount(self._cell_to_stop, weights=np.asarray(demand, dtype=np.float64),
+                           minlength=self.stop_index.size)
+
+
+# Distance-decay kernels: weight of a stop at ground distance d (metres) within radius
+DECAY_KERNELS = {
+    "uniform": lambda d, radius, bandwidth: np.ones_like(d),
+    "linear": lambda d, radius, bandwidth: 1.0 - d / radius,
+    "gaussian": lambda d, radius, bandwidth: np.exp(-0.5 * (d / bandwidth) ** 2),
+    "exponential": lambda d, radius, bandwidth: np.exp(-d / bandwidth),
+}
+
+
+def decay_weight_matrix(stop_index, cell_lon, cell_lat, radius=DEFAULT_WALK_RADIUS, kernel="linear",
+                        bandwidth=None, fallback_nearest=True):
+    """
+    Sparse stops × cells matrix spreading each cell over the stops within radius,
+    weighted by a distance-decay kernel and normalised so every column sums to 1
+    (a cell's demand is conserved). Cells with no stop in reach go to their nearest
+    stop when fallback_nearest is set and are dropped otherwise. bandwidth defaults
+    to half the radius for the gaussian and exponential kernels.
+    """
+    bandwidth = radius / 2 if bandwidth is None else bandwidth
+    n_cells = len(cell_lon)
+    cell_idx, stop_idx, distances = stop_index.within(cell_lon, cell_lat, radius)
+    weights = DECAY_KERNELS[kernel](distances, radius, bandwidth)
+
+    keep = weights > 0
+    cell_idx, stop_idx, weights = cell_idx[keep], stop_idx[keep], weights[keep]
+    totals = np.bincount(cell_idx, weights=weights, minlength=n_cells)
+    weights = weights / totals[cell_idx]
+
+    if fallback_nearest:
+        orphans = np.flatnonzero(totals == 0)
+        if len(orphans):
+            nearest, _ = stop_index.nearest(np.asarray(cell_lon)[orphans], np.asarray(cell_lat)[orphans])
+            cell_idx = np.concatenate([cell_idx, orphans])
+            stop_idx = np.concatenate([stop_idx, nearest])
+            weights = np.concatenate([weights, np.ones(len(orphans))])
+
+    return csr_matrix((weights, (stop_idx, cell_idx)), shape=(stop_index.size, n_cells))
+
+
+class DecayStopAggregator:
+    """
+    Distance-decay counterpart of NearestStopAggregator: the stops × cells kernel matrix
+    is built once per cell grid, after which a slice of stop demand is one sparse
+    mat-vec and a cells × hours matrix is one sparse mat-mat.
+    """
+
+    def __init__(self, stop_index, radius=DEFAULT_WALK_RADIUS, kernel="linear", bandwidth=None,
+                 fallback_nearest=True):
+        if kernel not in DECAY_KERNELS:
+            raise ValueError(f"Unknown kernel '{kernel}', expected one of {sorted(DECAY_KERNELS)}")
+        self.stop_index = stop_index
+        self.radius = radius
+        self.kernel = kernel
+        self.bandwidth = bandwidth
+        self.fallback_nearest = fallback_nearest
+        self._cells = None
+        self._matrix = None
+
+    def matrix(self, cell_lon, cell_lat):
+        cells = np.column_stack([cell_lon, cell_lat])
+        if self._cells is None or not np.array_equal(cells, self._cells):
+            self._cells = cells
+            self._matrix = decay_weight_matrix(self.stop_index, cell_lon, cell_lat, self.radius,
+                                               self.kernel, self.bandwidth, self.fallback_nearest)
+        return self._matrix
+
+    def __call__(self, cell_lon, cell_lat, demand):
+        return self.matrix(cell_lon, cell_lat) @ np.asarray(demand, dtype=np.float64)
+
+
+def assign_demand_to_nearest(stop_index, cell_lon, cell_lat, demand):
+    """
+    Add each cell's demand to its nearest stop for every hour at once.
+    The cell -> stop mapping is computed once and a single bincount sums the
+    cells × hours matrix into a stops × hours matrix.
+    """
+    demand = np.asarray(demand, dtype=np.float64)
+    n_hours = demand.shape[1]
+    if len(cell_lon) == 0:
+        return np.zeros((stop_index.size, n_hours))
+
+    cell_to_stop, _ = stop_index.nearest(cell_lon, cell_lat)
+    flat_index = (cell_to_stop[:, None] * n_hours + np.arange(n_hours)).ravel()
+    totals = np.bincount(flat_index, weights=demand.ravel(), minlength=stop_index.size * n_hours)
+    return totals.reshape(stop_index.size, n_hours)
@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from scipy.spatial import cKDTree
+
+# Stops further than this from any tram node (in metres) are flagged in the snapping table
+DEFAULT_MAX_SNAP_DISTANCE = 100.0
+
+
+def graph_node_arrays(G):
+    """Return (node ids, x, y) arrays for all graph nodes that have coordinates."""
+    node_ids, xs, ys = [], [], []
+    for node, data in G.nodes(data=True):
+        if 'x' in data and 'y' in data:
+            node_ids.append(node)
+            xs.append(float(data['x']))
+            ys.append(float(data['y']))
+    return np.array(node_ids, dtype=object), np.array(xs), np.array(ys)
+
+
+def snap_stops(G, stops_gdf, max_distance=DEFAULT_MAX_SNAP_DISTANCE):
+    """
+    Snap every stop to its nearest graph node with one vectorized KD-tree query.
+    Nodes and stops are projected once to a local UTM zone, so distances are in metres.
+    Non-point stop geometries are snapped by their centroid.
+
+    Returns a DataFrame indexed like stops_gdf with columns:
+    - node: id of the nearest graph node
+    - distance: snap distance in metres
+    - too_far: True when the distance exceeds max_distance
+    """
+    crs = G.graph.get('crs', stops_gdf.crs)
+    node_ids, node_x, node_y = graph_node_arrays(G)
+    if len(node_ids) == 0:
+        raise ValueError("Graph has no nodes with coordinates to snap to")
+
+    nodes = gpd.GeoSeries(gpd.points_from_xy(node_x, node_y), crs=crs)
+    local_crs = nodes.estimate_utm_crs()
+    nodes = nodes.to_crs(local_crs)
+
+    stop_points = shapely.centroid(np.asarray(stops_gdf.to_crs(crs).geometry.array))
+    stops = gpd.GeoSeries(stop_points, crs=crs).to_crs(local_crs)
+
+    tree = cKDTree(np.column_stack([nodes.x.to_numpy(), nodes.y.to_numpy()]))
+    distances, positions = tree.query(np.column_stack([stops.x.to_numpy(), stops.y.to_numpy()]))
+
+    return pd.DataFrame({
+        'node': node_ids[positions],
+        'distance': distances,
+        'too_far': distances > max_distance,
+    }, index=stops_gdf.index)
+
+
+def report_snapping(snapped, max_distance=DEFAULT_MAX_SNAP_DISTANCE):
+    """Print a short summary of the snapping table."""
+    too_far = int(snapped['too_far'].sum())
+    print(f"Snapped {len(snapped)} stops, median snap distance {snapped['distance'].median():.1f} m.")
+    if too_far:
+        print(f"Warning: {too_far} stops are further than {max_distance:.0f} m from the tram network.")
@@ -0,0 +1,46 @@
+import os
+import sys
+import math
+import networkx as nx
+import pytest
+
+# The pipeline modules live flat in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GRID = 5
+SPACING_DEG = 0.003
+ORIGIN = (19.90, 50.04)
+
+
+def tram_grid_graph(size=GRID):
+    """
+    size × size grid of two-way track shaped like the pipeline graph built in memory:
+    int OSM ids, lon/lat x/y, great-circle 'length' on every edge, a stop on every
+    node, 'pętla' termini in the corners and a 'total_demand' growing towards the middle.
+    """
+    G = nx.MultiDiGraph(crs="epsg:4326")
+    node_id = {}
+    for i in range(size):
+        for j in range(size):
+            node = 1000 + i * size + j
+            node_id[i, j] = node
+            corner = i in (0, size - 1) and j in (0, size - 1)
+            stop = {'id': node, 'name': f"Stop {i}-{j}", 'type': 'pętla' if corner else 'przystanek'}
+            centre = size - 1 - abs(i - size // 2) - abs(j - size // 2)
+            G.add_node(node, x=ORIGIN[0] + j * SPACING_DEG, y=ORIGIN[1] + i * SPACING_DEG,
+                       stops=[stop], total_demand=float(10 * centre + i + j))
+    for (i, j), u in node_id.items():
+        for di, dj in ((0, 1), (1, 0)):
+            v = node_id.get((i + di, j + dj))
+            if v is None:
+                continue
+            ux, uy, vx, vy = G.nodes[u]['x'], G.nodes[u]['y'], G.nodes[v]['x'], G.nodes[v]['y']
+            length = 6371009 * math.radians(math.hypot((vx - ux) * math.cos(math.radians(uy)), vy - uy))
+            G.add_edge(u, v, length=length)
+            G.add_edge(v, u, length=length)
+    return G
+
+
+@pytest.fixture
+def tram_graph():
+    return tram_grid_graph()
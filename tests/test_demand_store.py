@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from demand_store import DemandStore, save_demand_store
+
+OBJECT_IDS = [11, 12, 13]
+
+
+def open_store(tmp_path, step_minutes):
+    minutes = np.arange(0, 24 * 60, step_minutes)
+    demand = np.arange(len(OBJECT_IDS) * len(minutes), dtype=np.float32).reshape(len(OBJECT_IDS), -1) + 1
+    save_demand_store(OBJECT_IDS, demand, str(tmp_path), minutes)
+    return DemandStore.open(str(tmp_path)), demand
+
+
+def test_hourly_store_hours_are_its_slices(tmp_path):
+    store, demand = open_store(tmp_path, 60)
+    assert store.hours() == list(range(24))
+    np.testing.assert_array_equal(store.hour(8), demand[:, 8])
+
+
+def test_hour_sums_the_slices_inside_it(tmp_path):
+    store, demand = open_store(tmp_path, 30)
+    assert store.hours() == list(range(24))
+    np.testing.assert_allclose(store.hour(0), demand[:, 0] + demand[:, 1])
+    np.testing.assert_allclose(store.hour(23), demand[:, 46] + demand[:, 47])
+    expected = demand[:, 16].astype(np.float64) + demand[:, 17]
+    assert store.hour_by_stop(8) == dict(zip(OBJECT_IDS, expected.tolist()))
+
+
+def test_hour_splits_slices_across_hour_boundaries(tmp_path):
+    # 45-minute slices start at 00:00, 00:45, 01:30, 02:15, 03:00, ... so most hours start mid-slice
+    store, demand = open_store(tmp_path, 45)
+    assert store.hours() == list(range(24))
+    np.testing.assert_allclose(store.hour(0), demand[:, 0] + demand[:, 1] / 3)
+    np.testing.assert_allclose(store.hour(1), demand[:, 1] * 2 / 3 + demand[:, 2] * 2 / 3)
+    np.testing.assert_allclose(store.hour(2), demand[:, 2] / 3 + demand[:, 3])
+    day = np.column_stack([store.hour(hour) for hour in store.hours()]).sum(axis=1)
+    np.testing.assert_allclose(day, demand.sum(axis=1), rtol=1e-6)
+    assert store.hour_by_stop(5).keys() == set(OBJECT_IDS)
+
+
+def test_hour_outside_the_day(tmp_path):
+    store, _ = open_store(tmp_path, 45)
+    with pytest.raises(KeyError):
+        store.hour(24)
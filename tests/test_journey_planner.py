@@ -0,0 +1,49 @@
+import random
+import numpy as np
+
+from create_tram_graph_demand import generate_tram_lines
+from journey_planner import SERVICE_START_S, JourneyPlanner, line_directions
+from simulator import build_routes
+
+
+def generated_lines(G, seed=3):
+    lines = generate_tram_lines(G, num_lines=3, rng=random.Random(seed), verbose=False)
+    assert lines
+    return lines
+
+
+def test_line_directions_of_generated_lines(tram_graph):
+    lines = generated_lines(tram_graph)
+    directions = line_directions(tram_graph, lines)
+    assert {line_id for line_id, *_ in directions} == {line['line_number'] for line in lines}
+    for _, _, nodes, at, _ in directions:
+        assert all(node in tram_graph for node in nodes)
+        assert all(tram_graph.has_edge(u, v) for u, v in zip(nodes, nodes[1:]))
+        assert len(at) >= 2
+
+
+def test_planner_from_generated_lines(tram_graph):
+    lines = generated_lines(tram_graph)
+    planner = JourneyPlanner.from_plan(tram_graph, lines)
+    assert planner.routes
+    assert all(isinstance(node, int) for node in planner.stop_nodes)
+
+    # Riding a line from its first stop reaches its later stops on the timetable
+    route = planner.routes[0]
+    source = planner.stop_nodes[route.stops[0]]
+    arrival = planner.earliest_arrival(source, SERVICE_START_S)
+    assert np.all(arrival[route.stops] <= route.times[0])
+    assert np.isfinite(arrival[route.stops]).all()
+
+    # Generated lines are loops, so aim for a stop halfway round
+    k = len(route.stops) // 2
+    legs = planner.journey(source, planner.stop_nodes[route.stops[k]], SERVICE_START_S)
+    assert legs and legs[-1]['arrive'] <= route.times[0, k]
+
+
+def test_simulator_routes_from_generated_lines(tram_graph):
+    routes = build_routes(tram_graph, generated_lines(tram_graph))
+    assert routes
+    for route in routes:
+        assert all(node in tram_graph for node in route.stop_nodes)
+        assert (route.running > 0).all()
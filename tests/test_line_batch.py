@@ -0,0 +1,43 @@
+import json
+import sys
+import numpy as np
+import pytest
+
+import create_tram_graph_demand
+import line_batch
+from conftest import tram_grid_graph
+from demand_store import save_demand_store
+
+
+@pytest.fixture
+def pipeline(tmp_path, monkeypatch):
+    """Both CLIs run in tmp_path on the grid graph, with a stop demand store whose hours differ."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(create_tram_graph_demand, "build_stop_graph",
+                        lambda *args, **kwargs: (tram_grid_graph(), "grid"))
+    monkeypatch.setattr(create_tram_graph_demand.plt, "show", lambda *args, **kwargs: None)
+    stop_ids = [stop['id'] for _, data in tram_grid_graph().nodes(data=True) for stop in data['stops']]
+    rng = np.random.default_rng(0)
+    save_demand_store(stop_ids, rng.gamma(2.0, 10.0, size=(len(stop_ids), 24)))
+    return tmp_path
+
+
+def run_cli(monkeypatch, module, *args):
+    monkeypatch.setattr(sys, "argv", [module.__name__ + ".py", *args])
+    module.main()
+
+
+@pytest.mark.parametrize("hour", [8, None])
+def test_create_tram_graph_demand_replays_batch_seed(pipeline, monkeypatch, hour):
+    hour_args = ["--hour", str(hour)] if hour is not None else []
+    run_cli(monkeypatch, line_batch, "--runs", "12", "--seed", "7", "--lines", "3", "--top", "3",
+            "--workers", "1", "-o", "batch.json", *hour_args)
+    with open(pipeline / "batch.json", encoding="utf-8") as f:
+        batch = json.load(f)
+    assert batch["hour"] == hour
+
+    for kept in batch["top"]:
+        run_cli(monkeypatch, create_tram_graph_demand, "--seed", str(kept["seed"]),
+                "--lines", str(batch["num_lines"]), *hour_args)
+        with open(pipeline / "tram_lines_summary.json", encoding="utf-8") as f:
+            assert json.load(f) == kept["lines"]
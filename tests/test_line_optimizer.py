@@ -0,0 +1,38 @@
+import math
+import random
+import pytest
+
+from conftest import tram_grid_graph
+from line_optimizer import LinePlanProblem, Objective, _random_line, anneal
+
+
+def one_way_grid():
+    """The grid with its first row one-way eastbound, so loops from its corner termini must return another way."""
+    G = tram_grid_graph()
+    for u in range(1000, 1004):
+        G.remove_edge(u + 1, u)
+    return G
+
+
+def test_random_lines_are_routable():
+    problem = LinePlanProblem(one_way_grid())
+    rng = random.Random(0)
+    for terminus in problem.termini:
+        for _ in range(50):
+            line = _random_line(problem, rng, terminus)
+            assert problem.plan(line) is not None
+            assert math.isfinite(problem.length(line))
+
+
+def test_terminus_without_round_trip_waypoints_fails_clearly():
+    problem = LinePlanProblem(tram_grid_graph())
+    problem.loop_waypoints[0] = []
+    with pytest.raises(ValueError, match="cannot reach and return"):
+        _random_line(problem, random.Random(0), 0)
+
+
+def test_anneal_returns_routable_plan():
+    problem = LinePlanProblem(one_way_grid())
+    result = anneal(problem, Objective(), num_lines=3, seed=1, time_budget=0.2)
+    assert len(result["lines"]) == 3
+    assert all(problem.plan(line) is not None for line in result["lines"])
@@ -0,0 +1,58 @@
+import os
+import socket
+import pandas as pd
+import pytest
+
+from poi_download import POI_TAGS, download_pois, merge_tag_queries
+
+FIXTURE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "poi_cache")
+PLACE = "Kraków, Poland"
+
+
+@pytest.fixture(autouse=True)
+def no_network(monkeypatch):
+    def refuse(*args, **kwargs):
+        raise AssertionError("offline POI download tried to open a connection")
+    monkeypatch.setattr(socket.socket, "connect", refuse)
+    monkeypatch.setattr(socket, "create_connection", refuse)
+
+
+def offline_pois(category_tags, max_workers):
+    return download_pois(category_tags, PLACE, max_workers, offline=True, cache_folder=FIXTURE_CACHE)
+
+
+def test_merge_tag_queries_covers_every_filter():
+    for num_queries in (1, 2, 3, 100):
+        queries = merge_tag_queries(POI_TAGS, num_queries)
+        assert 1 <= len(queries) <= num_queries
+        for tags in POI_TAGS.values():
+            for key, value in tags.items():
+                query = next(q for q in queries if key in q)
+                assert set([value] if isinstance(value, str) else value) <= set(query[key])
+        keys = [key for query in queries for key in query]
+        assert len(keys) == len(set(keys))
+
+
+@pytest.mark.parametrize("max_workers", [1, 2, 4])
+def test_merged_queries_split_like_per_category_queries(max_workers):
+    merged = offline_pois(POI_TAGS, max_workers)
+    assert list(merged) == list(POI_TAGS)
+    for category, tags in POI_TAGS.items():
+        single = offline_pois({category: tags}, 1)[category]
+        if single.empty:
+            assert merged[category].empty, category
+            continue
+        pd.testing.assert_frame_equal(merged[category].sort_index().sort_index(axis=1),
+                                      single.sort_index().sort_index(axis=1), obj=category)
+
+
+def test_offline_replay_filters_by_tags_and_boundary():
+    counts = {category: len(gdf) for category, gdf in offline_pois(POI_TAGS, 2).items()}
+    assert counts["schools"] == 1  # the second school lies outside the cached boundary
+    assert counts["shops"] == 1  # shop=car is not one of the queried shop types
+    assert counts["churches"] == 2  # amenity=place_of_worship OR religion=christian
+    assert counts["museums"] == 1
+    assert counts["parks"] == 1
+    assert counts["universities"] == 1
+    assert counts["train_stations"] == 1
+    assert counts["cinemas"] == 0
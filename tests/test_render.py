@@ -0,0 +1,30 @@
+import numpy as np
+import networkx as nx
+from matplotlib.figure import Figure
+
+from render import LineMapScene
+
+
+def test_line_map_scene_keeps_int_node_ids(tram_graph):
+    lines = [
+        {'line_number': 1, 'route': [1000, 1001, 1002, 1007, 1012], 'start_stop': 'Stop 0-0', 'length_km': 1.3},
+        {'line_number': 2, 'route_nodes': [1024, 1019, 1018], 'start_stop': 'Stop 4-4', 'length_km': 0.7},
+    ]
+    scene = LineMapScene.from_graph(tram_graph, lines)
+
+    assert scene.line_segments.shape == (6, 2, 2)
+    assert scene.segment_colors == ['red'] * 4 + ['blue'] * 2
+    node = tram_graph.nodes[1000]
+    np.testing.assert_allclose(scene.termini_xy[0], (node['x'], node['y']))
+    assert scene.stop_xy.shape == (len(tram_graph), 2)
+
+    fig = Figure()
+    scene.draw(fig, fig.add_subplot())
+
+
+def test_line_map_scene_maps_json_ids_onto_str_graph(tram_graph):
+    # Graphs read back from GraphML key nodes by str, line JSON files keep int ids
+    G = nx.relabel_nodes(tram_graph, str)
+    scene = LineMapScene.from_graph(G, [{'line_id': 7, 'route_nodes': [1000, 1005, 1010]}])
+    assert scene.line_segments.shape == (2, 2, 2)
+    assert scene.line_labels == ['P7: Unknown']
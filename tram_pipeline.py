@@ -0,0 +1,227 @@
+import os
+import json
+import pickle
+import hashlib
+import osmnx as ox
+import geopandas as gpd
+from shapely.geometry import LineString
+from graph_contraction import contract_graph
+from stop_snapping import DEFAULT_MAX_SNAP_DISTANCE, snap_stops, report_snapping
+
+PLACE_NAME = "Kraków, Poland"
+TRAM_FILTER = '["railway"~"tram"]'
+STOPS_GEOJSON = "Przystanki_Komunikacji_Miejskiej_w_Krakowie_6ab29dbb62854448803c0125c291aca3.geojson"
+BUILD_CACHE_DIR = "build_cache"
+
+# Bump when a stage's code changes so that stale cached outputs are not reused
+PIPELINE_VERSION = 1
+
+
+def file_checksum(path):
+    """SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stage_key(stage, inputs):
+    """Content address of a stage: hash of its name, the pipeline version and all of its inputs."""
+    payload = json.dumps({"stage": stage, "version": PIPELINE_VERSION, "inputs": inputs},
+                         sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class Stage:
+    """
+    A named pipeline stage whose output is cached on disk under the hash of its inputs.
+    The key is known without running anything, so downstream stages can be looked up
+    first and upstream outputs are only loaded or built when actually needed.
+    """
+
+    def __init__(self, name, inputs, build, cache_dir=BUILD_CACHE_DIR):
+        self.name = name
+        self.build = build
+        self.key = stage_key(name, inputs)
+        self.path = os.path.join(cache_dir, f"{name}-{self.key}.pickle")
+        self._output = None
+        self._done = False
+
+    def output(self):
+        if self._done:
+            return self._output
+        if os.path.exists(self.path):
+            print(f"[cache] {self.name}: reusing {self.path}")
+            with open(self.path, 'rb') as f:
+                self._output = pickle.load(f)
+        else:
+            print(f"[cache] {self.name}: building...")
+            self._output = self.build()
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(self._output, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+        self._done = True
+        return self._output
+
+
+# ---------------------------
+# Stages
+# ---------------------------
+def topology_stage(place_name=PLACE_NAME, custom_filter=TRAM_FILTER, cache_dir=BUILD_CACHE_DIR):
+    """Stage 'topology': the raw, unsimplified tram graph of a place."""
+    def build():
+        print(f"Loading tram graph for {place_name} with filter: {custom_filter}...")
+        return ox.graph_from_place(place_name, simplify=False, custom_filter=custom_filter)
+
+    return Stage("topology", {"place": place_name, "filter": custom_filter}, build, cache_dir)
+
+
+def load_topology(place_name=PLACE_NAME, custom_filter=TRAM_FILTER, cache_dir=BUILD_CACHE_DIR):
+    """Return (graph, key) of the topology stage."""
+    stage = topology_stage(place_name, custom_filter, cache_dir)
+    return stage.output(), stage.key
+
+
+def attach_stops(G, stops_gdf, max_distance=DEFAULT_MAX_SNAP_DISTANCE):
+    """Snap stops to the graph and add them to each node's 'stops' list as {id, name, type}."""
+    snapped = snap_stops(G, stops_gdf, max_distance)
+    report_snapping(snapped, max_distance)
+
+    for stop, nearest_node in zip(stops_gdf.itertuples(index=False), snapped['node']):
+        stop_data = {
+            "id": stop.OBJECTID,
+            "name": stop.Nazwa_przystanku_nr,
+            "type": stop.Rodzaj_przystanku
+        }
+        G.nodes[nearest_node].setdefault('stops', []).append(stop_data)
+    return snapped
+
+
+def snap_stage(topology, stops_file=STOPS_GEOJSON, max_distance=DEFAULT_MAX_SNAP_DISTANCE,
+               cache_dir=BUILD_CACHE_DIR):
+    """Stage 'snapping': copy of the topology with the stop file's stops attached to nodes."""
+    def build():
+        G = topology.output().copy()
+        if os.path.exists(stops_file):
+            stops_gdf = gpd.read_file(stops_file).to_crs(G.graph['crs'])
+            print(f"Loaded {len(stops_gdf)} tram stops from {stops_file}.")
+            attach_stops(G, stops_gdf, max_distance)
+        else:
+            print(f"Warning: GeoJSON file '{stops_file}' not found. Skipping tram stop processing.")
+        return G
+
+    inputs = {
+        "topology": topology.key,
+        "stops_file": os.path.basename(stops_file),
+        "stops_checksum": file_checksum(stops_file) if os.path.exists(stops_file) else None,
+        "max_distance": max_distance,
+    }
+    return Stage("snapping", inputs, build, cache_dir)
+
+
+def crossings_stage(upstream, cache_dir=BUILD_CACHE_DIR):
+    """Stage 'crossings': railway_crossing nodes removed and their ways reconnected."""
+    return Stage("crossings", {"upstream": upstream.key},
+                 lambda: remove_railway_crossings(upstream.output().copy()), cache_dir)
+
+
+def contraction_stage(upstream, cache_dir=BUILD_CACHE_DIR):
+    """Stage 'contraction': pass-through track nodes collapsed, stops and switches kept."""
+    return Stage("contraction", {"upstream": upstream.key},
+                 lambda: contract_graph(upstream.output()), cache_dir)
+
+
+def build_stop_graph(place_name=PLACE_NAME, custom_filter=TRAM_FILTER, stops_file=STOPS_GEOJSON,
+                     max_distance=DEFAULT_MAX_SNAP_DISTANCE, cache_dir=BUILD_CACHE_DIR, contracted=False):
+    """
+    Run topology -> snapping -> crossings (-> contraction when contracted=True)
+    and return (graph, key of the last stage).
+    """
+    topology = topology_stage(place_name, custom_filter, cache_dir)
+    snapping = snap_stage(topology, stops_file, max_distance, cache_dir)
+    last = crossings_stage(snapping, cache_dir)
+    if contracted:
+        last = contraction_stage(last, cache_dir)
+    return last.output(), last.key
+
+
+def attach_demand(G, stop_demand):
+    """
+    Copy of G with each stop's demand taken from {OBJECTID: demand}, plus each node's
+    total_demand and a has_petla flag on terminus nodes. Not cached: it is cheap and
+    changes with every hour.
+    """
+    G = G.copy()
+    for node, data in G.nodes(data=True):
+        if 'stops' not in data:
+            continue
+        data['stops'] = [dict(stop, demand=stop_demand.get(stop['id'], 0.0)) for stop in data['stops']]
+        data['total_demand'] = sum(stop['demand'] for stop in data['stops'])
+        if any(stop.get('type') == 'pętla' for stop in data['stops']):
+            data['has_petla'] = True
+    return G
+
+
+# ---------------------------
+# Railway crossings
+# ---------------------------
+def remove_railway_crossings(G):
+    """Flag switches and crossings, then remove railway_crossing nodes and reconnect their ways."""
+    nodes_to_remove = []
+    for node_id, data in G.nodes(data=True):
+        if 'railway' in data and 'railway_crossing' in str(data['railway']):
+            nodes_to_remove.append(node_id)
+            data['is_railway_crossing'] = True
+            data['is_railway_switch'] = False
+        elif 'railway' in data and data['railway'] == 'switch':
+            data['is_railway_switch'] = True
+            data['is_railway_crossing'] = False
+        else:
+            data['is_railway_crossing'] = False
+            data['is_railway_switch'] = False
+
+    for node_id in nodes_to_remove:
+        if node_id not in G:
+            continue
+
+        in_edges = list(G.in_edges(node_id, data=True, keys=True))
+        out_edges = list(G.out_edges(node_id, data=True, keys=True))
+        connections_to_add = []
+
+        for u, _, k_in, data_in in in_edges:
+            for _, v, k_out, data_out in out_edges:
+                osmid_in = data_in.get('osmid', [])
+                osmid_out = data_out.get('osmid', [])
+
+                if not isinstance(osmid_in, list):
+                    osmid_in = [osmid_in]
+                if not isinstance(osmid_out, list):
+                    osmid_out = [osmid_out]
+
+                if set(osmid_in) & set(osmid_out):
+                    combined_attrs = data_in.copy()
+                    if 'length' in data_out:
+                        combined_attrs['length'] = combined_attrs.get('length', 0) + data_out['length']
+                    if 'geometry' in data_in and 'geometry' in data_out:
+                        if (isinstance(data_in['geometry'], LineString) and
+                                isinstance(data_out['geometry'], LineString) and
+                                data_in['geometry'].coords[-1] == data_out['geometry'].coords[0]):
+                            combined_attrs['geometry'] = LineString(
+                                list(data_in['geometry'].coords) + list(data_out['geometry'].coords)[1:]
+                            )
+                        else:
+                            print(f"Warning: Geometries for node {node_id} could not be merged. Geometry attribute removed.")
+                            combined_attrs.pop('geometry', None)
+
+                    connections_to_add.append((u, v, combined_attrs))
+
+        for u, v, attrs in connections_to_add:
+            G.add_edge(u, v, **attrs)
+
+        G.remove_node(node_id)
+
+    print(f"Removed {len(nodes_to_remove)} railway crossing nodes and reconnected their ways.")
+    return G
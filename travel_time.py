@@ -0,0 +1,352 @@
+import math
+import time
+import heapq
+import random
+import argparse
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from distance_matrix import GRAPHML_PATH
+from graph_contraction import contract_graph
+from graph_store import load_graph, parse_maxspeed
+from routing import NO_PREDECESSOR, RoutingSession
+
+EARTH_RADIUS_M = 6371009
+HOURS = 24
+DEFAULT_SPEED_KMH = 40.0       # edges without a usable maxspeed tag
+MIN_SPEED_KMH = 10.0           # floor for tight curves and noisy geometry
+LATERAL_ACCELERATION = 0.7     # m/s², comfort limit that sets the speed through a curve
+SWITCH_PENALTY_S = 4.0
+CROSSING_PENALTIES_S = {
+    'tram_crossing': 3.0,          # tram track crossing tram track
+    'tram_level_crossing': 6.0,    # tram track crossing a road
+    'railway_crossing': 3.0,
+    'crossing': 6.0,
+}
+DWELL_TIME_S = 20.0
+
+# Multipliers per hour of the day: running speed (street traffic at the peaks) and dwell (boarding volume)
+SPEED_PROFILE = (1.0, 1.0, 1.0, 1.0, 1.0, 0.98, 0.93, 0.85, 0.85, 0.9, 0.92, 0.92,
+                 0.92, 0.92, 0.9, 0.85, 0.82, 0.82, 0.88, 0.92, 0.95, 0.97, 1.0, 1.0)
+DWELL_PROFILE = (0.6, 0.6, 0.6, 0.6, 0.6, 0.8, 1.1, 1.5, 1.4, 1.1, 1.0, 1.0,
+                 1.0, 1.0, 1.1, 1.4, 1.5, 1.4, 1.2, 1.0, 0.9, 0.8, 0.7, 0.7)
+
+
+def _planar(points, lat0):
+    """Lon/lat points as metres on a plane tangent at latitude lat0 (plenty for a city)."""
+    points = np.radians(np.asarray(points, dtype=np.float64))
+    return np.column_stack([points[:, 0] * math.cos(lat0), points[:, 1]]) * EARTH_RADIUS_M
+
+
+def curve_speeds(points, lateral_acceleration=LATERAL_ACCELERATION):
+    """
+    Speed limit (m/s) at every vertex of a planar polyline from the radius of the
+    circle through the vertex and its two neighbours; infinite at the ends and on
+    straight or degenerate stretches.
+    """
+    speeds = np.full(len(points), np.inf)
+    if len(points) < 3:
+        return speeds
+    a, b, c = points[:-2], points[1:-1], points[2:]
+    ab = np.hypot(*(b - a).T)
+    bc = np.hypot(*(c - b).T)
+    ca = np.hypot(*(a - c).T)
+    cross = np.abs((b - a)[:, 0] * (c - a)[:, 1] - (b - a)[:, 1] * (c - a)[:, 0])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        radius = ab * bc * ca / (2 * cross)
+    speeds[1:-1] = np.where(np.isnan(radius), np.inf, np.sqrt(lateral_acceleration * radius))
+    return speeds
+
+
+def node_penalty(data, switch_penalty_s=SWITCH_PENALTY_S, crossing_penalties_s=CROSSING_PENALTIES_S):
+    """Seconds lost passing a node: the slow run over a switch or a crossing."""
+    railway = str(data.get('railway', ''))
+    if data.get('is_railway_switch') or railway == 'switch':
+        return switch_penalty_s
+    return crossing_penalties_s.get(railway, 0.0)
+
+
+def edge_components(G, dwell_s=DWELL_TIME_S, switch_penalty_s=SWITCH_PENALTY_S,
+                    crossing_penalties_s=CROSSING_PENALTIES_S, default_speed_kmh=DEFAULT_SPEED_KMH,
+                    lateral_acceleration=LATERAL_ACCELERATION):
+    """
+    {(u, v, key): (running, fixed, dwell)} seconds for every edge of G.
+
+    running is the time at the maxspeed of the edge, slowed to the curve speed
+    wherever the geometry (or the turn through a pass-through end node) bends.
+    fixed is the penalty of the node the edge leaves (switch or crossing) and
+    dwell the stop time at it, so a path pays for its first node but not its last.
+    """
+    lat0 = math.radians(np.mean([data['y'] for _, data in G.nodes(data=True)])) if len(G) else 0.0
+    min_speed = MIN_SPEED_KMH / 3.6
+    neighbours = {node: set(G.predecessors(node)) | set(G.successors(node)) for node in G.nodes}
+
+    def other_side(node, away_from):
+        # The turn through a node is only defined when the track just passes through it
+        others = neighbours[node] - {away_from}
+        if len(neighbours[node]) != 2 or len(others) != 1:
+            return []
+        other = next(iter(others))
+        return [(G.nodes[other]['x'], G.nodes[other]['y'])]
+
+    components = {}
+    for u, v, k, data in G.edges(keys=True, data=True):
+        geometry = data.get('geometry')
+        if geometry is not None and hasattr(geometry, 'coords'):
+            coords = list(geometry.coords)
+        else:
+            coords = [(G.nodes[u]['x'], G.nodes[u]['y']), (G.nodes[v]['x'], G.nodes[v]['y'])]
+        before, after = other_side(u, v), other_side(v, u)
+        points = _planar(before + coords + after, lat0)
+
+        speed = parse_maxspeed(data.get('maxspeed')) or default_speed_kmh
+        vmax = max(speed / 3.6, min_speed)
+        limits = np.clip(curve_speeds(points, lateral_acceleration), min_speed, vmax)
+        start = len(before)
+        limits = limits[start:start + len(coords)]
+        pieces = np.hypot(*np.diff(points[start:start + len(coords)], axis=0).T)
+
+        # Geometry gives the shape; the edge's own length stays the distance
+        length = float(data.get('length', 0.0))
+        if length <= 0:
+            running = 0.0
+        elif pieces.sum() <= 0:
+            running = length / vmax
+        else:
+            running = float((pieces * (length / pieces.sum()) / np.minimum(limits[:-1], limits[1:])).sum())
+
+        fixed = node_penalty(G.nodes[u], switch_penalty_s, crossing_penalties_s)
+        dwell = dwell_s if G.nodes[u].get('stops') else 0.0
+        components[(u, v, k)] = (running, fixed, dwell)
+    return components
+
+
+def _contracted_components(H, original, **kwargs):
+    """Components of a contracted graph summed from the original edges each merged edge stands for."""
+    pieces = {}
+    for (u, v, _), values in edge_components(original, **kwargs).items():
+        if (u, v) not in pieces or values[0] < pieces[(u, v)][0]:
+            pieces[(u, v)] = values
+    direct = None
+    components = {}
+    for u, v, k, data in H.edges(keys=True, data=True):
+        path = data.get('osm_nodes', [u, v])
+        parts = [pieces.get(edge) for edge in zip(path, path[1:])]
+        if all(part is not None for part in parts):
+            components[(u, v, k)] = tuple(map(sum, zip(*parts)))
+        else:
+            if direct is None:
+                direct = edge_components(H, **kwargs)
+            components[(u, v, k)] = direct[(u, v, k)]
+    return components
+
+
+class TravelTimeModel:
+    """
+    Edge travel times in seconds for every hour of the day.
+
+    Each edge has a running time, a fixed penalty (switch or crossing) and a dwell
+    time; hour h costs running / speed_profile[h] + fixed + dwell * dwell_profile[h].
+    All 24 hours are precomputed into one (24, edges) array aligned with a single
+    CSR structure, parallel edges reduced to the fastest per hour, so switching the
+    hour swaps a weight array and never touches graph attributes.
+    """
+
+    def __init__(self, G, sources, targets, running, fixed, dwell,
+                 speed_profile=SPEED_PROFILE, dwell_profile=DWELL_PROFILE):
+        self.G = G
+        self.nodes = list(G.nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        speed_profile = np.asarray(speed_profile, dtype=np.float64)
+        dwell_profile = np.asarray(dwell_profile, dtype=np.float64)
+        if speed_profile.shape != (HOURS,) or dwell_profile.shape != (HOURS,):
+            raise ValueError(f"Profiles must have one value per hour ({HOURS})")
+        self.speed_profile = speed_profile
+        self.dwell_profile = dwell_profile
+
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        costs = (np.asarray(running, dtype=np.float64)[None, :] / speed_profile[:, None] +
+                 np.asarray(fixed, dtype=np.float64)[None, :] +
+                 np.asarray(dwell, dtype=np.float64)[None, :] * dwell_profile[:, None])
+        order = np.lexsort((targets, sources))
+        sources, targets = sources[order], targets[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+        starts = np.flatnonzero(first)
+        self.hour_weights = (np.minimum.reduceat(costs[:, order], starts, axis=1) if len(starts)
+                             else np.zeros((HOURS, 0)))
+        self.indices = targets[starts].astype(np.int32)
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(sources[starts], minlength=len(self.nodes)))])
+        self._matrices = {}
+        self._lists = None
+        self._pair_index = None
+
+    @classmethod
+    def from_graph(cls, G, original=None, speed_profile=SPEED_PROFILE, dwell_profile=DWELL_PROFILE, **kwargs):
+        """
+        Model over G. For a contracted graph pass the original as well: merged edges
+        then add up the maxspeeds, curves and crossings of the track they replace
+        instead of using the first original edge's tags. Other keyword arguments go
+        to edge_components (dwell_s, switch_penalty_s, ...).
+        """
+        components = (_contracted_components(G, original, **kwargs) if original is not None
+                      else edge_components(G, **kwargs))
+        index = {node: i for i, node in enumerate(G.nodes)}
+        keys = list(components)
+        running, fixed, dwell = zip(*components.values()) if keys else ((), (), ())
+        return cls(G, [index[u] for u, _, _ in keys], [index[v] for _, v, _ in keys],
+                   running, fixed, dwell, speed_profile, dwell_profile)
+
+    def weights(self, hour):
+        """Travel time in seconds of every edge at an hour, aligned with indptr / indices."""
+        return self.hour_weights[hour % HOURS]
+
+    def matrix(self, hour):
+        """Sparse travel-time matrix of an hour, for scipy's csgraph or RoutingSession."""
+        hour %= HOURS
+        if hour not in self._matrices:
+            n = len(self.nodes)
+            self._matrices[hour] = csr_matrix((self.hour_weights[hour], self.indices, self.indptr), shape=(n, n))
+        return self._matrices[hour]
+
+    def session(self, hour, max_trees=256):
+        """RoutingSession whose paths are the fastest at an hour; move it to another with reweight."""
+        return RoutingSession(self.G, weight='travel_time', max_trees=max_trees, matrix=self.matrix(hour))
+
+    def route_times(self, route):
+        """
+        (24, len(route)) travel time in seconds from the first node to every node of a
+        route, one row per hour. Consecutive nodes without an edge between them (a
+        route reversed over one-way track) are bridged by that hour's fastest path.
+        """
+        if self._pair_index is None:
+            sources = np.repeat(np.arange(len(self.nodes)), np.diff(self.indptr))
+            self._pair_index = {pair: j for j, pair in enumerate(zip(sources.tolist(), self.indices.tolist()))}
+        positions = [self.index[node] for node in route]
+        steps = np.zeros((HOURS, len(positions)))
+        for i, pair in enumerate(zip(positions, positions[1:])):
+            j = self._pair_index.get(pair)
+            if j is not None:
+                steps[:, i + 1] = self.hour_weights[:, j]
+            else:
+                steps[:, i + 1] = [dijkstra(self.matrix(hour), indices=pair[0])[pair[1]] for hour in range(HOURS)]
+        return np.cumsum(steps, axis=1)
+
+    # --- time-dependent routing ---
+
+    def earliest_arrival(self, source, depart, target=None):
+        """
+        Time-dependent Dijkstra from source leaving at depart (seconds since
+        midnight). An edge entered at time t is run at the speed of each hour it
+        spans, so a later departure never arrives earlier and the search stays
+        exact. Returns (arrival, predecessors) arrays over the nodes; with a target
+        the search stops once it is settled.
+        """
+        if self._lists is None:
+            self._lists = (self.hour_weights.tolist(), self.indptr.tolist(), self.indices.tolist())
+        costs, indptr, indices = self._lists
+        s = self.index[source]
+        t_index = self.index[target] if target is not None else -1
+        arrival = [math.inf] * len(self.nodes)
+        pred = [NO_PREDECESSOR] * len(self.nodes)
+        arrival[s] = depart
+        heap = [(depart, s)]
+        while heap:
+            t, u = heapq.heappop(heap)
+            if t > arrival[u]:
+                continue
+            if u == t_index:
+                break
+            for e in range(indptr[u], indptr[u + 1]):
+                # Advance through the edge hour by hour at that hour's rate
+                at, hour, remaining = t, int(t // 3600), 1.0
+                while True:
+                    cost = costs[hour % HOURS][e]
+                    end = (hour + 1) * 3600.0
+                    if at + remaining * cost <= end:
+                        at += remaining * cost
+                        break
+                    remaining -= (end - at) / cost
+                    at, hour = end, hour + 1
+                v = indices[e]
+                if at < arrival[v]:
+                    arrival[v] = at
+                    pred[v] = u
+                    heapq.heappush(heap, (at, v))
+        return np.array(arrival), np.array(pred)
+
+    def path(self, source, target, depart):
+        """(node list, arrival time) of the fastest journey leaving at depart, or None when unreachable."""
+        arrival, pred = self.earliest_arrival(source, depart, target)
+        node = self.index[target]
+        if not np.isfinite(arrival[node]):
+            return None
+        src = self.index[source]
+        path = [node]
+        while node != src:
+            node = pred[node]
+            path.append(node)
+        return [self.nodes[i] for i in reversed(path)], float(arrival[self.index[target]])
+
+
+def parse_clock(value):
+    """'HH:MM' as seconds since midnight."""
+    hours, minutes = value.split(':')
+    return int(hours) * 3600 + int(minutes) * 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Travel-time edge weights and time-dependent routing.")
+    parser.add_argument("--depart", default="07:50", help="departure time HH:MM for the time-dependent queries")
+    parser.add_argument("--queries", type=int, default=200, help="random stop-to-stop queries to time")
+    parser.add_argument("--dwell", type=float, default=DWELL_TIME_S, help="seconds at every stop node")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    G = load_graph(GRAPHML_PATH)
+    R = contract_graph(G)
+    start = time.perf_counter()
+    model = TravelTimeModel.from_graph(R, original=G, dwell_s=args.dwell)
+    print(f"Travel times for {model.hour_weights.shape[1]} edges × {HOURS} hours built in "
+          f"{time.perf_counter() - start:.2f} s.")
+
+    session = model.session(0)
+    start = time.perf_counter()
+    for hour in range(HOURS):
+        session.reweight(model.matrix(hour))
+    print(f"Switching the hour: {(time.perf_counter() - start) / HOURS * 1e6:.0f} µs.")
+
+    rng = random.Random(args.seed)
+    stops = [node for node, data in R.nodes(data=True) if data.get('stops')]
+    pairs = [tuple(rng.sample(stops, 2)) for _ in range(args.queries)]
+    depart = parse_clock(args.depart)
+    hour = depart // 3600
+
+    start = time.perf_counter()
+    static = [dijkstra(model.matrix(hour), indices=model.index[s], return_predecessors=False)[model.index[t]]
+              for s, t in pairs]
+    static_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    dynamic = [model.earliest_arrival(s, depart, t)[0][model.index[t]] - depart for s, t in pairs]
+    dynamic_elapsed = time.perf_counter() - start
+
+    found = [(a, b) for a, b in zip(static, dynamic) if np.isfinite(a)]
+    if not found:
+        print("No reachable stop pairs.")
+        return
+    static_minutes = np.mean([a for a, _ in found]) / 60
+    dynamic_minutes = np.mean([b for _, b in found]) / 60
+    print(f"{len(pairs)} queries leaving at {args.depart}: static hour-{hour:02d} weights "
+          f"{static_elapsed / len(pairs) * 1000:.2f} ms/query (mean {static_minutes:.1f} min), "
+          f"time-dependent {dynamic_elapsed / len(pairs) * 1000:.2f} ms/query (mean {dynamic_minutes:.1f} min).")
+    sources = sorted({model.index[s] for s, _ in pairs})
+    for h in (3, 8, 12, 17):
+        times = dijkstra(model.matrix(h), indices=sources)
+        row = {source: i for i, source in enumerate(sources)}
+        mean = np.mean([times[row[model.index[s]], model.index[t]] for s, t in pairs
+                        if np.isfinite(times[row[model.index[s]], model.index[t]])])
+        print(f"  hour {h:02d}: mean journey {mean / 60:.1f} min")
+
+if __name__ == '__main__':
+    main()